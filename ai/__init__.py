@@ -0,0 +1,3 @@
+from ai.policies import DIRECTIONS, POLICIES, load_policy
+from ai.expectimax import ExpectimaxPlayer
+from ai.mcts import MCTSPlayer
@@ -0,0 +1,196 @@
+"""
+An expectimax player for the three-four-three game.
+"""
+
+import time
+
+from engine import PackedBoard
+from engine.lookup import search_board
+from engine.symmetry import canonical
+
+from .policies import DIRECTIONS
+
+# Weights of the heuristic value of a board at the search horizon, in
+# points of score.
+EMPTY_WEIGHT = 20
+PAIR_WEIGHT = 5
+
+# Value of a board on which no more moves can be made.
+LOSS_VALUE = -100000
+
+class OutOfTime(Exception):
+    """
+    Raised inside a search when its time budget has run out.
+    """
+
+def evaluate(cells, size):
+    """
+    Returns the heuristic value of a packed board: boards with more empty
+    cells, and more like tiles next to each other, are better.
+
+    Args:
+        cells (bytes): Exponents of the board, as in PackedBoard.cells.
+        size (int): The size of the board's side.
+    """
+    pairs = 0
+    for k in range(0, size * size, size):
+        row = cells[k:k + size]
+        pairs += sum([a == b != 0 for a, b in zip(row, row[1:])])
+    pairs += sum([a == b != 0 for a, b in zip(cells, cells[size:])])
+    return EMPTY_WEIGHT * cells.count(0) + PAIR_WEIGHT * pairs
+
+class ExpectimaxPlayer:
+    """
+    Picks moves by searching the game tree to a fixed depth, averaging
+    over the tiles that may spawn after each move as Board.insert_random
+    does: a 3 in nine cases out of ten, else a 9, in any empty cell.
+
+    Boards are searched as packed exponents, so the base tile must be 3.
+    Values of searched positions are kept in a transposition table keyed
+    by their canonical cells (see engine.symmetry), so that rotations and
+    reflections of a position share one entry, and reused across moves;
+    once the table is full, the oldest entries are dropped.
+
+    ExpectimaxPlayer is a policy: calling it with a game returns the best
+    move found.
+    """
+
+    def __init__(self, depth=3, time_budget=None, table_size=1 << 18):
+        """
+        Initializes a new ExpectimaxPlayer.
+
+        Args:
+            depth (int): Largest number of player moves to search ahead.
+            time_budget (float, optional): Seconds to spend on a move. The
+                search is deepened one move at a time, and stops when the
+                budget runs out; a search of depth 1 is always finished.
+                If None, always search to the full depth.
+            table_size (int): Largest number of positions to keep in the
+                transposition table.
+        """
+        self.depth = depth
+        self.time_budget = time_budget
+        self.table_size = table_size
+        self.table = {}
+        self.boards = {}
+        self.deadline = None
+        self.size = None
+        self.board = None
+
+    def __call__(self, game):
+        """
+        Returns self.best_move(game).
+        """
+        return self.best_move(game)
+
+    def best_move(self, game):
+        """
+        Returns the direction the search judges best for a game, one of
+        "up", "down", "left", or "right".
+
+        Args:
+            game (Game): A game that isn't over yet.
+        """
+        self.size = game.size
+        self.board = self.search_board(game.size, game.initial_value)
+        cells = PackedBoard.from_values(
+            game.size, game.initial_value, game.peek_board()).cells
+
+        self.deadline = None
+        best = DIRECTIONS[0]
+        start = time.perf_counter()
+        for depth in range(1, self.depth + 1):
+            try:
+                best = self.search_root(cells, depth)
+            except OutOfTime:
+                break
+            if self.time_budget is not None:
+                self.deadline = start + self.time_budget
+        return best
+
+    def search_board(self, size, initial_value):
+        """
+        Returns the board used to make moves during the search, one per
+        board size; see engine.lookup.search_board.
+        """
+        if size not in self.boards:
+            self.boards[size] = search_board(size, initial_value)
+        return self.boards[size]
+
+    def moves(self, cells):
+        """
+        Returns the legal moves of a packed board, as a list of tuples of
+        (1) the direction of the move, (2) the new cells, (3) the score
+        gained, and (4) whether any tile changed position, i.e. whether a
+        tile will spawn.
+        """
+        self.board.cells = cells
+        return [(direction.name.lower(), board.cells, report["score"],
+                 report["moves_made"])
+                for direction, (board, report)
+                in self.board.successors().items() if report["legal"]]
+
+    def search_root(self, cells, depth):
+        """
+        Returns the best direction to move a packed board towards, after
+        searching depth moves ahead.
+        """
+        best_value = None
+        best = DIRECTIONS[0]
+        for direction, new, score, spawns in self.moves(cells):
+            value = score + self.after_move(new, spawns, depth)
+            if best_value is None or value > best_value:
+                best_value = value
+                best = direction
+        return best
+
+    def after_move(self, cells, spawns, depth):
+        """
+        Returns the expected value of a packed board right after a move,
+        with depth moves left to search, counting the move just made.
+        """
+        if depth == 1:
+            return evaluate(cells, self.size)
+        if not spawns:
+            return self.max_value(cells, depth - 1)
+        empty = [k for k, e in enumerate(cells) if e == 0]
+        total = 0
+        for k in empty:
+            total += 0.9 * self.max_value(
+                cells[:k] + b"\x01" + cells[k + 1:], depth - 1)
+            total += 0.1 * self.max_value(
+                cells[:k] + b"\x02" + cells[k + 1:], depth - 1)
+        return total / len(empty)
+
+    def max_value(self, cells, depth):
+        """
+        Returns the value of a packed board on which the player is about to
+        move, with depth moves left to search.
+        """
+        key = canonical(cells, self.size)[0]
+        entry = self.table.get(key)
+        if entry is not None and entry[0] >= depth:
+            return entry[1]
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise OutOfTime
+
+        best_value = LOSS_VALUE
+        for direction, new, score, spawns in self.moves(cells):
+            best_value = max(best_value,
+                             score + self.after_move(new, spawns, depth))
+
+        if len(self.table) >= self.table_size:
+            del self.table[next(iter(self.table))]
+        self.table[key] = (depth, best_value)
+        return best_value
+
+_player = None
+
+def expectimax_policy(game):
+    """
+    Policy searching two moves ahead with a shared ExpectimaxPlayer.
+    """
+    global _player
+    if _player is None:
+        _player = ExpectimaxPlayer(depth=2)
+    return _player(game)
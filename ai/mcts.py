@@ -0,0 +1,242 @@
+"""
+A Monte Carlo tree search player for the three-four-three game.
+"""
+
+import math
+import random
+
+from engine import Game
+from engine.lookup import preload
+
+from .policies import DIRECTIONS
+
+class Node:
+    """
+    A node of an open-loop search tree: the statistics of every playout
+    that made the same sequence of moves from the root, whatever tiles
+    spawned along the way.
+    """
+
+    def __init__(self):
+        self.visits = 0
+        self.total = 0
+        self.children = {}
+
+def legal_moves(game):
+    """
+    Returns the directions that would change the board of a game.
+    """
+    return [direction for direction, (board, report)
+            in game.successors().items() if report["legal"]]
+
+def select(node, legal, exploration, scale):
+    """
+    Returns the move to make from a node with UCB1, trying every legal
+    move once first. New children are added to the node as needed.
+    """
+    untried = [direction for direction in legal
+               if direction not in node.children]
+    if untried:
+        direction = random.choice(untried)
+        node.children[direction] = Node()
+        return direction
+    log_visits = math.log(node.visits)
+    def bound(direction):
+        child = node.children[direction]
+        return child.total / (child.visits * scale) + \
+            exploration * math.sqrt(log_visits / child.visits)
+    return max(legal, key=bound)
+
+def run_search(game_state, iterations, rollout_depth, exploration, seed,
+               backend="packed"):
+    """
+    Runs a search from a game state in this process, leaving the state of
+    the random module as it was.
+
+    Args:
+        game_state (dict): State of the game, as returned by
+            Game.game_state().
+        iterations (int): Number of playouts.
+        rollout_depth (int): Largest number of random moves made after a
+            playout leaves the tree.
+        exploration (float): Exploration constant of UCB1.
+        seed (int, optional): Seed of the playouts.
+        backend (str): Board backend of the playouts; see Game.
+
+    Returns:
+        A dictionary mapping each move tried from the root to its number
+        of visits and the total score gained by its playouts.
+    """
+    random_state = random.getstate()
+    random.seed(seed)
+    try:
+        size = game_state["size"]
+        root_game = Game(size, game_state["initial_value"], 0,
+                         game_state["win_condition"], game_state=game_state,
+                         backend=backend)
+        root = Node()
+        scale = 1
+        for _ in range(iterations):
+            game = root_game.clone(seed=random.getrandbits(32))
+            node = root
+            path = [root]
+            while not game.is_over():
+                legal = legal_moves(game)
+                if not legal:
+                    break
+                direction = select(node, legal, exploration, scale)
+                game.move_board(direction)
+                node = node.children[direction]
+                path.append(node)
+                if node.visits == 0:
+                    break
+            for _ in range(rollout_depth):
+                if game.is_over():
+                    break
+                game.move_board(random.choice(DIRECTIONS))
+
+            reward = game.score - root_game.score
+            scale = max(scale, reward)
+            for node in path:
+                node.visits += 1
+                node.total += reward
+        return {direction: (child.visits, child.total)
+                for direction, child in root.children.items()}
+    finally:
+        random.setstate(random_state)
+
+def _run_search_job(job):
+    """
+    Runs part of a search in a worker process.
+    """
+    return run_search(*job)
+
+class MCTSPlayer:
+    """
+    Picks moves with open-loop Monte Carlo tree search: playouts walk down
+    a tree of move sequences with UCB1, then finish with random moves, and
+    score the points gained. Playouts can be spread across worker
+    processes, each growing its own tree, whose root statistics are then
+    added up.
+
+    Playouts run on clones of a packed copy of the game, so the base tile
+    must be 3. They run on the packed backend by default, which needs no
+    table; the lookup backend can be asked for on boards it supports.
+
+    MCTSPlayer is a policy: calling it with a game returns the most
+    visited move.
+    """
+
+    def __init__(self, iterations=400, workers=1, rollout_depth=20,
+                 exploration=1.4, seed=None, backend="packed"):
+        """
+        Initializes a new MCTSPlayer.
+
+        Args:
+            iterations (int): Number of playouts per move, in total across
+                all workers.
+            workers (int): Number of processes to run playouts in. With 1,
+                playouts run in this process.
+            rollout_depth (int): Largest number of random moves made after
+                a playout leaves the tree.
+            exploration (float): Exploration constant of UCB1.
+            seed (int, optional): Seed of the playouts.
+            backend (str): Board backend of the playouts, "packed" or
+                "lookup".
+        """
+        self.iterations = iterations
+        self.workers = workers
+        self.rollout_depth = rollout_depth
+        self.exploration = exploration
+        self.backend = backend
+        self.rng = random.Random(seed)
+        self.pool = None
+
+    def __call__(self, game):
+        """
+        Returns self.best_move(game).
+        """
+        return self.best_move(game)
+
+    def best_move(self, game):
+        """
+        Returns the most visited move from a game, one of "up", "down",
+        "left", or "right".
+
+        Args:
+            game (Game): A game that isn't over yet.
+        """
+        visits = self.search(game)["visits"]
+        if not visits:
+            return DIRECTIONS[0]
+        return max(visits, key=visits.get)
+
+    def search(self, game):
+        """
+        Searches a game.
+
+        Args:
+            game (Game): A game that isn't over yet.
+
+        Returns:
+            A dictionary with (1) the number of visits of each legal move
+            from the root, (2) the share of visits of each move, and (3)
+            the mean score gained by the playouts of each move.
+        """
+        # The search spawns tiles from its own seeds, so the moves that
+        # led to the game don't need to be replayed.
+        game_state = dict(game.game_state(), moves=[])
+        chunks = [self.iterations // self.workers] * self.workers
+        for k in range(self.iterations % self.workers):
+            chunks[k] += 1
+        jobs = [(game_state, chunk, self.rollout_depth, self.exploration,
+                 self.rng.randrange(1 << 32), self.backend)
+                for chunk in chunks if chunk]
+
+        if self.workers == 1:
+            results = [_run_search_job(job) for job in jobs]
+        else:
+            if self.pool is None:
+                # Imported here, as it is slow to load and only needed
+                # with more than one worker.
+                import multiprocessing
+                if self.backend == "lookup":
+                    preload(game.size)
+                self.pool = multiprocessing.Pool(self.workers)
+            results = self.pool.map(_run_search_job, jobs)
+
+        visits = {}
+        totals = {}
+        for result in results:
+            for direction, (n, total) in result.items():
+                visits[direction] = visits.get(direction, 0) + n
+                totals[direction] = totals.get(direction, 0) + total
+        all_visits = sum(visits.values())
+        return {
+            "visits": visits,
+            "distribution": {direction: n / all_visits
+                             for direction, n in visits.items()},
+            "values": {direction: totals[direction] / visits[direction]
+                       for direction in visits}
+        }
+
+    def close(self):
+        """
+        Stops the worker processes, if any.
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+_player = None
+
+def mcts_policy(game):
+    """
+    Policy running 200 playouts per move in this process with a shared
+    MCTSPlayer.
+    """
+    global _player
+    if _player is None:
+        _player = MCTSPlayer(iterations=200)
+    return _player(game)
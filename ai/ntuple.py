@@ -0,0 +1,456 @@
+"""
+An n-tuple network player for the three-four-three game, trained with
+temporal difference learning.
+"""
+
+import argparse
+import collections
+import json
+import math
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+from engine import PackedBoard
+from engine.lookup import CACHE_DIR, search_board
+from engine.symmetry import transform_cell
+
+from .policies import DIRECTIONS
+
+# Number of cells in a tuple, and the number of exponents a cell of a
+# tuple tells apart: larger exponents are read as the largest one.
+TUPLE_LENGTH = 4
+RADIX = 16
+
+# Number of weights in the table of a tuple.
+TABLE_SIZE = RADIX ** TUPLE_LENGTH
+
+# Traces of TD(lambda) are cut off once the weight of a step drops below
+# this.
+TRACE_CUTOFF = 0.01
+
+USAGE = """python main.py --train [options]"""
+
+def weights_path(size):
+    """
+    Returns the default path of the weights of a network for boards of a
+    given size.
+    """
+    return os.path.join(CACHE_DIR, "ntuple-{0}.npy".format(size))
+
+def tuple_shapes(size):
+    """
+    Returns every placement of the tuple shapes on a board, as lists of
+    (i, j) cells: straight lines of TUPLE_LENGTH cells and 2x2 squares.
+    Vertical lines are left out, as they are rotations of the rows.
+    """
+    shapes = []
+    for i in range(size):
+        for j in range(size - TUPLE_LENGTH + 1):
+            shapes.append([(i, j + k) for k in range(TUPLE_LENGTH)])
+    for i in range(size - 1):
+        for j in range(size - 1):
+            shapes.append([(i, j), (i, j + 1), (i + 1, j), (i + 1, j + 1)])
+    return shapes
+
+def tuple_features(size):
+    """
+    Returns the features of an n-tuple network on a board, and the table
+    each one reads its weights from.
+
+    Placements of the tuple shapes that are rotations or reflections of
+    each other share a table, with their cells read in matching order, so
+    the value of a board is the same under all of its symmetries.
+
+    Args:
+        size (int): The size of the board's side. Must be at least
+            TUPLE_LENGTH.
+
+    Returns:
+        A tuple of (1) an (F, TUPLE_LENGTH) array of the flat cell indices
+        read by each feature, (2) an (F,) array of the table of each
+        feature, and (3) the number of tables.
+    """
+    if size < TUPLE_LENGTH:
+        raise ValueError("n-tuple networks need boards of at least {0}x{0}"
+                         .format(TUPLE_LENGTH))
+    features = []
+    tables = []
+    classes = {}
+    for shape in tuple_shapes(size):
+        images = [[transform_cell(i, j, size, symmetry) for i, j in shape]
+                  for symmetry in range(8)]
+        key = min(tuple(sorted(image)) for image in images)
+        if key in classes:
+            continue
+        classes[key] = len(classes)
+        seen = set()
+        for image in images:
+            cells = tuple(i * size + j for i, j in image)
+            if cells not in seen:
+                seen.add(cells)
+                features.append(cells)
+                tables.append(classes[key])
+    return (np.array(features, dtype=np.intp),
+            np.array(tables, dtype=np.intp), len(classes))
+
+class NTupleNetwork:
+    """
+    A value function of packed boards: the sum of one weight per feature,
+    looked up in the table of the feature by the exponents of its cells.
+
+    The weights are a float32 array of one row of TABLE_SIZE weights per
+    table. Given a path, they are kept in a .npy file mapped into memory,
+    so that processes using the same weights share one copy of them in
+    the page cache rather than reading them each.
+    """
+
+    def __init__(self, size, path=None, writable=False):
+        """
+        Initializes a new NTupleNetwork.
+
+        Args:
+            size (int): The size of the board's side.
+            path (str, optional): Path of the weights. If None, weights are
+                kept in memory only.
+            writable (bool): Whether the weights are opened for writing,
+                e.g. for training. Writable weights are created, as zeroes,
+                if there is no file at path yet.
+        """
+        self.size = size
+        self.path = path
+        self.features, tables, n_tables = tuple_features(size)
+        self.offsets = tables * TABLE_SIZE
+        self.powers = RADIX ** np.arange(TUPLE_LENGTH - 1, -1, -1)
+        shape = (n_tables, TABLE_SIZE)
+        if path is None:
+            self.weights = np.zeros(shape, dtype=np.float32)
+        elif writable and not os.path.exists(path):
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.weights = np.lib.format.open_memmap(
+                path, mode="w+", dtype=np.float32, shape=shape)
+        else:
+            self.weights = np.load(path, mmap_mode="r+" if writable else "r")
+            if self.weights.shape != shape:
+                raise ValueError("{0} holds weights for another board size"
+                                 .format(path))
+        # A flat view of the weights, still backed by the file if any.
+        self.flat = self.weights.reshape(-1)
+
+    def indices(self, cells):
+        """
+        Returns the index into self.flat of the weight of every feature of
+        a number of packed boards, as an (N, F) array.
+
+        Args:
+            cells (list of bytes): Exponents of the boards, as in
+                PackedBoard.cells.
+        """
+        boards = np.frombuffer(b"".join(cells), dtype=np.uint8) \
+            .reshape(len(cells), -1)
+        digits = np.minimum(boards, RADIX - 1)[:, self.features]
+        return digits.astype(np.intp) @ self.powers + self.offsets
+
+    def values(self, cells):
+        """
+        Returns the value of a number of packed boards, as an array.
+        """
+        return self.flat[self.indices(cells)].sum(axis=1)
+
+    def update(self, indices, change):
+        """
+        Adds change, spread evenly across the features, to the weights of
+        the features of a board.
+
+        Args:
+            indices (ndarray): The (F,) indices of the features of the
+                board, as a row of indices().
+            change (float): Change in the value of the board.
+        """
+        # Symmetric features may share a weight, which is then changed
+        # once for each of them.
+        np.add.at(self.flat, indices, change / len(indices))
+
+    def flush(self):
+        """
+        Writes changed weights to their file, if any.
+        """
+        if isinstance(self.weights, np.memmap):
+            self.weights.flush()
+
+def afterstates(board, slides=None):
+    """
+    Returns the legal moves of a packed board, as a list of tuples of (1)
+    the direction of the move, (2) the cells after the move, before a tile
+    spawns, (3) the score gained, and (4) whether a tile will spawn. See
+    PackedBoard.afterstates, which remembers moved lines in slides.
+    """
+    return [(direction.name.lower(), cells, score, moved)
+            for direction, (cells, score, moved)
+            in board.afterstates(slides).items() if cells != board.cells]
+
+class TDTrainer:
+    """
+    Trains an n-tuple network by self-play with TD(lambda) on afterstates,
+    the boards right after a move and before a tile spawns: every move
+    picks the most valuable afterstate greedily, then the value of the
+    afterstate before it is moved towards the score gained plus the value
+    of the new one.
+
+    Games are played straight on packed boards, without a Game, and end
+    when no move is left; winning tiles are played past.
+    """
+
+    def __init__(self, network, learning_rate=0.1, trace_decay=0.0,
+                 initial_tiles=2, seed=None):
+        """
+        Initializes a new TDTrainer.
+
+        Args:
+            network (NTupleNetwork): The network to train.
+            learning_rate (float): Fraction of the TD error an update moves
+                the value of a board by.
+            trace_decay (float): Lambda of TD(lambda). With 0, only the
+                last afterstate is updated, as in TD(0).
+            initial_tiles (int): Number of tiles on the board at the start
+                of a game.
+            seed (int, optional): Seed of the tiles that spawn.
+        """
+        self.network = network
+        self.learning_rate = learning_rate
+        self.trace_decay = trace_decay
+        self.initial_tiles = initial_tiles
+        self.rng = random.Random(seed)
+        if trace_decay > 0:
+            self.horizon = max(1, math.ceil(
+                math.log(TRACE_CUTOFF) / math.log(trace_decay)))
+        else:
+            self.horizon = 1
+        self.board = search_board(network.size)
+        # Moves of lines seen in the games played so far.
+        self.slides = ({}, {})
+
+    def learn(self, trace, target):
+        """
+        Moves the values of the afterstates of a trace towards the target
+        value of the latest one, each by trace_decay times less than the
+        one after it.
+
+        Args:
+            trace (deque): Feature indices of the latest afterstates, the
+                latest last.
+            target (float): Target value of the latest afterstate.
+        """
+        network = self.network
+        error = target - network.flat[trace[-1]].sum()
+        step = self.learning_rate * error
+        for indices in reversed(trace):
+            network.update(indices, step)
+            step *= self.trace_decay
+
+    def play_game(self):
+        """
+        Plays and learns from a single game.
+
+        Returns:
+            A dictionary with the final score, number of moves, and largest
+            tile of the game.
+        """
+        network = self.network
+        board = self.board
+        board.cells = bytes(network.size * network.size)
+        board.insert_random(self.initial_tiles, self.rng)
+        trace = collections.deque(maxlen=self.horizon)
+        score = 0
+        moves = 0
+        while True:
+            options = afterstates(board, self.slides)
+            if not options:
+                if trace:
+                    self.learn(trace, 0)
+                break
+            indices = network.indices([cells for _, cells, _, _ in options])
+            values = network.flat[indices].sum(axis=1) + \
+                [gain for _, _, gain, _ in options]
+            best = int(values.argmax())
+            if trace:
+                self.learn(trace, values[best])
+            _, board.cells, gain, spawns = options[best]
+            trace.append(indices[best])
+            score += gain
+            moves += 1
+            if spawns:
+                board.insert_random(1, self.rng)
+        return {
+            "score": score,
+            "moves": moves,
+            "max_tile": 3 ** max(board.cells)
+        }
+
+    def train(self, games, report_every=None, callback=None):
+        """
+        Plays and learns from a number of games, flushing the weights to
+        their file at the end.
+
+        Args:
+            games (int): Number of games.
+            report_every (int, optional): Number of games between reports.
+            callback (callable, optional): Called with a report every
+                report_every games.
+
+        Returns:
+            A report on the games played: the number of games and moves,
+            their mean score, largest tile, the seconds taken, and the
+            games and moves per second.
+        """
+        start = time.perf_counter()
+        window = []
+        totals = {"games": 0, "moves": 0, "score": 0, "max_tile": 0}
+        for k in range(games):
+            result = self.play_game()
+            window.append(result)
+            totals["games"] += 1
+            totals["moves"] += result["moves"]
+            totals["score"] += result["score"]
+            totals["max_tile"] = max(totals["max_tile"], result["max_tile"])
+            if report_every and callback is not None and \
+                    (k + 1) % report_every == 0:
+                callback(throughput(window, time.perf_counter() - start,
+                                    totals["games"]))
+                window = []
+        self.network.flush()
+        elapsed = time.perf_counter() - start
+        return {
+            "games": totals["games"],
+            "moves": totals["moves"],
+            "mean_score": totals["score"] / max(1, totals["games"]),
+            "max_tile": totals["max_tile"],
+            "seconds": elapsed,
+            "games_per_sec": totals["games"] / elapsed if elapsed else 0,
+            "moves_per_sec": totals["moves"] / elapsed if elapsed else 0
+        }
+
+def throughput(results, elapsed, games):
+    """
+    Returns a progress report on the latest games of a training run.
+
+    Args:
+        results (list of dict): Results of the latest games, as returned
+            by TDTrainer.play_game().
+        elapsed (float): Seconds since training started.
+        games (int): Number of games played since training started.
+    """
+    return {
+        "games": games,
+        "mean_score": sum(r["score"] for r in results) / len(results),
+        "max_tile": max(r["max_tile"] for r in results),
+        "seconds": elapsed,
+        "games_per_sec": games / elapsed if elapsed else 0
+    }
+
+class NTuplePlayer:
+    """
+    Picks the move whose score plus afterstate value, as judged by an
+    n-tuple network, is highest. The base tile must be 3.
+
+    NTuplePlayer is a policy: calling it with a game returns the best
+    move.
+    """
+
+    def __init__(self, network):
+        """
+        Initializes a new NTuplePlayer.
+
+        Args:
+            network (NTupleNetwork): The trained network.
+        """
+        self.network = network
+        self.board = search_board(network.size)
+        # Moves of lines seen in the games played so far.
+        self.slides = ({}, {})
+
+    def __call__(self, game):
+        """
+        Returns self.best_move(game).
+        """
+        return self.best_move(game)
+
+    def best_move(self, game):
+        """
+        Returns the best direction to move a game towards, one of "up",
+        "down", "left", or "right".
+
+        Args:
+            game (Game): A game that isn't over yet, of the same size as
+                the network.
+        """
+        self.board.cells = PackedBoard.from_values(
+            game.size, game.initial_value, game.peek_board()).cells
+        options = afterstates(self.board, self.slides)
+        if not options:
+            return DIRECTIONS[0]
+        values = self.network.values([cells for _, cells, _, _ in options]) \
+            + [gain for _, _, gain, _ in options]
+        return options[int(values.argmax())][0]
+
+_players = {}
+
+def ntuple_policy(game):
+    """
+    Policy playing with the network at weights_path(game.size), shared
+    across calls. The weights are mapped read-only, so any number of
+    processes can play with one copy of them.
+    """
+    if game.size not in _players:
+        path = weights_path(game.size)
+        try:
+            network = NTupleNetwork(game.size, path)
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                "no trained weights at {0}; train them with python main.py "
+                "--train --size {1}".format(path, game.size)) from None
+        _players[game.size] = NTuplePlayer(network)
+    return _players[game.size](game)
+
+def main(argv=None):
+    """
+    Trains a network from the command line, printing a progress report as
+    JSON every so often, and a summary of the throughput to stderr.
+
+    Args:
+        argv (list of str, optional): Command line arguments, without the
+            program name. Defaults to sys.argv[1:].
+    """
+    parser = argparse.ArgumentParser(
+        usage=USAGE, description="Train an n-tuple network by self-play.")
+    parser.add_argument("-n", "--games", type=int, default=1000,
+                        help="number of games to play (default: 1000)")
+    parser.add_argument("--size", type=int, default=6)
+    parser.add_argument("--weights", default=None,
+                        help="weights file, created if missing (default: "
+                        "{0})".format(weights_path("SIZE")))
+    parser.add_argument("--learning-rate", type=float, default=0.1)
+    parser.add_argument("--lambda", dest="trace_decay", type=float,
+                        default=0.0, help="lambda of TD(lambda) (default: 0)")
+    parser.add_argument("--initial-tiles", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--report-every", type=int, default=100,
+                        help="games between progress reports (default: 100)")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    network = NTupleNetwork(args.size, args.weights or weights_path(args.size),
+                            writable=True)
+    trainer = TDTrainer(network, learning_rate=args.learning_rate,
+                        trace_decay=args.trace_decay,
+                        initial_tiles=args.initial_tiles, seed=args.seed)
+    summary = trainer.train(
+        args.games, args.report_every,
+        lambda report: print(json.dumps(report), flush=True))
+    print("{0} games, {1} moves in {2:.2f}s ({3:.1f} games/s, {4:.0f} "
+          "moves/s), mean score {5:.0f}".format(
+              summary["games"], summary["moves"], summary["seconds"],
+              summary["games_per_sec"], summary["moves_per_sec"],
+              summary["mean_score"]), file=sys.stderr)
@@ -0,0 +1,64 @@
+"""
+Simple policies for playing threefourthree games.
+
+A policy is any callable that takes a Game that isn't over yet and
+returns the direction to move its board towards, one of "up", "down",
+"left", or "right".
+"""
+
+import importlib
+import random
+
+DIRECTIONS = ["up", "down", "left", "right"]
+
+def random_policy(game):
+    """
+    Moves in a uniformly random direction.
+    """
+    return random.choice(DIRECTIONS)
+
+def greedy_policy(game):
+    """
+    Moves in the direction that gains the most score right away, among
+    the directions that change the board. Ties are broken at random.
+    """
+    best_score = -1
+    best = []
+    for direction, (board, report) in game.successors().items():
+        if not report["legal"]:
+            continue
+        if report["score"] > best_score:
+            best_score = report["score"]
+            best = [direction]
+        elif report["score"] == best_score:
+            best.append(direction)
+    if not best:
+        return random_policy(game)
+    return random.choice(best)
+
+# Policies that can be asked for by name. Policies in other modules are
+# given as "module:attribute" paths, and only imported when asked for.
+POLICIES = {
+    "random": random_policy,
+    "greedy": greedy_policy,
+    "expectimax": "ai.expectimax:expectimax_policy",
+    "mcts": "ai.mcts:mcts_policy",
+    "ntuple": "ai.ntuple:ntuple_policy"
+}
+
+def load_policy(name):
+    """
+    Returns the policy with a given name: either one of the keys of
+    POLICIES, or a "module:attribute" path to any callable policy.
+
+    Args:
+        name (str): Name of the policy.
+    """
+    if name in POLICIES:
+        name = POLICIES[name]
+        if callable(name):
+            return name
+    module_name, _, attribute = name.partition(":")
+    if not attribute:
+        raise ValueError("{0} is not a valid policy".format(name))
+    return getattr(importlib.import_module(module_name), attribute)
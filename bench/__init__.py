@@ -0,0 +1 @@
+from bench.suite import BENCHMARKS, run_benchmarks, compare
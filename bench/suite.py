@@ -0,0 +1,689 @@
+"""
+Benchmarks of the hot paths of the three-four-three engine.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from engine import Game, BoardMovements
+from engine.game import BOARD_BACKENDS
+from engine.packed import PackedBoard
+from engine.symmetry import (SYMMETRIES, canonical, inverse, transform,
+                             transform_direction)
+
+# Board sizes and backends benchmarked by default.
+SIZES = (4, 6, 10)
+BACKENDS = tuple(BOARD_BACKENDS)
+
+# Number of positions each benchmark is timed on, and number of full
+# games played per board size by the random_games benchmark.
+POSITIONS = 1000
+GAMES = {4: 100, 6: 20, 10: 3}
+
+# Number of games played on every backend by check_backends, per size,
+# and the number of moves each game is cut off at.
+CHECKED_GAMES = 5
+CHECKED_MOVES = 1000
+
+# Board sizes checked by check_symmetries, down to a single cell, and the
+# number of random boards checked per size.
+CHECKED_SYMMETRY_SIZES = (1, 2, 3, 4, 5, 6)
+CHECKED_BOARDS = 100
+
+# Code run in a fresh interpreter by the startup benchmark, by mode: what
+# each entry point of main.py imports before it starts working.
+STARTUP_MODES = {
+    "interpreter": "pass",
+    "terminal": "import controller, views.terminal",
+    "simulate": "import sim.runner",
+    "bench": "import bench.suite",
+    "serve": "import server.app"
+}
+
+# Root of the repository, where the startup benchmark runs.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Baseline results are compared against, as written by --save-baseline.
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Number of runs of each benchmark, of which the median is kept.
+DEFAULT_REPEAT = 5
+
+# Number of loops of the reference work timed next to every run; see
+# reference_seconds().
+REFERENCE_LOOPS = 20000
+
+# A benchmark is a regression if it runs this much slower than baseline,
+# on top of the spread of its runs and of the baseline's; see compare().
+DEFAULT_TOLERANCE = 0.25
+
+# Fewest runs a benchmark needs for a slowdown to count as a regression:
+# with fewer, the spread of the runs says nothing about their noise.
+MIN_COMPARED_RUNS = 3
+
+DIRECTIONS = ["up", "down", "left", "right"]
+
+USAGE = """python main.py --bench [options]"""
+
+def game_config(size):
+    """
+    Returns the arguments of a Game of a given size used by the benchmarks.
+    """
+    return {
+        "size": size,
+        "initial_value": 3,
+        "initial_tiles": min(8, size * size // 4),
+        "win_condition": 10
+    }
+
+def positions(size, backend, count, seed=0):
+    """
+    Returns a list of games that aren't over yet, taken at every stage of
+    random games, the same for every backend.
+
+    Args:
+        size (int): The size of the board's side.
+        backend (str): Board backend of the games.
+        count (int): Number of games to return.
+        seed (int): Seed of the first random game.
+    """
+    rng = random.Random(seed)
+    games = []
+    while len(games) < count:
+        game = Game(backend=backend, seed=rng.randrange(1 << 32),
+                    **game_config(size))
+        while not game.is_over() and len(games) < count:
+            if rng.random() < 0.2:
+                games.append(game.clone())
+            game.move_board(rng.choice(DIRECTIONS))
+    return games
+
+def reference_seconds():
+    """
+    Times a fixed piece of interpreted work, in seconds. Timed next to
+    every run of a benchmark, it tells how fast the machine runs Python
+    at that moment.
+    """
+    start = time.perf_counter()
+    counts = {}
+    for k in range(REFERENCE_LOOPS):
+        counts[k & 255] = counts.get(k & 255, 0) + k
+    return time.perf_counter() - start
+
+def timed_runs(repeat, setup, run):
+    """
+    Times a benchmark, returning a (seconds per operation, reference
+    seconds) pair for each of repeat runs, where the reference seconds
+    are those of reference_seconds() right before the run. As in timeit,
+    garbage collection is turned off while a run is timed.
+
+    Args:
+        repeat (int): Number of runs.
+        setup (callable): Returns the list of items of a run. Not timed.
+        run (callable): Runs the operation once on every item. May return
+            the number of operations done, if not one per item.
+    """
+    runs = []
+    for _ in range(repeat):
+        items = setup()
+        reference = reference_seconds()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            operations = run(items)
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        runs.append((elapsed / (operations or len(items)), reference))
+    return runs
+
+def summarize(runs):
+    """
+    Summarizes the runs of a benchmark, as returned by timed_runs().
+
+    Returns:
+        A tuple of (1) the median seconds per operation, (2) the median
+        of the seconds per operation of each run over its reference
+        seconds, which varies less with the load of the machine, and (3)
+        the spread of the latter: the distance between its lower and upper
+        quartiles, as a fraction of its median. The spread is 0 for fewer
+        than two runs.
+    """
+    def median(values):
+        return (values[(len(values) - 1) // 2] + values[len(values) // 2]) / 2
+    n = len(runs)
+    relative = sorted(seconds / reference for seconds, reference in runs)
+    middle = median(relative)
+    spread = (relative[n - 1 - n // 4] - relative[n // 4]) / middle
+    return median(sorted(seconds for seconds, _ in runs)), middle, spread
+
+def bench_move_all(size, backend, repeat, direction):
+    """
+    Times Board.move_all towards a direction.
+    """
+    games = positions(size, backend, POSITIONS)
+    movement = BoardMovements[direction.upper()]
+    def run(boards):
+        for board in boards:
+            board.move_all(movement)
+    return timed_runs(repeat, lambda: [game.board.clone() for game in games],
+                      run)
+
+def bench_insert_random(size, backend, repeat):
+    """
+    Times Board.insert_random with a single tile.
+    """
+    games = [game for game in positions(size, backend, POSITIONS)
+             if not game.board.is_full()]
+    rng = random.Random(0)
+    def run(boards):
+        for board in boards:
+            board.insert_random(1, rng)
+    return timed_runs(repeat, lambda: [game.board.clone() for game in games],
+                      run)
+
+def bench_no_moves_possible(size, backend, repeat):
+    """
+    Times Board.no_moves_possible, on boards right after a move.
+    """
+    boards = []
+    for game in positions(size, backend, POSITIONS):
+        board = game.board.clone()
+        board.move_all(BoardMovements.LEFT)
+        boards.append(board)
+    def run(boards):
+        for board in boards:
+            board.no_moves_possible()
+    return timed_runs(repeat, lambda: boards, run)
+
+def bench_move_board(size, backend, repeat):
+    """
+    Times Game.move_board end to end: the move, the win and loss checks,
+    and the spawn.
+    """
+    games = positions(size, backend, POSITIONS)
+    def run(games):
+        for k, game in enumerate(games):
+            game.move_board(DIRECTIONS[k % 4])
+    return timed_runs(repeat, lambda: [game.clone() for game in games], run)
+
+def bench_game_state(size, backend, repeat):
+    """
+    Times Game.game_state.
+    """
+    games = positions(size, backend, POSITIONS)
+    def run(games):
+        for game in games:
+            game.game_state()
+    return timed_runs(repeat, lambda: games, run)
+
+def bench_peek_board(size, backend, repeat):
+    """
+    Times Game.peek_board.
+    """
+    games = positions(size, backend, POSITIONS)
+    def run(games):
+        for game in games:
+            game.peek_board()
+    return timed_runs(repeat, lambda: games, run)
+
+def bench_random_games(size, backend, repeat):
+    """
+    Times full games with uniformly random moves, per move.
+    """
+    def run(items):
+        rng = random.Random(0)
+        moves = 0
+        for _ in range(GAMES[size]):
+            game = Game(backend=backend, seed=rng.randrange(1 << 32),
+                        **game_config(size))
+            while not game.is_over():
+                game.move_board(rng.choice(DIRECTIONS))
+                moves += 1
+        return moves
+    return timed_runs(repeat, lambda: [None], run)
+
+# Benchmarks by name, as pairs of the function and its extra arguments.
+BENCHMARKS = dict(
+    [("move_all." + direction, (bench_move_all, (direction,)))
+     for direction in DIRECTIONS] + [
+        ("insert_random", (bench_insert_random, ())),
+        ("no_moves_possible", (bench_no_moves_possible, ())),
+        ("move_board", (bench_move_board, ())),
+        ("game_state", (bench_game_state, ())),
+        ("peek_board", (bench_peek_board, ())),
+        ("random_games", (bench_random_games, ()))
+    ])
+
+def bench_memory(size, backend):
+    """
+    Measures the memory taken by games in the middle of play, in bytes
+    per game, with tracemalloc. Every block the games hold is counted:
+    the game, its board, its random stream, and its tiles, if any. Tables
+    shared by all games of a backend are loaded beforehand, and are not.
+    """
+    positions(size, backend, 1)[0].move_board("left")
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        games = positions(size, backend, POSITIONS)
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return (after - before) / len(games)
+
+def bench_startup(mode, repeat):
+    """
+    Times starting a new interpreter and importing what an entry point
+    needs, in seconds per run. The "interpreter" mode imports nothing,
+    as a point of comparison.
+    """
+    def run(items):
+        subprocess.run([sys.executable, "-c", STARTUP_MODES[mode]],
+                       cwd=ROOT, check=True)
+    return timed_runs(repeat, lambda: [mode], run)
+
+def check_backends(sizes=SIZES, backends=BACKENDS, games=CHECKED_GAMES,
+                   seed=0):
+    """
+    Plays the same random games on every backend, with the same seeds and
+    moves, and checks that their boards and move reports are the same
+    after every move, and that their game_state() is the same at the end,
+    or after CHECKED_MOVES moves. All backends share the rules of the
+    game, so any difference is a bug in one of them.
+
+    Args:
+        sizes (sequence of int): Board sizes to play on.
+        backends (sequence of str): Board backends to compare.
+        games (int): Number of games per board size.
+        seed (int): Seed of the first game.
+
+    Returns:
+        A list of messages, one for each game where backends differ.
+    """
+    mismatches = []
+    for size in sizes:
+        names = [backend for backend in backends if supports(size, backend)]
+        for game_seed in range(seed, seed + games):
+            rng = random.Random(game_seed)
+            played = [Game(backend=backend, seed=game_seed,
+                           **game_config(size)) for backend in names]
+            moves = 0
+            while True:
+                over = played[0].is_over() or moves == CHECKED_MOVES
+                # The whole game state, with its list of moves, is only
+                # compared at the end, as it grows with every move.
+                states = [game.game_state() if over else
+                          (game.peek_board(), game.last_report,
+                           game.game_status)
+                          for game in played]
+                different = [name for name, state in zip(names, states)
+                             if state != states[0]]
+                if different:
+                    mismatches.append(
+                        "{0}x{0} seed {1}, move {2}: {3} differ from {4}"
+                        .format(size, game_seed, moves, ", ".join(different),
+                                names[0]))
+                    break
+                if over:
+                    break
+                direction = rng.choice(DIRECTIONS)
+                for game in played:
+                    game.move_board(direction)
+                moves += 1
+    return mismatches
+
+def check_symmetries(sizes=CHECKED_SYMMETRY_SIZES, boards=CHECKED_BOARDS,
+                     seed=0):
+    """
+    Checks the board symmetries of engine.symmetry on random packed
+    boards: each symmetry is undone by its inverse, moving a transformed
+    board towards the transformed direction gives the transformed result
+    of the move, and every image of a board has the same canonical form.
+
+    Args:
+        sizes (sequence of int): Board sizes to check.
+        boards (int): Number of random boards per size.
+        seed (int): Seed of the random boards.
+
+    Returns:
+        A list of messages, one for each board where a check failed.
+    """
+    failures = []
+    rng = random.Random(seed)
+    for size in sizes:
+        for _ in range(boards):
+            cells = bytes(rng.choice((0, 0, 1, 1, 1, 2, 2, 3))
+                          for _ in range(size * size))
+            board = "{0}x{0} board {1}".format(size, cells.hex())
+            for symmetry in range(8):
+                image = transform(cells, size, symmetry)
+                if transform(image, size, inverse(symmetry)) != cells:
+                    failures.append("{0}: {1} is not undone".format(
+                        board, SYMMETRIES[symmetry]))
+                    break
+                for direction in DIRECTIONS:
+                    moved = PackedBoard(size, 3, cells)
+                    moved.move_all(BoardMovements[direction.upper()])
+                    moved_image = PackedBoard(size, 3, image)
+                    moved_image.move_all(BoardMovements[transform_direction(
+                        direction, symmetry).upper()])
+                    if transform(moved.cells, size, symmetry) != \
+                            moved_image.cells:
+                        failures.append("{0}: moving {1} does not commute "
+                                        "with {2}".format(
+                                            board, direction,
+                                            SYMMETRIES[symmetry]))
+            best, symmetry = canonical(cells, size)
+            if transform(cells, size, symmetry) != best or \
+                    any(canonical(transform(cells, size, other), size)[0]
+                        != best for other in range(8)):
+                failures.append("{0}: canonical form differs between its "
+                                "images".format(board))
+    return failures
+
+def check_sessions(sessions=4):
+    """
+    Checks that closing a session while the session store is evicting
+    others neither breaks eviction nor loses any session: one session is
+    closed while the snapshot of another is being written.
+
+    Args:
+        sessions (int): Number of sessions to start, of which one is kept
+            in memory.
+
+    Returns:
+        A list of messages, one for each thing that went wrong.
+    """
+    # Imported here, as only this check needs the server.
+    import asyncio
+    import tempfile
+    from server.store import SessionStore
+
+    async def evict_and_close(store, ids):
+        eviction = asyncio.ensure_future(store.evict())
+        # Let eviction start writing the first session before closing the
+        # second, which it has yet to get to.
+        await asyncio.sleep(0)
+        await store.close(ids[1])
+        await eviction
+        states = []
+        for session_id in ids[:1] + ids[2:]:
+            async with store.session(session_id) as game:
+                states.append(game.game_state())
+        return states
+
+    failures = []
+    loop = asyncio.new_event_loop()
+    with tempfile.TemporaryDirectory() as directory:
+        store = SessionStore(directory, max_sessions=1, backend="packed")
+        ids = [store.create(4, 3, 2, 10, seed=seed)
+               for seed in range(sessions)]
+        expected = [store.resident[session_id][0].game_state()
+                    for session_id in ids[:1] + ids[2:]]
+        try:
+            if loop.run_until_complete(
+                    evict_and_close(store, ids)) != expected:
+                failures.append("sessions changed across eviction")
+        except Exception as error:
+            failures.append("closing a session during eviction raised "
+                            "{0!r}".format(error))
+        finally:
+            loop.close()
+        if len(store) != sessions - 1:
+            failures.append("{0} sessions left of {1}".format(
+                len(store), sessions - 1))
+    return failures
+
+def supports(size, backend):
+    """
+    Checks if a backend can play on a board of a given size.
+    """
+    try:
+        BOARD_BACKENDS[backend](size, 3)
+    except ValueError:
+        return False
+    return True
+
+def timing_result(key, name, size, backend, runs):
+    """
+    Returns the result of a timed benchmark from its runs; see
+    run_benchmarks().
+    """
+    seconds, relative, spread = summarize(runs)
+    return {
+        "key": key,
+        "name": name,
+        "size": size,
+        "backend": backend,
+        "seconds_per_op": seconds,
+        "ops_per_sec": 1 / seconds,
+        "relative": relative,
+        "runs": len(runs),
+        "spread": spread
+    }
+
+def run_benchmarks(names=None, sizes=SIZES, backends=BACKENDS,
+                   repeat=DEFAULT_REPEAT):
+    """
+    Runs benchmarks on every supported pair of board size and backend,
+    yielding each result as soon as it is done. The "startup" benchmark
+    is run once for each of STARTUP_MODES instead, with neither a size
+    nor a backend. The "memory" benchmark measures bytes per game rather
+    than time, and is only run once, as it does not vary between runs.
+
+    Args:
+        names (list of str, optional): Names of the benchmarks to run, as
+            in BENCHMARKS, "memory", or "startup". If None, run all of
+            them.
+        sizes (sequence of int): Board sizes to run on.
+        backends (sequence of str): Board backends to run on.
+        repeat (int): Number of runs of each benchmark; the median is
+            kept.
+
+    Yields:
+        A dictionary with the key of the result, the name of the
+        benchmark, the board size and backend, the median number of
+        seconds per operation and operations per second, the median time
+        relative to the reference work, the number of runs and their
+        spread (see summarize()), or for the memory benchmark, the number
+        of bytes per game.
+    """
+    for name in (names or list(BENCHMARKS) + ["memory", "startup"]):
+        if name == "memory":
+            for size in sizes:
+                for backend in backends:
+                    if supports(size, backend):
+                        yield {
+                            "key": "memory/{0}x{0}/{1}".format(size, backend),
+                            "name": name,
+                            "size": size,
+                            "backend": backend,
+                            "bytes_per_game": bench_memory(size, backend)
+                        }
+            continue
+        if name == "startup":
+            for mode in STARTUP_MODES:
+                yield timing_result("startup/" + mode, name, None, None,
+                                    bench_startup(mode, repeat))
+            continue
+        function, args = BENCHMARKS[name]
+        for size in sizes:
+            for backend in backends:
+                if not supports(size, backend):
+                    continue
+                yield timing_result(
+                    "{0}/{1}x{1}/{2}".format(name, size, backend), name,
+                    size, backend, function(size, backend, repeat, *args))
+
+def measure(result):
+    """
+    Returns what a result measures, where less is better: its seconds per
+    operation, or its bytes per game.
+    """
+    if "bytes_per_game" in result:
+        return result["bytes_per_game"]
+    return result["seconds_per_op"]
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compares results against a baseline.
+
+    Timed benchmarks are compared by their times relative to the reference
+    work, where both have one, so that a machine that is busier than when
+    the baseline was taken does not look like a slowdown. A timed
+    benchmark is a regression if its ratio to the baseline is over 1 +
+    tolerance + the spread of its runs + the spread of the baseline's, so
+    that noisier benchmarks need a larger slowdown to be flagged. It is
+    never flagged with fewer than MIN_COMPARED_RUNS runs. Memory does not
+    vary between runs, and is flagged past 1 + tolerance.
+
+    Args:
+        results (list of dict): Results, as yielded by run_benchmarks().
+        baseline (dict): Results document, as written by main().
+        tolerance (float): Fraction by which a benchmark may be slower, or
+            take more memory, than its baseline, beyond its spread, before
+            it counts as a regression.
+
+    Returns:
+        A list of (key, ratio) pairs, one for each result with a baseline,
+        where ratio is the relative time (or time per operation, or bytes
+        per game) over that of the baseline, and a list of the keys of
+        regressions.
+    """
+    before = {result["key"]: result for result in baseline["results"]}
+    ratios = []
+    regressions = []
+    for result in results:
+        if result["key"] not in before:
+            continue
+        old = before[result["key"]]
+        if "relative" in result and "relative" in old:
+            ratio = result["relative"] / old["relative"]
+        else:
+            ratio = measure(result) / measure(old)
+        ratios.append((result["key"], ratio))
+        if "bytes_per_game" in result:
+            threshold = 1 + tolerance
+        elif result["runs"] < MIN_COMPARED_RUNS:
+            continue
+        else:
+            threshold = 1 + tolerance + result["spread"] + \
+                old.get("spread", 0)
+        if ratio > threshold:
+            regressions.append(result["key"])
+    return ratios, regressions
+
+def main(argv=None):
+    """
+    Runs the benchmarks from the command line and compares them against
+    the baseline. Writes the results as JSON, and a summary to stderr.
+    Exits with status 1 if any benchmark regressed.
+
+    Args:
+        argv (list of str, optional): Command line arguments, without the
+            program name. Defaults to sys.argv[1:].
+    """
+    parser = argparse.ArgumentParser(
+        usage=USAGE, description="Benchmark the three-four-three engine.")
+    parser.add_argument("names", nargs="*", metavar="benchmark",
+                        help="benchmarks to run: any of {0}, memory, "
+                        "startup (default: all)".format(", ".join(BENCHMARKS)))
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--backends", nargs="+", default=BACKENDS,
+                        choices=BACKENDS)
+    parser.add_argument("-r", "--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="runs of each benchmark, of which the median "
+                        "is kept (default: {0})".format(DEFAULT_REPEAT))
+    parser.add_argument("-o", "--output", default=None,
+                        help="file to write the results to (default: stdout)")
+    parser.add_argument("--baseline", default=BASELINE_PATH,
+                        help="results to compare against")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="write the results as the new baseline")
+    parser.add_argument("--check", action="store_true",
+                        help="only check that all backends play the same "
+                        "games, that board symmetries commute with moves, "
+                        "and that the session store survives sessions "
+                        "closed during eviction")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="slowdown beyond the spread of the runs "
+                        "counted as a regression (default: "
+                        "{0})".format(DEFAULT_TOLERANCE))
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    for name in args.names:
+        if name not in BENCHMARKS and name not in ("memory", "startup"):
+            parser.error("unknown benchmark {0}".format(name))
+
+    # Timings of a backend that plays other games than the rest are
+    # meaningless, so backends are checked against each other first.
+    mismatches = check_backends(args.sizes, args.backends)
+    for message in mismatches:
+        print("MISMATCH " + message, file=sys.stderr)
+    if mismatches:
+        sys.exit(1)
+    if args.check:
+        print("{0} backends play the same games".format(
+            ", ".join(args.backends)), file=sys.stderr)
+        failures = check_symmetries() + check_sessions()
+        for message in failures:
+            print("FAILED " + message, file=sys.stderr)
+        if failures:
+            sys.exit(1)
+        print("symmetries and session eviction check out", file=sys.stderr)
+        return
+
+    results = []
+    for result in run_benchmarks(args.names, args.sizes, args.backends,
+                                 args.repeat):
+        if "bytes_per_game" in result:
+            print("{0:40} {1:12.0f} bytes/game".format(
+                result["key"], result["bytes_per_game"]), file=sys.stderr)
+        else:
+            print("{0:40} {1:12.0f} ops/s  spread {2:5.1%}".format(
+                result["key"], result["ops_per_sec"], result["spread"]),
+                file=sys.stderr)
+        results.append(result)
+    document = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results
+    }
+
+    if args.output is None:
+        print(json.dumps(document, indent=2))
+    else:
+        with open(args.output, "w") as outfile:
+            json.dump(document, outfile, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as outfile:
+            json.dump(document, outfile, indent=2)
+        return
+
+    if not os.path.exists(args.baseline):
+        print("No baseline at {0}".format(args.baseline), file=sys.stderr)
+        return
+    with open(args.baseline) as infile:
+        baseline = json.load(infile)
+    if args.repeat < MIN_COMPARED_RUNS:
+        print("Fewer than {0} runs: timings are not checked for "
+              "regressions".format(MIN_COMPARED_RUNS), file=sys.stderr)
+    ratios, regressions = compare(results, baseline, args.tolerance)
+    for key, ratio in ratios:
+        print("{0:40} {1:6.2f}x baseline{2}".format(
+            key, ratio, "  REGRESSION" if key in regressions else ""),
+            file=sys.stderr)
+    if regressions:
+        print("{0} regressions".format(len(regressions)), file=sys.stderr)
+        sys.exit(1)
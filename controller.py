@@ -5,16 +5,38 @@ Controller class for the threefourthree game.
 :Version:    v20181126
 """
 
-from engine import Game, ControllerEvents
+import json
+import os
+import sys
+import time
+
+from engine import Game, ControllerEvents, SaveFile
+from engine.savefile import KEEP_PLAYING
+
+# Where games are saved by default.
+SAVE_PATH = "save.tft"
+
+# Where games were saved as JSON before; see Controller.has_save.
+LEGACY_SAVE_PATH = "save.json"
 
 class Controller:
 
-    def __init__(self, interface):
+    def __init__(self, interface, save_path=SAVE_PATH,
+                 legacy_save_path=LEGACY_SAVE_PATH):
         """
         Initializes a new Controller.
+
+        Args:
+            interface (Interface): The view of the game.
+            save_path (str): Path of the saved game.
+            legacy_save_path (str): Path of a game saved as JSON, which
+                is imported if there is no saved game.
         """
         self.current_game = None
         self.interface = interface
+        self.stats = None
+        self.save_file = SaveFile(save_path)
+        self.legacy_save_path = legacy_save_path
 
         # Enable two-way comms between interface and view
         self.interface.controller = self
@@ -25,27 +47,171 @@ class Controller:
         self.interface.view_events.move += self.on_move
         self.interface.view_events.keep_playing += self.on_keep_playing
         self.interface.view_events.end += self.on_end
+        self.interface.view_events.undo += self.on_undo
+        self.interface.view_events.redo += self.on_redo
 
     def game_state(self):
         if self.current_game is None:
             return {}
         return self.current_game.game_state()
 
+    def has_save(self):
+        """
+        Checks if there is a saved game. If there is none, but there is a
+        game saved as JSON, it is imported first; see import_legacy_save.
+        """
+        if not self.save_file.exists() and \
+                os.path.exists(self.legacy_save_path):
+            self.import_legacy_save()
+        return self.save_file.exists()
+
+    def import_legacy_save(self):
+        """
+        Imports the game saved as JSON into the saved game, then deletes
+        the JSON save. If it can't be imported, it is left as it is, and
+        the reason is shown.
+        """
+        try:
+            with open(self.legacy_save_path) as infile:
+                game_state = json.load(infile)
+            game = Game(game_state["size"], game_state["initial_value"],
+                        game_state.get("initial_tiles", 0),
+                        game_state["win_condition"], game_state=game_state)
+            self.save_file.save(game)
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            self.save_file.delete()
+            print("The game saved in {0} was not loaded: {1}".format(
+                self.legacy_save_path, error), file=sys.stderr)
+            return
+        self.save_file.close()
+        os.remove(self.legacy_save_path)
+
+    def save_game(self):
+        """
+        Saves the current game. From then on, every move is journaled to
+        the save, until another game is created or the game ends.
+        """
+        self.save_file.save(self.current_game)
+
+    def load_game(self, **kwargs):
+        """
+        Loads the saved game as the current game, and keeps journaling it.
+
+        Args:
+            **kwargs: Backend and undo limit of the game; see Game.
+        """
+        self.save_file.close()
+        self.current_game = self.save_file.load(**kwargs)
+        if self.stats is not None:
+            self.current_game.instrument(self.stats)
+
+    def delete_save(self):
+        """
+        Deletes the saved game, if any.
+        """
+        self.save_file.delete()
+
+    def journaling(self):
+        """
+        Checks if the current game is being journaled to the save.
+        """
+        return self.current_game is not None and \
+            self.save_file.game is self.current_game
+
+    def instrument(self, stats):
+        """
+        Starts collecting counters and timers of the current and future
+        games into a Stats, along with the time taken to handle each move
+        event. Until then, moves are handled by on_move, which measures
+        nothing.
+
+        Args:
+            stats (Stats): Where to collect counters and timers. If None,
+                stop collecting them.
+        """
+        move = self.interface.view_events.move
+        move -= self.on_move
+        move -= self.on_move_timed
+        move += self.on_move if stats is None else self.on_move_timed
+        self.stats = stats
+        if self.current_game is not None:
+            self.current_game.instrument(stats)
+
     def on_create(self, *args, **kwargs):
+        self.save_file.close()
         self.current_game = Game(*args, **kwargs)
+        if self.stats is not None:
+            self.current_game.instrument(self.stats)
 
     def on_move(self, direction):
         self.current_game.move_board(direction)
+        if self.journaling():
+            self.save_file.record_move(
+                direction, self.current_game.last_spawn)
+        if self.current_game.is_lost():
+            self.controller_events.lost()
+        if self.current_game.is_won():
+            self.controller_events.won()
+
+    def on_move_timed(self, direction):
+        start = time.perf_counter()
+        self.current_game.move_board(direction)
+        if self.journaling():
+            self.save_file.record_move(
+                direction, self.current_game.last_spawn)
+        dispatch = time.perf_counter()
         if self.current_game.is_lost():
             self.controller_events.lost()
         if self.current_game.is_won():
             self.controller_events.won()
+        end = time.perf_counter()
+        self.stats.time("dispatch", end - dispatch)
+        self.stats.time("on_move", end - start)
+
+    def move_batch(self, directions):
+        """
+        Makes a sequence of moves, stopping if the game ends, and emits the
+        won or lost event once, after the last one. Views with many moves
+        to make at once, e.g. moves sent together by a bot, call this
+        directly rather than raising an event, so they get the report.
+
+        Args:
+            directions (list of str): Directions to move the board
+                towards, in order.
+
+        Returns:
+            The report of Game.move_many.
+        """
+        report = self.current_game.move_many(directions)
+        if self.journaling():
+            for direction, spawn in zip(directions, report["spawns"]):
+                self.save_file.record_move(direction, spawn)
+        if self.current_game.is_lost():
+            self.controller_events.lost()
+        if self.current_game.is_won():
+            self.controller_events.won()
+        return report
 
     def on_keep_playing(self):
         self.current_game.keep_playing()
+        if self.journaling():
+            self.save_file.record(KEEP_PLAYING)
 
     def on_end(self):
+        self.save_file.close()
         self.current_game = None
 
+    def on_undo(self):
+        if self.current_game.can_undo():
+            self.current_game.undo()
+            if self.journaling():
+                self.save_file.save(self.current_game)
+
+    def on_redo(self):
+        if self.current_game.can_redo():
+            self.current_game.redo()
+            if self.journaling():
+                self.save_file.save(self.current_game)
+
     def run_interface(self):
         self.interface.run()
@@ -1,4 +1,8 @@
 from engine.board import Board, BoardMovements
+from engine.packed import PackedBoard
+from engine.lookup import LookupBoard
 from engine.game import Game
+from engine.stats import Stats
+from engine.savefile import SaveFile
 from engine.tile import Tile
 from engine.events import ViewEvents, ControllerEvents
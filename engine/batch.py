@@ -0,0 +1,254 @@
+"""
+Many threefourthree games stepped at once with NumPy.
+"""
+
+import numpy as np
+
+from .board import BoardMovements
+from .game import GameState
+from .packed import PACKED_BASE, POWERS
+
+# Scores are kept as int64, which holds tile values up to 3 ** 39.
+MAX_EXPONENT = 39
+SCORES = np.array([0] + POWERS[1:MAX_EXPONENT + 1], dtype=np.int64)
+
+def line_orders(size):
+    """
+    Returns, for each BoardMovements value, the flat cell indices of a
+    board read line by line so that tiles move towards the start of each
+    line. Row 0 of the result is unused.
+
+    Args:
+        size (int): The size of the board's side.
+    """
+    orders = np.zeros((5, size, size), dtype=np.intp)
+    cells = np.arange(size * size).reshape(size, size)
+    orders[BoardMovements.LEFT.value] = cells
+    orders[BoardMovements.RIGHT.value] = cells[:, ::-1]
+    orders[BoardMovements.UP.value] = cells.T
+    orders[BoardMovements.DOWN.value] = cells[::-1, :].T
+    return orders.reshape(5, size * size)
+
+def slide_lines(lines, win_exponent):
+    """
+    Pushes every line of exponents towards index 0 and merges like tiles
+    three - wise, with the same semantics as slide_row. Lines are walked
+    one cell at a time, all lines at once.
+
+    Args:
+        lines (ndarray): (M, size) array of exponents.
+        win_exponent (int): Exponent of the winning tile.
+
+    Returns:
+        A tuple of (1) the new (M, size) lines, (2) the score gained in
+        each line, (3) whether any tile in each line changed position, and
+        (4) whether a merge in each line made the winning tile.
+    """
+    m, size = lines.shape
+    out = np.zeros_like(lines)
+    length = np.zeros(m, dtype=np.intp)
+    moved = np.zeros(m, dtype=bool)
+    score = np.zeros(m, dtype=np.int64)
+    won = np.zeros(m, dtype=bool)
+    everything = np.arange(m)
+    for k in range(size):
+        e = lines[:, k]
+        tile = e != 0
+        moved |= tile & (length != k)
+        last = out[everything, np.maximum(length - 1, 0)]
+        before_last = out[everything, np.maximum(length - 2, 0)]
+        merge = tile & (length >= 2) & (last == e) & (before_last == e)
+        push = tile & ~merge
+
+        rows = everything[merge]
+        merged = e[merge] + 1
+        out[rows, length[rows] - 2] = merged
+        out[rows, length[rows] - 1] = 0
+        length[rows] -= 1
+        score[rows] += SCORES[np.minimum(merged, MAX_EXPONENT)]
+        won[rows] |= merged == win_exponent
+
+        rows = everything[push]
+        out[rows, length[rows]] = e[push]
+        length[rows] += 1
+    return out, score, moved, won
+
+def no_moves_possible(boards):
+    """
+    Checks, for each board, if no more moves are possible, with the same
+    rules as Board.no_moves_possible.
+
+    Args:
+        boards (ndarray): (N, size, size) array of exponents.
+
+    Returns:
+        A boolean array, True where a board is full and no more merges
+        can be done on it.
+    """
+    full = (boards != 0).all(axis=(1, 2))
+    rows = (boards[:, :, :-2] == boards[:, :, 1:-1]) & \
+        (boards[:, :, 1:-1] == boards[:, :, 2:])
+    columns = (boards[:, :-2, :] == boards[:, 1:-1, :]) & \
+        (boards[:, 1:-1, :] == boards[:, 2:, :])
+    return full & ~rows.any(axis=(1, 2)) & ~columns.any(axis=(1, 2))
+
+class BatchGame:
+    """
+    N threefourthree games played in lockstep, following the same rules
+    as Game. Boards are kept as an (N, size, size) array of exponents
+    (log base initial_value, 0 for empty cells), so like PackedBoard,
+    the base tile must be 3.
+
+    Statuses are stored as the values of GameState.
+    """
+
+    def __init__(self, n, size, initial_value, initial_tiles, win_condition,
+                 seed=None):
+        """
+        Initializes N new three-four-three games.
+
+        Args:
+            n (int): Number of games.
+            size (int): Size of board.
+            initial_value (int): Initial value of the base tile. Must be 3.
+            initial_tiles (int): Initial number of tiles to place on each
+                board.
+            win_condition (int): Exponent of the winning tile, as in Game.
+            seed (int, optional): Seed for the random tile spawns.
+        """
+        if initial_value != PACKED_BASE:
+            raise ValueError("batch games need an initial value of {0}"
+                             .format(PACKED_BASE))
+        if initial_tiles > size * size:
+            raise ValueError("Too many initial tiles")
+        self.n = n
+        self.size = size
+        self.initial_value = initial_value
+        self.win_condition = win_condition
+        self.rng = np.random.default_rng(seed)
+        self.orders = line_orders(size)
+
+        self.boards = np.zeros((n, size, size), dtype=np.uint8)
+        self.scores = np.zeros(n, dtype=np.int64)
+        self.moves = np.zeros(n, dtype=np.int64)
+        self.status = np.full(n, GameState.PLAYING.value, dtype=np.uint8)
+
+        flat = self.boards.reshape(n, size * size)
+        cells = np.argsort(self.rng.random((n, size * size)), axis=1)
+        cells = cells[:, :initial_tiles]
+        big = self.rng.random((n, initial_tiles)) > 0.9
+        flat[np.arange(n)[:, None], cells] = np.where(big, 2, 1)
+
+    def is_over(self):
+        """
+        Returns a boolean array, True where a game has been won or lost.
+        """
+        return (self.status == GameState.WON.value) | \
+            (self.status == GameState.LOST.value)
+
+    def max_tiles(self):
+        """
+        Returns the value of the largest tile on each board.
+        """
+        return SCORES[np.minimum(self.boards.max(axis=(1, 2)), MAX_EXPONENT)]
+
+    def keep_playing(self, games):
+        """
+        Sets won games to continue.
+
+        Args:
+            games (array-like): Indices or boolean mask of the games.
+        """
+        games = np.arange(self.n)[games]
+        if (self.status[games] != GameState.WON.value).any():
+            raise RuntimeError("Can only keep playing if the game is won")
+        self.status[games] = GameState.KEEP_PLAYING.value
+
+    def move(self, directions):
+        """
+        Moves every board that is still being played towards a direction,
+        then checks for win/lose conditions and spawns new tiles as
+        Game.move_board does. Boards of games that are over are left
+        alone.
+
+        Args:
+            directions (array-like): The BoardMovements value to move each
+                board towards.
+
+        Returns:
+            A report of the move, with (1) the score gained by each board,
+            and (2) whether any tile moved on each board.
+        """
+        n = self.n
+        size = self.size
+        cells = size * size
+        report = {
+            "score": np.zeros(n, dtype=np.int64),
+            "moves_made": np.zeros(n, dtype=bool)
+        }
+
+        games = np.flatnonzero(~self.is_over())
+        if len(games) == 0:
+            return report
+        order = self.orders[np.asarray(directions)[games]]
+        flat = self.boards.reshape(n, cells)
+        every = np.arange(len(games))[:, None]
+
+        lines = flat[games[:, None], order].reshape(-1, size)
+        lines, score, moved, won = slide_lines(lines, self.win_condition)
+        new_flat = np.empty((len(games), cells), dtype=np.uint8)
+        new_flat[every, order] = lines.reshape(-1, cells)
+        flat[games] = new_flat
+
+        score = score.reshape(-1, size).sum(axis=1)
+        moved = moved.reshape(-1, size).any(axis=1)
+        won = won.reshape(-1, size).any(axis=1)
+        self.scores[games] += score
+        self.moves[games] += 1
+        report["score"][games] = score
+        report["moves_made"][games] = moved
+
+        # Same order of checks as Game.move_board
+        status = self.status[games]
+        status[no_moves_possible(self.boards[games])] = GameState.LOST.value
+        status[won & (status != GameState.KEEP_PLAYING.value)] = \
+            GameState.WON.value
+        self.status[games] = status
+
+        spawn = games[moved & (status != GameState.WON.value)
+                      & (status != GameState.LOST.value)]
+        self.insert_random(spawn)
+        return report
+
+    def insert_random(self, games):
+        """
+        Inserts a random tile on each of the given boards, picking an empty
+        cell and value the same way as Board.insert_random. Full boards are
+        skipped.
+
+        Args:
+            games (ndarray): Indices of the games.
+        """
+        flat = self.boards.reshape(self.n, self.size * self.size)[games]
+        keys = self.rng.random(flat.shape)
+        keys[flat != 0] = -1
+        cells = keys.argmax(axis=1)
+        values = np.where(self.rng.random(len(games)) > 0.9, 2, 1)
+        has_room = (flat == 0).any(axis=1)
+        self.boards.reshape(self.n, -1)[games[has_room], cells[has_room]] = \
+            values[has_room]
+
+    def game_state(self, k):
+        """
+        Returns a dictionary describing the current state of game k, in the
+        same format as Game.game_state.
+        """
+        return {
+            "board": [[POWERS[e] for e in row]
+                      for row in self.boards[k].tolist()],
+            "score": int(self.scores[k]),
+            "status": GameState(self.status[k]).name,
+            "size": self.size,
+            "initial_value": self.initial_value,
+            "win_condition": self.win_condition
+        }
@@ -5,6 +5,7 @@ A board of tiles.
 :Version:    v20181125
 """
 
+import bisect
 import random
 from enum import Enum
 
@@ -20,6 +21,55 @@ class BoardMovements(Enum):
     LEFT = 3
     RIGHT = 4
 
+def slide_line(row, empty=None, merge=(3).__mul__):
+    """
+    Pushes a row of tiles towards index 0 and merges like tiles three -
+    wise, with the same semantics as Board.move_all. Every board backend
+    moves its rows with this, whatever it keeps in its cells.
+
+    Args:
+        row (sequence): Tiles of the row, in the order they are visited,
+            i.e. index 0 is next to the wall the tiles move towards.
+        empty: What empty cells hold. Defaults to None, as for tile values.
+        merge (callable): Returns the tile that three like tiles merge
+            into. Defaults to tripling a tile value.
+
+    Returns:
+        A tuple of (1) the new row, as a list of tiles, (2) a list of
+        (tile, index) pairs, one for each merge in the order they were
+        done, and (3) whether any tile changed its position.
+    """
+    out = []
+    merges = []
+    moved = False
+    for k, value in enumerate(row):
+        if value == empty:
+            continue
+        # The tile slides to the first free cell, then merges with the
+        # two tiles before it if all three match.
+        n = len(out)
+        if k != n:
+            moved = True
+        if n >= 2 and out[-1] == value and out[-2] == value:
+            del out[-1]
+            out[-1] = merge(value)
+            merges.append((out[-1], n - 2))
+        else:
+            out.append(value)
+    return out + [empty] * (len(row) - len(out)), merges, moved
+
+def count_triples(line):
+    """
+    Returns the number of runs of three like tiles in a row or column of
+    tiles, counting overlapping runs separately.
+    """
+    count = 0
+    for a, b, c in zip(line, line[1:], line[2:]):
+        if a is not None and b is not None and c is not None \
+                and a.value == b.value == c.value:
+            count += 1
+    return count
+
 class Board:
     """
     A board of tiles, part of the TFT engine.
@@ -43,6 +93,26 @@ class Board:
             self.board = board
         self.size = size
         self.initial_value = initial_value
+        # Tuples of the values of each row, as last returned by snapshot().
+        # A row's entry is reset to None whenever the row changes.
+        self.row_snapshots = [None] * size
+        self.reindex()
+
+    @classmethod
+    def from_values(cls, size, initial_value, values):
+        """
+        Creates a board from a grid of tile values, as returned by
+        Game.peek_board().
+
+        Args:
+            size (int): The size of the board's side.
+            initial_value (int): The value of the base tile in the game.
+            values (list of lists): Tile values, or None for empty cells.
+        """
+        return cls(size, initial_value, board=[
+            [None if values[i][j] is None
+             else Tile(values[i][j], initial_value, i, j)
+             for j in range(size)] for i in range(size)])
 
     def __iter__(self):
         """
@@ -70,39 +140,109 @@ class Board:
         """
         Returns a list of available positions on the board.
         """
-        cells = []
-        for i in range(self.size):
-            for j in range(self.size):
-                if self.tile(i, j) is None:
-                    cells.append((i, j))
-        return cells
+        return [divmod(k, self.size) for k in self.free]
+
+    def reindex(self):
+        """
+        Rebuilds the index of the board from scratch: its free cells, and
+        the number of lines of three like tiles in each row and column.
+        Both are kept up to date as tiles are inserted, deleted, moved and
+        merged, but must be rebuilt if self.board is changed directly.
+        """
+        # Free cells, as sorted indices i * size + j.
+        self.free = [i * self.size + j for i in range(self.size)
+                     for j in range(self.size) if self.board[i][j] is None]
+        # Number of lines of three like tiles in each row and column, or
+        # None if the row or column changed since it was last counted.
+        self.row_triples = [None] * self.size
+        self.column_triples = [None] * self.size
+
+    def count_triples(self):
+        """
+        Returns the number of lines of three like tiles on the board, in a
+        row or a column. Only rows and columns that changed since the last
+        count are counted again.
+        """
+        for k in range(self.size):
+            if self.row_triples[k] is None:
+                self.row_triples[k] = count_triples(self.board[k])
+            if self.column_triples[k] is None:
+                self.column_triples[k] = count_triples(
+                    [row[k] for row in self.board])
+        return sum(self.row_triples) + sum(self.column_triples)
+
+    def put(self, i, j, tile):
+        """
+        Puts a tile, or None, at (i, j), keeping the index of the board
+        up to date.
+        """
+        if self.board[i][j] is None:
+            if tile is not None:
+                del self.free[bisect.bisect_left(
+                    self.free, i * self.size + j)]
+        elif tile is None:
+            bisect.insort(self.free, i * self.size + j)
+        self.board[i][j] = tile
+        self.touch(i, j)
+
+    def touch(self, i, j):
+        """
+        Marks the row and column of (i, j) as changed.
+        """
+        self.row_snapshots[i] = None
+        self.row_triples[i] = None
+        self.column_triples[j] = None
+
+    def clone(self):
+        """
+        Returns a copy of the board, with copies of all of its tiles.
+        """
+        board = Board(self.size, self.initial_value, board=[
+            [None if tile is None
+             else Tile(tile.value, self.initial_value, tile.i, tile.j)
+             for tile in row] for row in self.board])
+        board.row_snapshots = list(self.row_snapshots)
+        board.row_triples = list(self.row_triples)
+        board.column_triples = list(self.column_triples)
+        return board
 
     def delete(self, tile):
         """
         Deletes a tile from the board.
         """
-        self.board[tile.i][tile.j] = None
+        self.put(tile.i, tile.j, None)
 
     def insert(self, tile):
         """
         Inserts a tile on the board.
         """
-        self.board[tile.i][tile.j] = tile
+        self.put(tile.i, tile.j, tile)
 
-    def insert_random(self, n=1):
+    def insert_random(self, n=1, rng=random):
         """
         Inserts n random tiles on the board.
+
+        Args:
+            n (int): Number of tiles to insert.
+            rng (random.Random, optional): Source of randomness. Defaults
+                to the random module.
+
+        Returns:
+            A list of (i, j, value) tuples, one for each tile inserted.
         """
         try:
-            random_cells = random.sample(self.available(), n)
+            random_cells = rng.sample(self.free, n)
         except ValueError:
             raise ValueError("too many tiles to insert")
-        for i, j in random_cells:
-            if random.random() > 0.9:
+        spawned = []
+        for i, j in [divmod(k, self.size) for k in random_cells]:
+            if rng.random() > 0.9:
                 value = self.initial_value * self.initial_value
             else:
                 value = self.initial_value
             self.insert(Tile(value, self.initial_value, i, j))
+            spawned.append((i, j, value))
+        return spawned
 
     def is_out_of_bounds(self, i, j):
         """
@@ -129,7 +269,7 @@ class Board:
         """
         Checks if the board is already full.
         """
-        return not any([tile is None for row in self.board for tile in row])
+        return len(self.free) == 0
 
     def move_all(self, direction):
         """
@@ -142,14 +282,18 @@ class Board:
         Returns:
             A report of the game state upon merge, listing (1) the total
             value of all merged tiles, (2) the values of the tiles merged,
-            and (3) whether any moves were made on the board itself.
+            (3) whether any moves were made on the board itself, and (4)
+            the indices of the lines that changed, in order: rows when
+            moving left or right, else columns.
         """
 
         report = {
             "score": 0,
             "merged_tiles": [],
-            "moves_made": False
+            "moves_made": False,
+            "changed_lines": []
         }
+        changed_lines = report["changed_lines"]
 
         v, tile_list = {
             BoardMovements.DOWN: ((1, 0), self.tiles_by_column_reversed()),
@@ -169,22 +313,31 @@ class Board:
         # This will always work if the iteration order is correct:
         # for example, if we push all tiles left, we iterate
         # row-wise and from the rightmost column.
+        #
+        # Tiles are visited line by line, so a line that changed is the
+        # last one listed in the report, if it is listed yet.
         for tile in tile_list:
             i = tile.i
             j = tile.j
+            line = i if vi == 0 else j
             while self.is_empty(i + vi, j + vj):
                 i += vi
                 j += vj
             if i != tile.i or j != tile.j:
                 self.move(tile, i, j)
                 report["moves_made"] = True
+                if not changed_lines or changed_lines[-1] != line:
+                    changed_lines.append(line)
             if not self.is_out_of_bounds(i + (2 * vi), j + (2 * vj)) \
                     and self.tile(i + vi, j + vj) == tile \
                     and self.tile(i + (2 * vi), j + (2 * vj)) == tile:
+                if not changed_lines or changed_lines[-1] != line:
+                    changed_lines.append(line)
                 # We do three-way merges here
                 self.board[i + (2 * vi)][j + (2 * vj)
                                          ] += self.board[i + vi][j + vj]
                 self.board[i + (2 * vi)][j + (2 * vj)] += tile
+                self.touch(i + (2 * vi), j + (2 * vj))
                 report["score"] += self.board[i + (2 * vi)][j + (2 * vj)].value
                 report["merged_tiles"].append(
                     self.board[i + (2 * vi)][j + (2 * vj)].to_tuple())
@@ -206,7 +359,7 @@ class Board:
         if not self.is_empty(i, j):
             raise IndexError(
                 "A tile already exists at index {0}, {1}".format(i, j))
-        self.board[i][j] = tile
+        self.put(i, j, tile)
         self.delete(tile)
         tile.i = i
         tile.j = j
@@ -219,20 +372,90 @@ class Board:
             True if the board is full and no more merges can be done
             on the board.
         """
-        if not self.is_full():
-            return False
-        vectors = [(0, 1), (0, -1), (1, 0), (-1, 0)]
-        for tile in self.tiles_by_row():
-            for vector in vectors:
-                i2 = tile.i + (2 * vector[0])
-                j2 = tile.j + (2 * vector[1])
-                i = tile.i + vector[0]
-                j = tile.j + vector[1]
-                if not self.is_out_of_bounds(i2, j2) \
-                        and self.tile(i, j) == tile \
-                        and self.tile(i2, j2) == tile:
-                    return False
-        return True
+        return self.is_full() and self.count_triples() == 0
+
+    def restore(self, snapshot):
+        """
+        Restores the board to a snapshot taken with snapshot(). Only rows
+        that differ from the snapshot are rebuilt.
+
+        Args:
+            snapshot (tuple): Snapshot of a board of the same size.
+        """
+        changed = False
+        for i, row in enumerate(snapshot):
+            if self.row_snapshots[i] is not row:
+                self.board[i] = [
+                    None if value is None
+                    else Tile(value, self.initial_value, i, j)
+                    for j, value in enumerate(row)]
+                self.row_snapshots[i] = row
+                changed = True
+        if changed:
+            self.reindex()
+
+    def snapshot(self):
+        """
+        Returns an immutable snapshot of the board, as a tuple of tuples of
+        tile values. Rows that haven't changed since the last snapshot are
+        shared with it, so this takes O(size) time, plus O(size) for each
+        changed row.
+        """
+        for i, row in enumerate(self.board):
+            if self.row_snapshots[i] is None:
+                self.row_snapshots[i] = tuple(
+                    None if tile is None else tile.value for tile in row)
+        return tuple(self.row_snapshots)
+
+    def successors(self):
+        """
+        Computes the result of moving the board in each direction, without
+        changing the board itself. Rows and columns are read only once,
+        from a snapshot of the board.
+
+        Returns:
+            A dictionary mapping each BoardMovements to a tuple of (1) the
+            board after the move, and (2) the report of the move, in the
+            same format as move_all, with an extra "legal" entry telling
+            whether the move changes the board.
+        """
+        rows = self.snapshot()
+        columns = list(zip(*rows))
+        successors = {}
+        for direction in BoardMovements:
+            by_column = direction in (BoardMovements.UP, BoardMovements.DOWN)
+            reverse = direction in (BoardMovements.DOWN, BoardMovements.RIGHT)
+            report = {
+                "score": 0,
+                "merged_tiles": [],
+                "moves_made": False,
+                "changed_lines": []
+            }
+            new_lines = []
+            for index, line in enumerate(columns if by_column else rows):
+                if reverse:
+                    line = line[::-1]
+                new_line, merges, moved = slide_line(line)
+                if reverse:
+                    new_line.reverse()
+                    merges = [(value, self.size - 1 - k)
+                              for value, k in merges]
+                new_lines.append(new_line)
+                if moved or merges:
+                    report["changed_lines"].append(index)
+                if moved:
+                    report["moves_made"] = True
+                for value, k in merges:
+                    report["score"] += value
+                    report["merged_tiles"].append(
+                        (value, k, index) if by_column else (value, index, k))
+            values = list(zip(*new_lines)) if by_column else new_lines
+            report["legal"] = report["moves_made"] or \
+                len(report["merged_tiles"]) > 0
+            successors[direction] = (
+                Board.from_values(self.size, self.initial_value, values),
+                report)
+        return successors
 
     def tile(self, i, j):
         """
@@ -279,3 +502,11 @@ class Board:
             for j in range(self.size - 1, -1, -1):
                 if self.board[i][j] is not None:
                     yield self.board[i][j]
+
+    def values(self):
+        """
+        Returns the board as a list of rows of tile values, with None for
+        empty cells.
+        """
+        return [[None if tile is None else tile.value for tile in row]
+                for row in self.board]
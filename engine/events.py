@@ -36,8 +36,14 @@ class ViewEvents(events.Events):
 
         end: Raise when a game is ended, through user feedback on the view
             or otherwise. The controller should call game end and clean up.
+
+        undo: Raise when the user wants to take back the last move. The
+            controller should undo it, if there is one.
+
+        redo: Raise when the user wants to make the last undone move again.
+            The controller should redo it, if there is one.
     """
-    __events__ = ('create', 'move', 'keep_playing', 'end')
+    __events__ = ('create', 'move', 'keep_playing', 'end', 'undo', 'redo')
 
 class ControllerEvents(events.Events):
     """
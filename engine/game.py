@@ -5,9 +5,24 @@ Instance of the threefourthree game.
 :Version:    2018-11-25
 """
 
-from .board import Board, BoardMovements, Tile
+import collections
+import copy
+import random
+from array import array
+
+from .board import Board, BoardMovements
+from .packed import PackedBoard
+from .lookup import LookupBoard
+from .stats import InstrumentedBoard
 from enum import Enum
 
+# Board implementations that a Game can be played on, by name.
+BOARD_BACKENDS = {
+    "tiles": Board,
+    "packed": PackedBoard,
+    "lookup": LookupBoard
+}
+
 class GameState(Enum):
     """
     A list of states that the game is possibly in. Used internally
@@ -20,7 +35,8 @@ class GameState(Enum):
 
 class Game:
 
-    def __init__(self, size, initial_value, initial_tiles, win_condition, game_state=None):
+    def __init__(self, size, initial_value, initial_tiles, win_condition, game_state=None,
+                 backend="tiles", undo_limit=0, seed=None):
         """
         Initializes a new three-four-three game.
 
@@ -39,32 +55,212 @@ class Game:
                 This should be in the same format as what self.game_state()
                 returns. (As a consquence, the first three arguments will
                 be ignored.) If None, load a new game.
+            backend (str): Name of the board implementation to play on, one
+                of the keys of BOARD_BACKENDS. "tiles" keeps a grid of Tile
+                objects; "packed" keeps exponents in a bytes buffer, which
+                is much faster but needs an initial_value of 3; "lookup" is
+                a packed board that moves rows through a precomputed table,
+                and is only available for boards up to 6x6.
+            undo_limit (int, optional): Number of moves that can be undone.
+                If 0, moves can't be undone; if None, every move can.
+            seed (int, optional): Seed of the game's own random stream,
+                which picks every tile that spawns. If None, a seed is
+                drawn from the random module. A game loaded from a state
+                with a seed and move list picks up its stream where the
+                saved game left off.
         """
+        if backend not in BOARD_BACKENDS:
+            raise ValueError("{0} is not a valid backend".format(backend))
+        board_class = BOARD_BACKENDS[backend]
+
         if game_state is None:
             if initial_tiles > size * size:
                 raise ValueError("Too many initial tiles")
-            self.board = Board(size, initial_value)
-            self.board.insert_random(initial_tiles)
+            if seed is None:
+                seed = random.randrange(1 << 32)
+            self.rng = random.Random(seed)
+            self.board = board_class(size, initial_value)
+            self.board.insert_random(initial_tiles, self.rng)
             self.game_status = GameState.PLAYING
             self.score = 0
+            self.log = None
         else:
             initial_value = game_state["initial_value"]
             win_condition = game_state["win_condition"]
             size = game_state["size"]
-            board_state = game_state["board"]
-            for i in range(size):
-                for j in range(size):
-                    if board_state[i][j] is not None:
-                        board_state[i][j] = Tile(
-                            board_state[i][j], initial_value, i, j)
-            self.board = Board(size, initial_value, board=board_state)
+            initial_tiles = game_state.get("initial_tiles", initial_tiles)
+            seed = game_state.get("seed")
+            moves = game_state.get("moves", [])
+            if seed is None:
+                seed = random.randrange(1 << 32)
+                moves = []
+            if moves:
+                # Play the saved moves again to bring the random stream
+                # to where the saved game left it.
+                self.rng = Game.replay(size, initial_value, initial_tiles,
+                                       win_condition, seed, moves,
+                                       backend=backend).rng
+            else:
+                self.rng = random.Random(seed)
+            self.board = board_class.from_values(
+                size, initial_value, game_state["board"])
             self.game_status = GameState[game_state["status"]]
             self.score = game_state["score"]
+            self.log = None
+            for direction in moves:
+                self.log = (self.log, direction)
 
         self.size = size
         self.initial_value = initial_value
+        self.initial_tiles = initial_tiles
         self.win_condition = win_condition
+        self.seed = seed
         self.win_tile = initial_value ** win_condition
+        self.backend = backend
+        self.undo_limit = undo_limit
+        self.history = collections.deque(maxlen=undo_limit)
+        self.future = []
+        # The report of the last move, as returned by Board.move_all, and
+        # the (i, j, value) of the tile spawned after it, if any.
+        self.last_report = None
+        self.last_spawn = None
+
+    @classmethod
+    def replay(cls, size, initial_value, initial_tiles, win_condition, seed,
+               moves, backend="tiles"):
+        """
+        Rebuilds a game from its seed and the moves made in it, without
+        going through an interface. Replaying the same moves on different
+        backends gives the same game.
+
+        Args:
+            size, initial_value, initial_tiles, win_condition: Settings of
+                the game, as in Game().
+            seed (int): Seed of the game, as in game_state()["seed"].
+            moves (list of str): Moves made in the game, as in
+                game_state()["moves"]. A move made after the game is won
+                keeps playing.
+            backend (str): Name of the board implementation to replay on.
+
+        Returns:
+            The game after the last move.
+        """
+        game = cls(size, initial_value, initial_tiles, win_condition,
+                   backend=backend, seed=seed)
+        for direction in moves:
+            if game.is_won():
+                game.keep_playing()
+            game.move_board(direction)
+        return game
+
+    def clone(self, seed=None):
+        """
+        Returns an independent copy of the game, including its undo and
+        redo history and the state of its random stream. On the packed
+        backends, the board is copied in constant time. The copy is not
+        instrumented.
+
+        Args:
+            seed (int, optional): If given, the copy spawns tiles from a
+                new random stream with this seed instead, so it can no
+                longer be replayed from its moves.
+        """
+        game = copy.copy(self)
+        game.board = self.board.clone()
+        game.history = self.history.copy()
+        game.future = list(self.future)
+        if seed is None:
+            game.rng = copy.copy(self.rng)
+        else:
+            game.rng = random.Random(seed)
+            game.seed = seed
+        return game
+
+    def instrument(self, stats):
+        """
+        Starts collecting counters and timers of the game's board into a
+        Stats, by wrapping the board in an InstrumentedBoard. An
+        uninstrumented game calls its board directly, so measuring costs
+        nothing unless it is turned on.
+
+        Args:
+            stats (Stats): Where to collect counters and timers. If None,
+                stop collecting them.
+        """
+        if isinstance(self.board, InstrumentedBoard):
+            self.board = self.board.wrapped
+        if stats is not None:
+            self.board = InstrumentedBoard(self.board, stats)
+
+    def moves(self):
+        """
+        Returns the list of moves made in the game so far, one of "up",
+        "down", "left", or "right" each. Undone moves are left out.
+        """
+        moves = []
+        log = self.log
+        while log is not None:
+            log, direction = log
+            moves.append(direction)
+        moves.reverse()
+        return moves
+
+    def snapshot(self):
+        """
+        Returns an immutable snapshot of the game, which can be restored
+        with restore(). Snapshots share unchanged rows with earlier
+        snapshots of the same game (see Board.snapshot), so they are cheap
+        to take and to keep. The state of the random stream is kept as the
+        bytes of its 32-bit words, about 2.5 KB rather than the 25 KB of
+        the tuple of ints random.getstate() returns.
+        """
+        version, internal, gauss_next = self.rng.getstate()
+        return (self.board.snapshot(), self.score, self.game_status,
+                (version, array("I", internal).tobytes(), gauss_next),
+                self.log)
+
+    def restore(self, snapshot):
+        """
+        Restores the game to a snapshot taken with snapshot(). The random
+        stream goes back too, so a move made again after an undo spawns
+        the same tile.
+        """
+        board_snapshot, self.score, self.game_status, rng_state, \
+            self.log = snapshot
+        version, internal, gauss_next = rng_state
+        self.board.restore(board_snapshot)
+        self.rng.setstate((version, tuple(array("I", internal)), gauss_next))
+
+    def can_undo(self):
+        """
+        Check if there is a move to undo.
+        """
+        return len(self.history) > 0
+
+    def can_redo(self):
+        """
+        Check if there is an undone move to redo.
+        """
+        return len(self.future) > 0
+
+    def undo(self):
+        """
+        Undoes the last move, including the tile that spawned after it.
+        """
+        if not self.can_undo():
+            raise RuntimeError("No moves to undo")
+        self.future.append(self.snapshot())
+        self.restore(self.history.pop())
+
+    def redo(self):
+        """
+        Redoes the last undone move. Making a new move clears the moves
+        that can be redone.
+        """
+        if not self.can_redo():
+            raise RuntimeError("No moves to redo")
+        self.history.append(self.snapshot())
+        self.restore(self.future.pop())
 
     def game_state(self):
         """
@@ -78,7 +274,11 @@ class Game:
             (4) the size of the board;
             (5) the value of the base tile; and
             (6) the win condition; i.e. base tile ** win condition is
-                the winning tile.
+                the winning tile;
+            (7) the number of tiles the game started with;
+            (8) the seed of the game's random stream; and
+            (9) the moves made so far, from which Game.replay() can
+                rebuild the game.
         """
         return {
             "board": self.peek_board(),
@@ -86,7 +286,10 @@ class Game:
             "status": str(self.game_status)[10:],
             "size": self.size,
             "initial_value": self.initial_value,
-            "win_condition": self.win_condition
+            "win_condition": self.win_condition,
+            "initial_tiles": self.initial_tiles,
+            "seed": self.seed,
+            "moves": self.moves()
         }
 
     def peek_board(self):
@@ -94,8 +297,7 @@ class Game:
         Returns a quick "peek" at the board: all tiles on the board have
         been replaced with their values.
         """
-        return [[None if tile is None else tile.value for tile in row]
-                for row in self.board.board]
+        return self.board.values()
 
     def move_board(self, direction):
         """
@@ -115,20 +317,89 @@ class Game:
         }
         direction_value = directions_dict[direction]
 
+        if self.undo_limit != 0:
+            before = self.snapshot()
+        self.log = (self.log, direction)
         report = self.board.move_all(direction_value)
+        self.last_report = report
         self.score += report["score"]
+        if self.undo_limit != 0 and \
+                (report["moves_made"] or report["merged_tiles"]):
+            self.history.append(before)
+            self.future.clear()
 
         # check for win/lose conditions
         if self.board.no_moves_possible():
             self.game_status = GameState.LOST
         if not self.is_continued() and self.win_tile in [t[0] for t in report["merged_tiles"]]:
             self.game_status = GameState.WON
+        self.last_spawn = None
         if not self.is_over() and report["moves_made"]:
             try:
-                self.board.insert_random()
+                self.last_spawn = self.board.insert_random(1, self.rng)[0]
             except ValueError:
                 pass
 
+    def move_many(self, directions):
+        """
+        Moves the board towards each of a sequence of directions in turn,
+        stopping early once the game is won or lost. Every direction is
+        checked before any move is made.
+
+        Args:
+            directions (list of str): Directions to move the board
+                towards, each one of "up", "down", "left", "right".
+
+        Returns:
+            A report of the moves, with (1) the score gained; (2) the
+            number of moves that changed the board; (3) why the moves
+            stopped: "won" or "lost" if the game ended, else "done"; and
+            (4) the tile that spawned after each direction moved towards,
+            changing the board or not, as in last_spawn.
+        """
+        for direction in directions:
+            if direction not in ["up", "down", "left", "right"]:
+                raise ValueError(
+                    "{0} is not a valid direction".format(direction))
+        score = self.score
+        moves_made = 0
+        spawns = []
+        for direction in directions:
+            if self.is_over():
+                break
+            self.move_board(direction)
+            report = self.last_report
+            if report["moves_made"] or report["merged_tiles"]:
+                moves_made += 1
+            spawns.append(self.last_spawn)
+
+        if self.is_won():
+            end_reason = "won"
+        elif self.is_lost():
+            end_reason = "lost"
+        else:
+            end_reason = "done"
+        return {
+            "score": self.score - score,
+            "moves_made": moves_made,
+            "end_reason": end_reason,
+            "spawns": spawns
+        }
+
+    def successors(self):
+        """
+        Computes the result of moving the board in each direction, before
+        any new tile spawns, without changing the game. See
+        Board.successors.
+
+        Returns:
+            A dictionary mapping each direction, one of "up", "down",
+            "left", or "right", to a tuple of the board after the move and
+            the report of the move.
+        """
+        return {direction.name.lower(): successor
+                for direction, successor in self.board.successors().items()}
+
     def is_over(self):
         """
         Check if the game is over, i.e. no more moves should be done on the
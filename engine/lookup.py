@@ -0,0 +1,278 @@
+"""
+Precomputed row transitions for packed boards.
+"""
+
+import itertools
+import os
+
+from .packed import PACKED_BASE, PackedBoard, slide_row
+
+# Largest exponent a table covers by default. With the standard 6x6 board
+# and a base tile of 3 the game is won at 3 ** 10, so this covers every
+# row up to the win; rows with larger tiles fall back to slide_row.
+DEFAULT_MAX_EXPONENT = 10
+
+# Tables with more rows than this are not built, as they would take too
+# long to compute and too much memory to hold.
+MAX_TABLE_ROWS = 1 << 24
+
+# Largest number of moved rows a table keeps at hand for each direction
+# of a move; see RowTable.move.
+MAX_MOVES = 1 << 16
+
+# Directory where tables are cached between runs.
+CACHE_DIR = os.environ.get(
+    "TFT_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache",
+                                  "threefourthree"))
+
+# Header of cached tables. Bumped whenever slide_row changes, so tables
+# cached by older versions are built again.
+TABLE_MAGIC = b"TFTR\x01"
+
+# Digits of the numbers rows are read as, by exponent.
+DIGITS = b"0123456789abcdefghijklmnopqrstuvwxyz"
+
+_tables = {}
+
+def table_path(size, max_exponent):
+    """
+    Returns the path of the file a row table is cached in.
+
+    Args:
+        size (int): Length of a row.
+        max_exponent (int): Largest exponent covered by the table.
+    """
+    return os.path.join(CACHE_DIR, "rows-{0}-{1}.bin".format(
+        size, max_exponent))
+
+class RowTable:
+    """
+    The result of moving every possible row of a given size towards its
+    start, for rows whose exponents are at most max_exponent.
+
+    Rows are numbered by reading their exponents as the digits of a
+    number in base (max_exponent + 1), most significant first. Record n
+    of the table is the row numbered n after the move, then a byte set if
+    any tile changed its position, then (exponent, index) byte pairs for
+    each merge, padded with zeroes.
+
+    Rows that are moved are also kept decoded in a dictionary keyed on
+    their bytes, so moving a row seen before is a single lookup.
+    """
+
+    def __init__(self, size, max_exponent, records=None):
+        """
+        Initializes a new RowTable.
+
+        Args:
+            size (int): Length of a row.
+            max_exponent (int): Largest exponent covered by the table.
+            records (bytes, optional): Precomputed records, as stored in
+                self.records. If None, the table is computed.
+        """
+        self.size = size
+        self.max_exponent = max_exponent
+        self.radix = max_exponent + 1
+        # A merge turns three tiles into one, and a row keeps at least
+        # one tile after merging.
+        self.max_merges = (size - 1) // 2
+        self.record_size = size + 1 + 2 * self.max_merges
+        if self.radix ** size > MAX_TABLE_ROWS or self.radix > len(DIGITS):
+            raise ValueError("no row table for rows of size {0}".format(size))
+        # Turns the exponents of a row into the digits of its number, so
+        # that int() reads it without a loop over its cells. Exponents
+        # beyond the table become invalid digits.
+        self.digits = bytes.maketrans(
+            bytes(range(256)),
+            DIGITS[:self.radix] + b"!" * (256 - self.radix))
+        if records is None:
+            records = self.build()
+        elif len(records) != self.record_size * self.radix ** size:
+            raise ValueError("row table has the wrong number of records")
+        self.records = records
+        # Decoded moves of rows towards their start, then their end.
+        self.moves = ({}, {})
+
+    def build(self):
+        """
+        Computes the records of every row, in order.
+        """
+        records = bytearray()
+        padding = bytes(2 * self.max_merges)
+        for row in itertools.product(range(self.radix), repeat=self.size):
+            new_row, merges, moved = slide_row(row)
+            record = bytearray(new_row)
+            record.append(moved)
+            for e, k in merges:
+                record += bytes((e, k))
+            records += record
+            records += padding[:self.record_size - len(record)]
+        return bytes(records)
+
+    def lookup(self, row):
+        """
+        Returns the result of moving a row towards its start, in the same
+        format as slide_row.
+
+        Args:
+            row (bytes): Exponents of the row, none larger than
+                self.max_exponent.
+        """
+        start = int(row.translate(self.digits), self.radix) * self.record_size
+        record = self.records[start:start + self.record_size]
+        size = self.size
+        merges = []
+        for k in range(size + 1, self.record_size, 2):
+            if record[k] == 0:
+                break
+            merges.append((record[k], record[k + 1]))
+        return record[:size], merges, record[size] == 1
+
+    def move(self, row, reverse):
+        """
+        Returns the result of moving a row towards its start, or towards
+        its end if reverse is set, in the same format as
+        PackedBoard.move_line, with the merges as a tuple. Results are
+        kept for the next time the row is moved, up to MAX_MOVES rows per
+        direction; rows with exponents beyond the table are moved with
+        slide_row.
+
+        Args:
+            row (bytes): Exponents of the row.
+            reverse (bool): Whether the tiles move towards the end of
+                the row.
+        """
+        moves = self.moves[reverse]
+        result = moves.get(row)
+        if result is not None:
+            return result
+        in_table = max(row) <= self.max_exponent
+        line = row[::-1] if reverse else row
+        if in_table:
+            new_row, merges, moved = self.lookup(line)
+        else:
+            new_row, merges, moved = slide_row(line)
+            new_row = bytes(new_row)
+        if reverse:
+            last = len(row) - 1
+            new_row = new_row[::-1]
+            merges = [(e, last - k) for e, k in merges]
+        result = (new_row, tuple(merges), moved)
+        if in_table and len(moves) < MAX_MOVES:
+            moves[row] = result
+        return result
+
+    @classmethod
+    def load(cls, size, max_exponent):
+        """
+        Loads a table from the disk cache, computing and caching it if it
+        is not there yet. A cache that can't be read or written is
+        ignored.
+
+        Args:
+            size (int): Length of a row.
+            max_exponent (int): Largest exponent covered by the table.
+        """
+        path = table_path(size, max_exponent)
+        try:
+            with open(path, "rb") as infile:
+                if infile.read(len(TABLE_MAGIC)) == TABLE_MAGIC:
+                    return cls(size, max_exponent, infile.read())
+        except (OSError, ValueError):
+            pass
+
+        table = cls(size, max_exponent)
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            temp_path = "{0}.{1}.tmp".format(path, os.getpid())
+            with open(temp_path, "wb") as outfile:
+                outfile.write(TABLE_MAGIC)
+                outfile.write(table.records)
+            os.replace(temp_path, path)
+        except OSError:
+            pass
+        return table
+
+def row_table(size, max_exponent=DEFAULT_MAX_EXPONENT):
+    """
+    Returns the RowTable for rows of the given size, loading it the first
+    time it is asked for.
+
+    Args:
+        size (int): Length of a row.
+        max_exponent (int): Largest exponent covered by the table.
+    """
+    key = (size, max_exponent)
+    if key not in _tables:
+        _tables[key] = RowTable.load(size, max_exponent)
+    return _tables[key]
+
+def preload(size, max_exponent=DEFAULT_MAX_EXPONENT):
+    """
+    Loads the RowTable for rows of the given size, building and caching
+    it if needed. Called before worker processes are started, so that
+    they load the table from the cache rather than all race to build it.
+
+    Args:
+        size (int): Length of a row.
+        max_exponent (int): Largest exponent covered by the table.
+    """
+    row_table(size, max_exponent)
+
+class LookupBoard(PackedBoard):
+    """
+    A packed board, part of the TFT engine, that moves each row or column
+    with a single lookup in a RowTable instead of walking its tiles.
+
+    The table is loaded on the first move, and shared between all boards
+    of the same size.
+    """
+
+    def __init__(self, size, initial_value, cells=None,
+                 max_exponent=DEFAULT_MAX_EXPONENT):
+        """
+        Initializes a new LookupBoard.
+
+        Args:
+            size (int): The size of the board's side.
+            initial_value (int): The value of the base tile in the game.
+                Must be 3.
+            cells (bytes, optional): Packed cells to load in. If None, the
+                board will be empty.
+            max_exponent (int): Largest exponent covered by the row table.
+        """
+        if (max_exponent + 1) ** size > MAX_TABLE_ROWS:
+            raise ValueError("no row table for boards of size {0}"
+                             .format(size))
+        super().__init__(size, initial_value, cells)
+        self.max_exponent = max_exponent
+        self._table = None
+
+    @property
+    def table(self):
+        """RowTable: Table of row transitions for this board."""
+        if self._table is None:
+            self._table = row_table(self.size, self.max_exponent)
+        return self._table
+
+    def move_line(self, line, reverse):
+        """
+        Moves all tiles of a single row or column towards its start, or
+        towards its end if reverse is set. See PackedBoard.move_line.
+        """
+        return self.table.move(line, reverse)
+
+def search_board(size, initial_value=PACKED_BASE):
+    """
+    Returns an empty board of the fastest packed backend available for a
+    board size, to move positions on during a search: a LookupBoard where
+    its row table can be built, else a PackedBoard.
+
+    Args:
+        size (int): The size of the board's side.
+        initial_value (int): The value of the base tile. Must be 3.
+    """
+    try:
+        return LookupBoard(size, initial_value)
+    except ValueError:
+        return PackedBoard(size, initial_value)
@@ -0,0 +1,470 @@
+"""
+A board of tiles packed into a bytes buffer of exponents.
+"""
+
+import copy
+import random
+
+from .board import BoardMovements, slide_line
+from .tile import Tile
+
+# The only base tile for which tile values stay powers of the base under
+# three - way merges, since merging three like tiles triples their value.
+PACKED_BASE = 3
+
+# POWERS[e] is the value of a tile with exponent e; exponent 0 is an
+# empty cell. A cell is one byte wide, so exponents go up to 255.
+POWERS = [None] + [PACKED_BASE ** e for e in range(1, 256)]
+
+# Largest number of line moves PackedBoard.afterstates remembers in a
+# cache, for each direction.
+MAX_SLIDES = 1 << 16
+
+def exponent_of(value, base=PACKED_BASE):
+    """
+    Returns the exponent e such that base ** e == value.
+
+    Args:
+        value (int): Value of a tile.
+        base (int): Value of the base tile.
+    """
+    e = 0
+    power = 1
+    while power < value:
+        power *= base
+        e += 1
+    if power != value:
+        raise ValueError("{0} is not a power of {1}".format(value, base))
+    return e
+
+# Exponent of the tile three tiles of an exponent merge into: merging
+# triples their value, i.e. adds one to their exponent.
+next_exponent = (1).__add__
+
+def slide_row(row):
+    """
+    Pushes a row of exponents towards index 0 and merges like tiles
+    three - wise; see slide_line.
+
+    Args:
+        row (sequence of int): Exponents of the tiles in the row, in the
+            order the tiles are visited, i.e. index 0 is next to the wall
+            the tiles move towards. Empty cells are 0.
+
+    Returns:
+        A tuple of (1) the new row, as a list of exponents, (2) a list of
+        (exponent, index) pairs, one for each merge in the order they were
+        done, and (3) whether any tile changed its position.
+    """
+    return slide_line(row, 0, next_exponent)
+
+class PackedBoard:
+    """
+    A board of tiles, part of the TFT engine, that stores each cell as the
+    exponent of its tile (log base initial_value) in one byte of an
+    immutable bytes buffer. Cell (i, j) is byte i * size + j, and empty
+    cells are 0.
+
+    PackedBoard is a drop-in alternative to Board: Tile objects are only
+    built when asked for, through tile() or by iterating the board. As the
+    three - way merge triples the value of a tile, the base tile must be 3.
+    """
+
+    def __init__(self, size, initial_value, cells=None):
+        """
+        Initializes a new PackedBoard.
+
+        Args:
+            size (int): The size of the board's side.
+            initial_value (int): The value of the base tile in the game.
+                Must be 3.
+            cells (bytes, optional): Packed cells to load in. If None, the
+                board will be empty.
+        """
+        if initial_value != PACKED_BASE:
+            raise ValueError("packed boards need an initial value of {0}"
+                             .format(PACKED_BASE))
+        if cells is None:
+            cells = bytes(size * size)
+        self.cells = cells
+        self.size = size
+        self.initial_value = initial_value
+
+    @classmethod
+    def from_values(cls, size, initial_value, values):
+        """
+        Creates a board from a grid of tile values, as returned by
+        Game.peek_board().
+
+        Args:
+            size (int): The size of the board's side.
+            initial_value (int): The value of the base tile in the game.
+            values (list of lists): Tile values, or None for empty cells.
+        """
+        return cls(size, initial_value, bytes(
+            0 if value is None else exponent_of(value, initial_value)
+            for row in values for value in row))
+
+    @property
+    def board(self):
+        """
+        list of lists of Tiles: The board, in the same layout as
+        Board.board. Tiles are built anew on every access.
+        """
+        return [[self.tile(i, j) for j in range(self.size)]
+                for i in range(self.size)]
+
+    def __iter__(self):
+        """
+        Returns iter(self).
+        """
+        return iter(self.board)
+
+    def __len__(self):
+        """
+        Returns len(self).
+        """
+        return self.size
+
+    def __str__(self):
+        """
+        Returns str(self).
+        """
+        return '\n'.join([
+            ' '.join([
+                str(tile) if tile is not None else "[    ]" for tile in row
+            ]) for row in self.board
+        ])
+
+    def exponent(self, i, j):
+        """
+        Returns the exponent of the tile at (i, j), or 0 if it is empty.
+
+        Args:
+            i (int): Row index.
+            j (int): Column index.
+        """
+        return self.cells[i * self.size + j]
+
+    def set_exponent(self, i, j, e):
+        """
+        Sets the exponent of the tile at (i, j); 0 empties the cell.
+
+        Args:
+            i (int): Row index.
+            j (int): Column index.
+            e (int): Exponent of the tile.
+        """
+        k = i * self.size + j
+        self.cells = self.cells[:k] + bytes((e,)) + self.cells[k + 1:]
+
+    def values(self):
+        """
+        Returns the board as a list of rows of tile values, with None for
+        empty cells.
+        """
+        size = self.size
+        cells = self.cells
+        return [[POWERS[e] for e in cells[k:k + size]]
+                for k in range(0, size * size, size)]
+
+    def available(self):
+        """
+        Returns a list of available positions on the board.
+        """
+        size = self.size
+        return [divmod(k, size) for k, e in enumerate(self.cells) if e == 0]
+
+    def clone(self):
+        """
+        Returns a copy of the board. As cells are immutable, this takes
+        constant time: both boards share them until either one changes.
+        """
+        return copy.copy(self)
+
+    def delete(self, tile):
+        """
+        Deletes a tile from the board.
+        """
+        self.set_exponent(tile.i, tile.j, 0)
+
+    def insert(self, tile):
+        """
+        Inserts a tile on the board.
+        """
+        self.set_exponent(
+            tile.i, tile.j, exponent_of(tile.value, self.initial_value))
+
+    def insert_random(self, n=1, rng=random):
+        """
+        Inserts n random tiles on the board. Draws from rng in the same
+        order as Board.insert_random, so both boards spawn the same tiles
+        under the same seed.
+
+        Args:
+            n (int): Number of tiles to insert.
+            rng (random.Random, optional): Source of randomness. Defaults
+                to the random module.
+
+        Returns:
+            A list of (i, j, value) tuples, one for each tile inserted.
+        """
+        try:
+            random_cells = rng.sample(self.available(), n)
+        except ValueError:
+            raise ValueError("too many tiles to insert")
+        cells = bytearray(self.cells)
+        spawned = []
+        for i, j in random_cells:
+            e = 2 if rng.random() > 0.9 else 1
+            cells[i * self.size + j] = e
+            spawned.append((i, j, POWERS[e]))
+        self.cells = bytes(cells)
+        return spawned
+
+    def is_out_of_bounds(self, i, j):
+        """
+        Checks if a certain position (i, j) is out of the bounds
+        of the board.
+
+        Args:
+            i (int): Row index.
+            j (int): Column index.
+        """
+        return not (0 <= i < self.size and 0 <= j < self.size)
+
+    def is_empty(self, i, j):
+        """
+        Checks if a position (i, j) on the board is empty.
+
+        Args:
+            i (int): Row index.
+            j (int): Column index.
+        """
+        return not self.is_out_of_bounds(i, j) and self.exponent(i, j) == 0
+
+    def is_full(self):
+        """
+        Checks if the board is already full.
+        """
+        return 0 not in self.cells
+
+    def lines(self, by_column):
+        """
+        Returns the rows of the board, or its columns if by_column is set,
+        as a list of bytes.
+        """
+        size = self.size
+        cells = self.cells
+        if by_column:
+            return [cells[j::size] for j in range(size)]
+        return [cells[k:k + size] for k in range(0, size * size, size)]
+
+    def move_line(self, line, reverse):
+        """
+        Moves all tiles of a single row or column towards its start, or
+        towards its end if reverse is set.
+
+        Args:
+            line (bytes): Exponents of the row or column.
+            reverse (bool): Whether the tiles move towards the end of
+                the line.
+
+        Returns:
+            A tuple of (1) the new line, as bytes, (2) a list of
+            (exponent, index) pairs, one for each merge, and (3) whether
+            any tile changed its position.
+        """
+        if not reverse:
+            new_line, merges, moved = slide_line(line, 0, next_exponent)
+            return bytes(new_line), merges, moved
+        new_line, merges, moved = slide_line(line[::-1], 0, next_exponent)
+        last = len(line) - 1
+        return bytes(reversed(new_line)), \
+            [(e, last - k) for e, k in merges], moved
+
+    def move_lines(self, lines, direction):
+        """
+        Moves the tiles of every row or column of the board, without
+        changing the board itself.
+
+        Args:
+            lines (list of bytes): The rows of the board if the direction
+                is LEFT or RIGHT, else its columns, as returned by lines().
+            direction (BoardMovements): The direction of the tiles' movement.
+
+        Returns:
+            A tuple of (1) the new cells, and (2) a report in the same
+            format as Board.move_all.
+        """
+        report = {
+            "score": 0,
+            "merged_tiles": [],
+            "moves_made": False,
+            "changed_lines": []
+        }
+
+        size = self.size
+        by_column = direction in (BoardMovements.UP, BoardMovements.DOWN)
+        reverse = direction in (BoardMovements.DOWN, BoardMovements.RIGHT)
+
+        cells = None
+        for index, line in enumerate(lines):
+            new_line, merges, moved = self.move_line(line, reverse)
+            if new_line == line:
+                continue
+            report["changed_lines"].append(index)
+            if cells is None:
+                cells = bytearray(self.cells)
+            if by_column:
+                cells[index::size] = new_line
+            else:
+                cells[index * size:(index + 1) * size] = new_line
+            if moved:
+                report["moves_made"] = True
+            for e, k in merges:
+                report["score"] += POWERS[e]
+                if by_column:
+                    report["merged_tiles"].append((POWERS[e], k, index))
+                else:
+                    report["merged_tiles"].append((POWERS[e], index, k))
+
+        if cells is None:
+            return self.cells, report
+        return bytes(cells), report
+
+    def move_all(self, direction):
+        """
+        Moves all tiles onto a certain direction and merges like tiles
+        three - wise.
+
+        Args:
+            direction (BoardMovements): The direction of the tiles' movement.
+
+        Returns:
+            A report of the game state upon merge, in the same format as
+            Board.move_all.
+        """
+        by_column = direction in (BoardMovements.UP, BoardMovements.DOWN)
+        self.cells, report = self.move_lines(self.lines(by_column), direction)
+        return report
+
+    def successors(self):
+        """
+        Computes the result of moving the board in each direction, without
+        changing the board itself. Rows and columns are read only once.
+
+        Returns:
+            A dictionary mapping each BoardMovements to a tuple of (1) the
+            board after the move, and (2) the report of the move, in the
+            same format as Board.move_all, with an extra "legal" entry
+            telling whether the move changes the board.
+        """
+        rows = self.lines(False)
+        columns = self.lines(True)
+        successors = {}
+        for direction in BoardMovements:
+            by_column = direction in (BoardMovements.UP, BoardMovements.DOWN)
+            cells, report = self.move_lines(
+                columns if by_column else rows, direction)
+            report["legal"] = cells != self.cells
+            board = self.clone()
+            board.cells = cells
+            successors[direction] = (board, report)
+        return successors
+
+    def afterstates(self, slides=None):
+        """
+        Computes the cells of the board after a move in each direction,
+        without changing the board itself. Lighter than successors(): no
+        boards or merge lists are built, and given a cache, the moves of
+        lines are remembered in it, so lines seen before are not moved
+        again.
+
+        Args:
+            slides (tuple, optional): Cache of the results of moving lines
+                towards their start, then towards their end, as a pair of
+                dictionaries mapping a line to its (new line, score
+                gained, whether any tile moved). Each keeps up to
+                MAX_SLIDES lines. If None, nothing is remembered.
+
+        Returns:
+            A dictionary mapping each BoardMovements to a tuple of (1) the
+            cells after the move, (2) the score gained, and (3) whether any
+            tile changed position, i.e. whether a tile will spawn.
+        """
+        size = self.size
+        rows = self.lines(False)
+        columns = self.lines(True)
+        afterstates = {}
+        if slides is None:
+            slides = ({}, {})
+        for direction in BoardMovements:
+            by_column = direction in (BoardMovements.UP, BoardMovements.DOWN)
+            reverse = direction in (BoardMovements.DOWN, BoardMovements.RIGHT)
+            cache = slides[reverse]
+            new_lines = []
+            score = 0
+            moved = False
+            for line in columns if by_column else rows:
+                slide = cache.get(line)
+                if slide is None:
+                    new_line, merges, line_moved = self.move_line(line, reverse)
+                    slide = (bytes(new_line),
+                             sum([POWERS[e] for e, k in merges]), line_moved)
+                    if len(cache) < MAX_SLIDES:
+                        cache[line] = slide
+                new_lines.append(slide[0])
+                score += slide[1]
+                moved = moved or slide[2]
+            if by_column:
+                new_cells = bytearray(size * size)
+                for j, column in enumerate(new_lines):
+                    new_cells[j::size] = column
+                new_cells = bytes(new_cells)
+            else:
+                new_cells = b"".join(new_lines)
+            afterstates[direction] = (new_cells, score, moved)
+        return afterstates
+
+    def no_moves_possible(self):
+        """
+        Checks if no more moves are possible.
+
+        Returns:
+            True if the board is full and no more merges can be done
+            on the board.
+        """
+        if 0 in self.cells:
+            return False
+        for line in self.lines(False) + self.lines(True):
+            for k in range(len(line) - 2):
+                if line[k] == line[k + 1] == line[k + 2]:
+                    return False
+        return True
+
+    def restore(self, snapshot):
+        """
+        Restores the board to a snapshot taken with snapshot().
+        """
+        self.cells = snapshot
+
+    def snapshot(self):
+        """
+        Returns an immutable snapshot of the board. Since cells are
+        immutable, this is the cells themselves, and takes constant time.
+        """
+        return self.cells
+
+    def tile(self, i, j):
+        """
+        Returns the tile at (i, j), or None if the cell is empty.
+
+        Args:
+            i (int): Row index.
+            j (int): Column index.
+        """
+        e = self.exponent(i, j)
+        if e == 0:
+            return None
+        return Tile(POWERS[e], self.initial_value, i, j)
@@ -0,0 +1,342 @@
+"""
+Binary save files of three-four-three games, with a journal of moves.
+"""
+
+import os
+import struct
+
+from .board import BoardMovements
+from .game import Game, GameState
+from .packed import PACKED_BASE, POWERS, exponent_of
+
+# Header of a snapshot: magic, version, board size, base tile, win
+# condition, initial tiles, status, score, seed, epoch, number of moves,
+# and whether the random stream has a pending gauss() value.
+SNAPSHOT_HEADER = struct.Struct("<4sBBIBIBQQIIB")
+SNAPSHOT_MAGIC = b"TFTS"
+SNAPSHOT_VERSION = 1
+
+# Internal state of random.Random, without its version and gauss value.
+RANDOM_STATE = struct.Struct("<625I")
+GAUSS = struct.Struct("<d")
+
+# Header of a journal: magic and the epoch of the snapshot it follows.
+JOURNAL_HEADER = struct.Struct("<4sI")
+JOURNAL_MAGIC = b"TFTJ"
+
+# A journal record: what happened, and the cell and exponent of the tile
+# that spawned after it, if any.
+RECORD = struct.Struct("<BHB")
+NO_SPAWN = 0xFFFF
+
+# Kind of the journal record of keeping playing after a win; moves are
+# recorded as the values of BoardMovements.
+KEEP_PLAYING = 5
+
+class SaveFile:
+    """
+    A saved game, kept as a compact binary snapshot plus an append-only
+    journal of everything done since, so that saving takes constant time
+    per move. The journal sits next to the snapshot, at path + ".journal".
+
+    A snapshot holds the header of the game, its board as one exponent
+    byte per cell (log base 3, 0 for empty cells), the state of its
+    random stream, and its moves. Each journal record is four
+    bytes: a move or keep playing, and the tile that spawned after it.
+    Records are written to disk and synced in batches, and once the
+    journal grows long enough, it is folded into a new snapshot.
+
+    Snapshots and journals carry an epoch, which goes up with every new
+    snapshot: a journal left over from an older snapshot, e.g. after a
+    crash right after the snapshot was replaced, is ignored, since the
+    new snapshot already includes it.
+
+    As an undo may go back past the snapshot, undoing and redoing write
+    a new snapshot rather than a record. Undo and redo history is only
+    kept for the moves in the journal.
+    """
+
+    def __init__(self, path, sync_every=16, compact_every=4096):
+        """
+        Initializes a new SaveFile. Nothing is read or written yet.
+
+        Args:
+            path (str): Path of the snapshot.
+            sync_every (int): Number of records written to the journal
+                at a time, after which it is synced to disk.
+            compact_every (int): Number of journal records after which a
+                new snapshot is written and the journal is started over.
+        """
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.sync_every = sync_every
+        self.compact_every = compact_every
+        self.game = None
+        self.epoch = 0
+        self.journal = None
+        self.buffer = bytearray()
+        self.records = 0
+
+    def exists(self):
+        """
+        Checks if there is a saved game.
+        """
+        return os.path.exists(self.path)
+
+    def save(self, game):
+        """
+        Writes a snapshot of a game, replacing the saved game if any, and
+        starts journaling it: from then on, record_move() should be called
+        for every move, record(KEEP_PLAYING) when the game is kept going,
+        and save() again after an undo or redo.
+        """
+        self.close()
+        self.game = game
+        self.epoch = max(self.epoch, self.journal_epoch()) + 1
+        data = encode_snapshot(game, self.epoch)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as outfile:
+            outfile.write(data)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.replace(temp_path, self.path)
+        self.open_journal(truncate=True)
+
+    def load(self, backend="tiles", undo_limit=0):
+        """
+        Loads the saved game: reads its snapshot, then replays its
+        journal. The game keeps being journaled.
+
+        Args:
+            backend (str): Board backend of the game; see Game.
+            undo_limit (int, optional): Number of moves that can be
+                undone; see Game.
+
+        Returns:
+            The saved game.
+        """
+        self.close()
+        with open(self.path, "rb") as infile:
+            game, self.epoch = decode_snapshot(
+                infile.read(), backend, undo_limit)
+        self.game = game
+        self.records = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "rb") as infile:
+                data = infile.read()
+            if len(data) >= JOURNAL_HEADER.size and \
+                    JOURNAL_HEADER.unpack_from(data) == \
+                    (JOURNAL_MAGIC, self.epoch):
+                self.records = replay_journal(game, data)
+        self.open_journal(truncate=self.records == 0)
+        return game
+
+    def journal_epoch(self):
+        """
+        Returns the epoch of the journal on disk, or 0 if there is none.
+        """
+        if not os.path.exists(self.journal_path):
+            return 0
+        with open(self.journal_path, "rb") as infile:
+            data = infile.read(JOURNAL_HEADER.size)
+        if len(data) < JOURNAL_HEADER.size:
+            return 0
+        magic, epoch = JOURNAL_HEADER.unpack(data)
+        return epoch if magic == JOURNAL_MAGIC else 0
+
+    def open_journal(self, truncate):
+        """
+        Opens the journal for appending, starting it over if truncate is
+        set.
+        """
+        if truncate:
+            self.journal = open(self.journal_path, "wb")
+            self.journal.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, self.epoch))
+            self.records = 0
+            self.sync()
+        else:
+            self.journal = open(self.journal_path, "ab")
+            # Drop a record torn by a crash, if any.
+            self.journal.truncate(
+                JOURNAL_HEADER.size + self.records * RECORD.size)
+
+    def record(self, kind, spawn=None):
+        """
+        Appends a record to the journal.
+
+        Args:
+            kind (int): What happened: the value of a BoardMovements, or
+                KEEP_PLAYING.
+            spawn (tuple, optional): The (i, j, value) of the tile that
+                spawned after a move.
+        """
+        if spawn is None:
+            self.buffer += RECORD.pack(kind, NO_SPAWN, 0)
+        else:
+            i, j, value = spawn
+            self.buffer += RECORD.pack(
+                kind, i * self.game.size + j,
+                exponent_of(value, self.game.initial_value))
+        self.records += 1
+        if self.records >= self.compact_every:
+            self.save(self.game)
+        elif len(self.buffer) >= self.sync_every * RECORD.size:
+            self.sync()
+
+    def record_move(self, direction, spawn):
+        """
+        Appends a move of the game to the journal.
+
+        Args:
+            direction (str): Direction of the move, one of "up", "down",
+                "left", or "right".
+            spawn (tuple): The (i, j, value) of the tile that spawned
+                after it, or None; see Game.last_spawn.
+        """
+        self.record(BoardMovements[direction.upper()].value, spawn)
+
+    def sync(self):
+        """
+        Writes out the records not yet written and syncs the journal to
+        disk.
+        """
+        if self.journal is None:
+            return
+        self.journal.write(self.buffer)
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.buffer.clear()
+
+    def close(self):
+        """
+        Syncs and closes the journal, if it is open. The game is no longer
+        journaled.
+        """
+        if self.journal is not None:
+            self.sync()
+            self.journal.close()
+            self.journal = None
+        self.game = None
+
+    def delete(self):
+        """
+        Closes and deletes the saved game, if any.
+        """
+        self.close()
+        for path in (self.path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+def encode_snapshot(game, epoch):
+    """
+    Returns a game as a snapshot in bytes.
+
+    Args:
+        game (Game): The game. Its base tile must be 3, so that all of
+            its tiles are powers of 3.
+        epoch (int): Epoch of the snapshot.
+
+    Raises:
+        ValueError: If the base tile of the game is not 3.
+    """
+    if game.initial_value != PACKED_BASE:
+        raise ValueError("only games with a base tile of {0} can be saved"
+                         .format(PACKED_BASE))
+    internal, gauss = game.rng.getstate()[1:]
+    moves = game.moves()
+    header = SNAPSHOT_HEADER.pack(
+        SNAPSHOT_MAGIC, SNAPSHOT_VERSION, game.size, game.initial_value,
+        game.win_condition, game.initial_tiles, game.game_status.value,
+        game.score, game.seed, epoch, len(moves), gauss is not None)
+    cells = bytes(0 if value is None
+                  else exponent_of(value, game.initial_value)
+                  for row in game.peek_board() for value in row)
+    return b"".join([
+        header, cells, RANDOM_STATE.pack(*internal),
+        GAUSS.pack(gauss) if gauss is not None else b"",
+        bytes(BoardMovements[direction.upper()].value
+              for direction in moves)
+    ])
+
+def decode_snapshot(data, backend="tiles", undo_limit=0):
+    """
+    Rebuilds a game from a snapshot made by encode_snapshot().
+
+    Args:
+        data (bytes): The snapshot.
+        backend (str): Board backend of the game; see Game.
+        undo_limit (int, optional): Number of moves that can be undone;
+            see Game.
+
+    Returns:
+        A tuple of (1) the game, and (2) the epoch of the snapshot.
+
+    Raises:
+        ValueError: If data is not a snapshot.
+    """
+    magic, version, size, initial_value, win_condition, initial_tiles, \
+        status, score, seed, epoch, n_moves, has_gauss = \
+        SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or \
+            initial_value != PACKED_BASE:
+        raise ValueError("not a three-four-three snapshot")
+    offset = SNAPSHOT_HEADER.size
+    cells = data[offset:offset + size * size]
+    offset += size * size
+    internal = RANDOM_STATE.unpack_from(data, offset)
+    offset += RANDOM_STATE.size
+    gauss = None
+    if has_gauss:
+        gauss, = GAUSS.unpack_from(data, offset)
+        offset += GAUSS.size
+    moves = [BoardMovements(kind).name.lower()
+             for kind in data[offset:offset + n_moves]]
+
+    game = Game(size, initial_value, initial_tiles, win_condition,
+                game_state={
+                    "board": [[POWERS[e] for e in cells[k:k + size]]
+                              for k in range(0, size * size, size)],
+                    "score": score,
+                    "status": GameState(status).name,
+                    "size": size,
+                    "initial_value": initial_value,
+                    "win_condition": win_condition,
+                    "initial_tiles": initial_tiles,
+                    "seed": seed,
+                    "moves": []
+                }, backend=backend, undo_limit=undo_limit)
+    # The stream and moves are restored as they were, rather than by
+    # replaying the moves.
+    game.rng.setstate((3, internal, gauss))
+    for direction in moves:
+        game.log = (game.log, direction)
+    return game, epoch
+
+def replay_journal(game, data):
+    """
+    Replays the records of a journal on the game it follows, stopping at
+    a torn record at its end.
+
+    Args:
+        game (Game): The game, as of the snapshot the journal follows.
+        data (bytes): The journal, including its header.
+
+    Returns:
+        The number of records replayed.
+    """
+    records = (len(data) - JOURNAL_HEADER.size) // RECORD.size
+    for k in range(records):
+        kind, cell, e = RECORD.unpack_from(
+            data, JOURNAL_HEADER.size + k * RECORD.size)
+        if kind == KEEP_PLAYING:
+            game.keep_playing()
+        else:
+            game.move_board(BoardMovements(kind).name.lower())
+            spawn = None
+            if game.last_spawn is not None:
+                i, j, value = game.last_spawn
+                spawn = (i * game.size + j,
+                         exponent_of(value, game.initial_value))
+            if spawn != ((cell, e) if cell != NO_SPAWN else None):
+                raise ValueError("journal does not match its snapshot")
+    return records
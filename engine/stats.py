@@ -0,0 +1,161 @@
+"""
+Opt-in counters and timers for the hot paths of the engine.
+"""
+
+import time
+
+class Stats:
+    """
+    Counters and per-phase timers collected from an instrumented Game (see
+    Game.instrument) or Controller (see Controller.instrument).
+
+    Counters:
+        moves: Calls to Board.move_all.
+        merges: Three - way merges done.
+        spawns: Tiles spawned by Board.insert_random.
+
+    Timers:
+        move_all, no_moves_possible, insert_random: Time spent in each
+            method of the board.
+        on_move: Time spent in Controller.on_move, from the view raising
+            the move event to the controller being done with it.
+        dispatch: Time spent dispatching the won and lost events of the
+            controller to the view.
+    """
+
+    def __init__(self, callback=None, interval=1.0):
+        """
+        Initializes a new Stats.
+
+        Args:
+            callback (callable, optional): Called with snapshot() after a
+                move, at most once every interval seconds.
+            interval (float): Least number of seconds between two calls of
+                the callback.
+        """
+        self.callback = callback
+        self.interval = interval
+        self.reset()
+
+    def reset(self):
+        """
+        Sets every counter and timer back to zero.
+        """
+        self.counters = {"moves": 0, "merges": 0, "spawns": 0}
+        # Timers as [number of calls, total seconds].
+        self.timers = {}
+        self.last_report = time.perf_counter()
+
+    def count(self, name, n=1):
+        """
+        Adds n to a counter.
+        """
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def time(self, name, seconds):
+        """
+        Adds one call taking a number of seconds to a timer.
+        """
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = [1, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+
+    def moved(self):
+        """
+        Calls the callback, if any, if it is due.
+        """
+        if self.callback is None:
+            return
+        now = time.perf_counter()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.callback(self.snapshot())
+
+    def snapshot(self):
+        """
+        Returns the counters and timers as a dictionary of plain values,
+        with the number of calls, total seconds and mean seconds per call
+        of each timer.
+        """
+        return {
+            "counters": dict(self.counters),
+            "timers": {name: {"calls": calls, "total": total,
+                              "mean": total / calls}
+                       for name, (calls, total) in self.timers.items()}
+        }
+
+class InstrumentedBoard:
+    """
+    Wraps a board of any backend, timing its move_all, no_moves_possible
+    and insert_random methods into a Stats. Everything else is passed on
+    to the board.
+    """
+
+    def __init__(self, board, stats):
+        """
+        Initializes a new InstrumentedBoard.
+
+        Args:
+            board: The board to wrap.
+            stats (Stats): Where to collect counters and timers.
+        """
+        self.wrapped = board
+        self.stats = stats
+
+    def __getattr__(self, name):
+        """
+        Returns the attribute of the wrapped board.
+        """
+        return getattr(self.wrapped, name)
+
+    def __iter__(self):
+        """
+        Returns iter(self).
+        """
+        return iter(self.wrapped)
+
+    def __len__(self):
+        """
+        Returns len(self).
+        """
+        return len(self.wrapped)
+
+    def __str__(self):
+        """
+        Returns str(self).
+        """
+        return str(self.wrapped)
+
+    def move_all(self, direction):
+        """
+        Times Board.move_all.
+        """
+        start = time.perf_counter()
+        report = self.wrapped.move_all(direction)
+        self.stats.time("move_all", time.perf_counter() - start)
+        self.stats.count("moves")
+        self.stats.count("merges", len(report["merged_tiles"]))
+        self.stats.moved()
+        return report
+
+    def no_moves_possible(self):
+        """
+        Times Board.no_moves_possible.
+        """
+        start = time.perf_counter()
+        result = self.wrapped.no_moves_possible()
+        self.stats.time("no_moves_possible", time.perf_counter() - start)
+        return result
+
+    def insert_random(self, *args, **kwargs):
+        """
+        Times Board.insert_random.
+        """
+        start = time.perf_counter()
+        spawned = self.wrapped.insert_random(*args, **kwargs)
+        self.stats.time("insert_random", time.perf_counter() - start)
+        self.stats.count("spawns", len(spawned))
+        return spawned
@@ -6,6 +6,13 @@ A board tile.
 """
 
 class Tile:
+    """
+    A tile of a Board. Boards keep a tile object per occupied cell, so
+    tiles have slots rather than a __dict__, which makes each one about a
+    third the size.
+    """
+
+    __slots__ = ("value", "i", "j")
 
     def __init__(self, value, base_value, i, j):
         """
@@ -13,7 +20,8 @@ class Tile:
 
         Args:
             value (int): Value of current tile.
-            base_value (int): Value of the initial tile on the board.
+            base_value (int): Value of the initial tile on the board. Not
+                stored; kept for compatibility.
             i (int): Row index of tile.
             j (int): Column index of tile.
         """
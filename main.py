@@ -6,30 +6,75 @@ Main launch file to start the game and process launch options.
 :Version:    v20181013
 """
 
+import json
 import sys
 
-from views import TerminalInterface
-from views import GUIInterface
-from controller import Controller
-
-USAGE = """Usage: python main.py [-d] [--help]
+USAGE = """Usage: python main.py [-d | -c] [--stats] [--simulate] [--sweep] [--train]
+                      [--bench] [--serve] [--help]
 Load the three-four-three game.
     -t              run in terminal mode (default)
     -d              run in desktop mode
+    -c              run in full-screen terminal mode, with arrow keys
+    --stats         print engine counters and timers on exit
+    --simulate      play games headlessly; see --simulate --help
+    --sweep         simulate a grid of game settings; see --sweep --help
+    --train         train the n-tuple network player; see --train --help
+    --bench         benchmark the engine; see --bench --help
+    --serve         host games over TCP; see --serve --help
     -h, --help      show this help message"""
 
 def main():
+    if '--simulate' in sys.argv:
+        from sim.runner import main as simulate
+        simulate([arg for arg in sys.argv[1:] if arg != '--simulate'])
+        exit(0)
+
+    if '--sweep' in sys.argv:
+        from sim.sweep import main as sweep
+        sweep([arg for arg in sys.argv[1:] if arg != '--sweep'])
+        exit(0)
+
+    if '--train' in sys.argv:
+        from ai.ntuple import main as train
+        train([arg for arg in sys.argv[1:] if arg != '--train'])
+        exit(0)
+
+    if '--bench' in sys.argv:
+        from bench.suite import main as bench
+        bench([arg for arg in sys.argv[1:] if arg != '--bench'])
+        exit(0)
+
+    if '--serve' in sys.argv:
+        from server.app import main as serve
+        serve([arg for arg in sys.argv[1:] if arg != '--serve'])
+        exit(0)
+
     if '-h' in sys.argv or '--help' in sys.argv:
         print(USAGE)
         exit(0)
 
+    from controller import Controller
+
+    # Only the interface that is used is imported: the desktop one pulls
+    # in pyglet, which is slow to load.
     if '-d' in sys.argv:
+        from views.gui import GUIInterface
         interface_mode = GUIInterface()
+    elif '-c' in sys.argv:
+        from views.screen import ScreenInterface
+        interface_mode = ScreenInterface()
     else:
+        from views.terminal import TerminalInterface
         interface_mode = TerminalInterface()
 
     controller = Controller(interface=interface_mode)
+    if '--stats' in sys.argv:
+        from engine import Stats
+        controller.instrument(Stats())
     controller.run_interface()
+    if controller.stats is not None:
+        print(json.dumps(controller.stats.snapshot(), indent=2),
+              file=sys.stderr)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,2 @@
+from server.store import SessionStore
+from server.app import GameServer
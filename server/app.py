@@ -0,0 +1,212 @@
+"""
+A server hosting many three-four-three games at once over TCP.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+
+from .store import MAX_SIZE, SessionStore
+
+USAGE = """python main.py --serve [options]"""
+
+# Game settings of a new session, unless the request says otherwise.
+DEFAULT_CONFIG = {
+    "size": 6,
+    "initial_value": 3,
+    "initial_tiles": 8,
+    "win_condition": 10
+}
+
+# Largest number of moves a "moves" request may make.
+MAX_BATCH = 10000
+
+# Batches of more moves than this are made in the default executor of the
+# event loop, so that other sessions keep being served meanwhile.
+EXECUTOR_BATCH = 256
+
+# Settings a request for a new session may give; see SessionStore.create.
+SETTINGS = ("size", "initial_value", "initial_tiles", "win_condition",
+            "undo_limit", "seed")
+
+class GameServer:
+    """
+    Serves game sessions over a line protocol: every request and response
+    is a JSON object on a line of its own. Each connection is served by
+    its own task, and may play any number of sessions.
+
+    Requests:
+        {"op": "new", ...}: Starts a session. Other keys are settings of
+            the game, any of SETTINGS; see SessionStore.create for their
+            ranges.
+        {"op": "state", "session": ID}: Returns the state of a session.
+        {"op": "move", "session": ID, "direction": D}: Moves the board.
+        {"op": "moves", "session": ID, "directions": [D, ...]}: Makes
+            up to MAX_BATCH moves, stopping if the game ends. The response
+            also has the score gained, the number of moves that changed
+            the board and why they stopped; see Game.move_many.
+        {"op": "keep_playing", "session": ID}: Keeps playing a won game.
+        {"op": "undo", "session": ID} and {"op": "redo", "session": ID}:
+            Undoes or redoes a move, if the session allows it.
+        {"op": "close", "session": ID}: Ends a session.
+
+    Responses carry the session ID, and the board, score and status of
+    the game, or an "error" message if the request failed.
+    """
+
+    def __init__(self, store):
+        """
+        Initializes a new GameServer.
+
+        Args:
+            store (SessionStore): Where sessions are kept.
+        """
+        self.store = store
+        self.actions = {
+            "move": lambda game, request: game.move_board(
+                str(request["direction"]).lower()),
+            "keep_playing": lambda game, request: game.keep_playing(),
+            "undo": lambda game, request: game.undo(),
+            "redo": lambda game, request: game.redo(),
+            "state": lambda game, request: None
+        }
+
+    async def handle(self, request):
+        """
+        Handles a request, returning its response.
+
+        Args:
+            request (dict): The request.
+        """
+        op = request.get("op")
+        if op == "new":
+            config = dict(DEFAULT_CONFIG)
+            for key, value in request.items():
+                if key == "op":
+                    continue
+                if key not in SETTINGS:
+                    raise ValueError("unknown setting {0}".format(key))
+                config[key] = value
+            session_id = self.store.create(**config)
+        elif op == "close":
+            await self.store.close(request["session"])
+            return {"session": request["session"], "closed": True}
+        elif op in self.actions or op == "moves":
+            session_id = request["session"]
+        else:
+            raise ValueError("unknown op {0}".format(op))
+
+        async with self.store.session(session_id) as game:
+            if op == "moves":
+                report = await self.move_many(game, request["directions"])
+            else:
+                self.actions.get(op, self.actions["state"])(game, request)
+            response = {
+                "session": session_id,
+                "board": game.peek_board(),
+                "score": game.score,
+                "status": game.game_status.name
+            }
+        if op == "moves":
+            response["score_gained"] = report["score"]
+            response["moves_made"] = report["moves_made"]
+            response["end_reason"] = report["end_reason"]
+        return response
+
+    async def move_many(self, game, directions):
+        """
+        Makes a batch of moves on a game, and returns the report of
+        Game.move_many. Batches of more than EXECUTOR_BATCH moves are made
+        in the default executor; the session is locked meanwhile.
+
+        Raises:
+            ValueError: If directions is not a list of at most MAX_BATCH
+                directions.
+        """
+        if not isinstance(directions, list):
+            raise ValueError("directions must be a list")
+        if len(directions) > MAX_BATCH:
+            raise ValueError("at most {0} moves can be made at once"
+                             .format(MAX_BATCH))
+        directions = [str(direction).lower() for direction in directions]
+        if len(directions) <= EXECUTOR_BATCH:
+            return game.move_many(directions)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, game.move_many, directions)
+
+    async def serve_client(self, reader, writer):
+        """
+        Serves a connection until it is closed.
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line.decode())
+                    if not isinstance(request, dict):
+                        raise ValueError("requests must be JSON objects")
+                    response = await self.handle(request)
+                except KeyError as error:
+                    response = {"error": "no such session or field: {0}"
+                                .format(error)}
+                except (ValueError, TypeError, RuntimeError) as error:
+                    response = {"error": str(error)}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def run(self, host, port):
+        """
+        Serves connections on host:port until interrupted.
+        """
+        loop = asyncio.get_event_loop()
+        server = loop.run_until_complete(
+            asyncio.start_server(self.serve_client, host, port))
+        print("Serving on {0}:{1}".format(host, port), file=sys.stderr)
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+
+def main(argv=None):
+    """
+    Runs the server from the command line.
+
+    Args:
+        argv (list of str, optional): Command line arguments, without the
+            program name. Defaults to sys.argv[1:].
+    """
+    parser = argparse.ArgumentParser(
+        usage=USAGE, description="Host three-four-three games over TCP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3434)
+    parser.add_argument("--sessions-dir", default="sessions",
+                        help="directory idle sessions are written to "
+                        "(default: sessions)")
+    parser.add_argument("--max-sessions", type=int, default=10000,
+                        help="sessions kept in memory (default: 10000)")
+    parser.add_argument("--max-memory", type=int, default=None,
+                        help="estimated megabytes taken by the sessions "
+                        "kept in memory")
+    parser.add_argument("--backend", default="packed",
+                        help="board backend (default: packed)")
+    parser.add_argument("--max-size", type=int, default=MAX_SIZE,
+                        help="largest board side of a session (default: "
+                        "{0})".format(MAX_SIZE))
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    max_bytes = None
+    if args.max_memory is not None:
+        max_bytes = args.max_memory * 1024 * 1024
+    store = SessionStore(args.sessions_dir, args.max_sessions, max_bytes,
+                         args.backend, args.max_size)
+    GameServer(store).run(args.host, args.port)
@@ -0,0 +1,305 @@
+"""
+An LRU store of game sessions, spilling idle sessions to disk.
+"""
+
+import asyncio
+import collections
+import os
+import secrets
+import sys
+
+from engine import Game
+from engine.packed import PACKED_BASE
+from engine.savefile import encode_snapshot, decode_snapshot
+
+# Rough number of bytes a game takes in memory besides its board: the
+# game itself, its random stream (about 2.5 KB of state) and its moves.
+# See the memory benchmark of bench.suite.
+GAME_BYTES = 5120
+
+# Rough number of bytes each snapshot of the undo history takes in memory
+# besides its board: mostly the state of the random stream, kept as 2.5 KB
+# of bytes (see Game.snapshot).
+SNAPSHOT_BYTES = 2700
+
+# Rough number of bytes each cell of a board takes in memory, by backend.
+# Tile boards keep a Tile object per tile; packed boards one byte.
+CELL_BYTES = {
+    "tiles": 80,
+    "packed": 1,
+    "lookup": 1
+}
+
+# Largest board side a session may ask for.
+MAX_SIZE = 16
+
+# Largest number of moves a session may keep to undo.
+MAX_UNDO_LIMIT = 100
+
+# Largest win condition and seed a snapshot can hold; see
+# engine.savefile.SNAPSHOT_HEADER.
+MAX_WIN_CONDITION = 0xFF
+MAX_SEED = (1 << 64) - 1
+
+def check_config(size, initial_value, initial_tiles, win_condition,
+                 undo_limit=0, seed=None, max_size=MAX_SIZE):
+    """
+    Checks the settings of a new session, so that its game can be played
+    and written to disk as a snapshot when it is evicted.
+
+    Raises:
+        ValueError: If a setting is out of range, or of the wrong type.
+    """
+    def check(name, value, low, high):
+        if type(value) is not int or not low <= value <= high:
+            raise ValueError("{0} must be an integer from {1} to {2}"
+                             .format(name, low, high))
+    check("size", size, 1, max_size)
+    # Snapshots keep tiles as exponents of the base tile, and three - way
+    # merges only keep tiles powers of the base tile if it is 3.
+    if initial_value != PACKED_BASE:
+        raise ValueError("initial_value must be {0}".format(PACKED_BASE))
+    check("initial_tiles", initial_tiles, 0, size * size)
+    check("win_condition", win_condition, 1, MAX_WIN_CONDITION)
+    check("undo_limit", undo_limit, 0, MAX_UNDO_LIMIT)
+    if seed is not None:
+        check("seed", seed, 0, MAX_SEED)
+
+def resident_size(game):
+    """
+    Returns a rough estimate of the number of bytes a game takes in
+    memory, counting its undo history.
+    """
+    board = game.size * game.size * CELL_BYTES.get(game.backend, 80)
+    snapshots = len(game.history) + len(game.future)
+    return GAME_BYTES + board + (board + SNAPSHOT_BYTES) * snapshots
+
+class SessionStore:
+    """
+    Game sessions by ID. Recently used sessions are kept in memory; once
+    there are more than max_sessions of them, or they take more than
+    max_bytes, the least recently used ones are written to disk as
+    snapshots (see engine.savefile), and read back the next time they
+    are used. Disk I/O runs in the default executor of the event loop,
+    so other sessions keep being served meanwhile.
+
+    Every session has a lock, held by session() while it is used, so
+    requests on a session are handled one at a time, and a session isn't
+    evicted while it is used. Evicted sessions lose their undo history.
+    """
+
+    def __init__(self, directory, max_sessions=10000, max_bytes=None,
+                 backend="tiles", max_size=MAX_SIZE):
+        """
+        Initializes a new SessionStore.
+
+        Args:
+            directory (str): Directory evicted sessions are written to.
+            max_sessions (int): Largest number of sessions kept in memory.
+            max_bytes (int, optional): Largest estimated number of bytes
+                taken by the sessions kept in memory; see resident_size().
+            backend (str): Board backend of the sessions; see Game.
+            max_size (int): Largest board side a session may ask for.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self.max_size = max_size
+        # Sessions in memory as ID: (game, estimated size), least
+        # recently used first.
+        self.resident = collections.OrderedDict()
+        self.resident_bytes = 0
+        self.locks = {}
+        self.undo_limits = {}
+
+    def path(self, session_id):
+        """
+        Returns the path an evicted session is written to.
+        """
+        return os.path.join(self.directory, session_id + ".tft")
+
+    def __len__(self):
+        """
+        Returns the number of sessions, in memory or on disk.
+        """
+        return len(self.locks)
+
+    def create(self, size, initial_value, initial_tiles, win_condition,
+               undo_limit=0, seed=None):
+        """
+        Starts a new session.
+
+        Args:
+            size, initial_value, initial_tiles, win_condition, seed:
+                Settings of the game; see Game and check_config().
+            undo_limit (int, optional): Number of moves that can be
+                undone; see Game.
+
+        Returns:
+            The ID of the session.
+
+        Raises:
+            ValueError: If the settings are out of range; see
+                check_config().
+        """
+        check_config(size, initial_value, initial_tiles, win_condition,
+                     undo_limit, seed, self.max_size)
+        game = Game(size, initial_value, initial_tiles, win_condition,
+                    backend=self.backend, undo_limit=undo_limit, seed=seed)
+        session_id = secrets.token_hex(8)
+        self.locks[session_id] = asyncio.Lock()
+        self.undo_limits[session_id] = undo_limit
+        self.add(session_id, game)
+        return session_id
+
+    def add(self, session_id, game):
+        """
+        Puts a game in memory as the most recently used session.
+        """
+        size = resident_size(game)
+        self.resident[session_id] = (game, size)
+        self.resident_bytes += size
+
+    def remove(self, session_id):
+        """
+        Takes a session out of memory, returning its game.
+        """
+        game, size = self.resident.pop(session_id)
+        self.resident_bytes -= size
+        return game
+
+    def session(self, session_id):
+        """
+        Returns an async context manager that locks a session and gives
+        its game, reading it back from disk if it was evicted. Leaving it
+        marks the session as the most recently used.
+
+        Raises:
+            KeyError: If there is no such session.
+        """
+        if session_id not in self.locks:
+            raise KeyError(session_id)
+        return Session(self, session_id)
+
+    async def load(self, session_id):
+        """
+        Returns the game of a session, reading it back from disk if it was
+        evicted. The session must be locked.
+        """
+        if session_id in self.resident:
+            return self.remove(session_id)
+        loop = asyncio.get_event_loop()
+        data = await loop.run_in_executor(
+            None, read_file, self.path(session_id))
+        game = decode_snapshot(data, self.backend,
+                               self.undo_limits[session_id])[0]
+        os.remove(self.path(session_id))
+        return game
+
+    async def evict(self):
+        """
+        Writes the least recently used sessions to disk until the ones in
+        memory fit in the limits. Sessions in use are skipped.
+
+        A session only leaves memory once its snapshot is on disk. If it
+        can't be written, it stays in memory, and the next session is
+        tried. Sessions closed while a snapshot is being written are
+        skipped.
+        """
+        loop = asyncio.get_event_loop()
+        for session_id in list(self.resident):
+            if not self.over_limits():
+                return
+            lock = self.locks.get(session_id)
+            if lock is None or session_id not in self.resident:
+                continue
+            if lock.locked():
+                continue
+            async with lock:
+                if session_id not in self.resident:
+                    continue
+                game = self.resident[session_id][0]
+                try:
+                    await loop.run_in_executor(
+                        None, write_file, self.path(session_id),
+                        encode_snapshot(game, 0))
+                except (OSError, ValueError) as error:
+                    print("Could not evict session {0}: {1}".format(
+                        session_id, error), file=sys.stderr)
+                    continue
+                self.remove(session_id)
+
+    def over_limits(self):
+        """
+        Checks if the sessions in memory go over the limits of the store.
+        """
+        return len(self.resident) > self.max_sessions or \
+            (self.max_bytes is not None and
+             self.resident_bytes > self.max_bytes)
+
+    async def close(self, session_id):
+        """
+        Ends a session, deleting it from memory and disk.
+        """
+        if session_id not in self.locks:
+            raise KeyError(session_id)
+        async with self.locks[session_id]:
+            if session_id in self.resident:
+                self.remove(session_id)
+            else:
+                os.remove(self.path(session_id))
+        del self.locks[session_id]
+        del self.undo_limits[session_id]
+
+class Session:
+    """
+    Async context manager returned by SessionStore.session().
+    """
+
+    def __init__(self, store, session_id):
+        self.store = store
+        self.session_id = session_id
+        self.game = None
+
+    async def __aenter__(self):
+        lock = self.store.locks[self.session_id]
+        await lock.acquire()
+        if self.session_id not in self.store.locks:
+            # The session was closed while waiting for it.
+            lock.release()
+            raise KeyError(self.session_id)
+        try:
+            self.game = await self.store.load(self.session_id)
+        except BaseException:
+            self.store.locks[self.session_id].release()
+            raise
+        return self.game
+
+    async def __aexit__(self, *exc_info):
+        self.store.add(self.session_id, self.game)
+        self.store.locks[self.session_id].release()
+        if self.store.over_limits():
+            await self.store.evict()
+
+def read_file(path):
+    """
+    Returns the contents of a file.
+    """
+    with open(path, "rb") as infile:
+        return infile.read()
+
+def write_file(path, data):
+    """
+    Writes a file, replacing it atomically.
+    """
+    temp_path = path + ".tmp"
+    try:
+        with open(temp_path, "wb") as outfile:
+            outfile.write(data)
+        os.replace(temp_path, path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
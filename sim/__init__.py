@@ -0,0 +1,2 @@
+from sim.runner import DEFAULT_CONFIG, play_game, simulate
+from sim.aggregate import GameAggregator, QuantileSketch, Histogram
@@ -0,0 +1,380 @@
+"""
+Streaming statistics of simulated games, mergeable across processes.
+"""
+
+import math
+import time
+
+# Width of the bins of the histogram of game lengths, in moves.
+LENGTH_BIN = 10
+
+# Quantiles of the score reported in summaries.
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9, 0.99)
+
+class QuantileSketch:
+    """
+    Streaming quantiles of non-negative values, in memory logarithmic in
+    the range of the values rather than linear in their number.
+
+    Values are counted in buckets whose bounds grow geometrically, so that
+    any quantile is answered within a relative error of
+    relative_accuracy. Sketches with the same accuracy merge exactly, by
+    adding up their buckets.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        """
+        Initializes a new, empty QuantileSketch.
+
+        Args:
+            relative_accuracy (float): Largest relative error of a
+                quantile.
+        """
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        # Bucket k counts the values in (gamma ** (k - 1), gamma ** k].
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value, n=1):
+        """
+        Adds a value, n times.
+        """
+        if value <= 0:
+            self.zeros += n
+        else:
+            k = math.ceil(math.log(value) / self.log_gamma)
+            self.buckets[k] = self.buckets.get(k, 0) + n
+        self.count += n
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """
+        Adds every value counted by another sketch of the same accuracy.
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("sketches of different accuracies can't merge")
+        for k, n in other.buckets.items():
+            self.buckets[k] = self.buckets.get(k, 0) + n
+        self.zeros += other.zeros
+        self.count += other.count
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Returns the q-quantile of the values, for q from 0 to 1, or None if
+        there are no values.
+        """
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0
+        for k in sorted(self.buckets):
+            seen += self.buckets[k]
+            if seen > rank:
+                value = 2 * self.gamma ** k / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def to_dict(self):
+        """
+        Returns the state of the sketch as a dictionary of plain values,
+        which can be sent across processes or written as JSON.
+        """
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "buckets": {str(k): n for k, n in self.buckets.items()},
+            "zeros": self.zeros,
+            "count": self.count,
+            "min": self.min,
+            "max": self.max
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        """
+        Rebuilds a sketch from the state returned by to_dict().
+        """
+        sketch = cls(state["relative_accuracy"])
+        sketch.buckets = {int(k): n for k, n in state["buckets"].items()}
+        sketch.zeros = state["zeros"]
+        sketch.count = state["count"]
+        sketch.min = state["min"]
+        sketch.max = state["max"]
+        return sketch
+
+class Histogram:
+    """
+    Counts of values in bins of a fixed width. With a width of 1, every
+    value is counted exactly. Histograms of the same width merge exactly.
+    """
+
+    def __init__(self, bin_width=1):
+        """
+        Initializes a new, empty Histogram.
+
+        Args:
+            bin_width (int): Width of a bin; bin b counts the values from
+                b up to b + bin_width.
+        """
+        self.bin_width = bin_width
+        self.counts = {}
+
+    def add(self, value, n=1):
+        """
+        Adds a value, n times.
+        """
+        b = value // self.bin_width * self.bin_width
+        self.counts[b] = self.counts.get(b, 0) + n
+
+    def merge(self, other):
+        """
+        Adds every value counted by another histogram of the same width.
+        """
+        if other.bin_width != self.bin_width:
+            raise ValueError("histograms of different widths can't merge")
+        for b, n in other.counts.items():
+            self.counts[b] = self.counts.get(b, 0) + n
+
+    def items(self):
+        """
+        Returns the (bin, count) pairs of the histogram, by bin.
+        """
+        return sorted(self.counts.items())
+
+    def to_dict(self):
+        """
+        Returns the state of the histogram; see QuantileSketch.to_dict.
+        """
+        return {
+            "bin_width": self.bin_width,
+            "counts": {str(b): n for b, n in self.counts.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        """
+        Rebuilds a histogram from the state returned by to_dict().
+        """
+        histogram = cls(state["bin_width"])
+        histogram.counts = {int(b): n for b, n in state["counts"].items()}
+        return histogram
+
+class OutcomeStats:
+    """
+    Statistics of the games played to one win condition.
+    """
+
+    def __init__(self, relative_accuracy=0.01, length_bin=LENGTH_BIN):
+        self.games = 0
+        self.wins = 0
+        self.total_score = 0
+        self.total_moves = 0
+        self.scores = QuantileSketch(relative_accuracy)
+        self.max_tiles = Histogram()
+        self.lengths = Histogram(length_bin)
+
+    def add(self, score, max_tile, moves, won):
+        """
+        Adds the outcome of a game.
+        """
+        self.games += 1
+        self.wins += bool(won)
+        self.total_score += score
+        self.total_moves += moves
+        self.scores.add(score)
+        self.max_tiles.add(max_tile)
+        self.lengths.add(moves)
+
+    def merge(self, other):
+        """
+        Adds every game counted by another OutcomeStats.
+        """
+        self.games += other.games
+        self.wins += other.wins
+        self.total_score += other.total_score
+        self.total_moves += other.total_moves
+        self.scores.merge(other.scores)
+        self.max_tiles.merge(other.max_tiles)
+        self.lengths.merge(other.lengths)
+
+    def summary(self):
+        """
+        Returns a summary of the games as a dictionary of plain values.
+        """
+        games = max(1, self.games)
+        return {
+            "games": self.games,
+            "win_rate": self.wins / games,
+            "mean_score": self.total_score / games,
+            "score_quantiles": {str(q): self.scores.quantile(q)
+                                for q in QUANTILES},
+            "max_score": self.scores.max,
+            "mean_moves": self.total_moves / games,
+            "max_tiles": {str(tile): n for tile, n in self.max_tiles.items()},
+            "lengths": {str(b): n for b, n in self.lengths.items()}
+        }
+
+    def to_dict(self):
+        """
+        Returns the state of the statistics; see QuantileSketch.to_dict.
+        """
+        return {
+            "games": self.games,
+            "wins": self.wins,
+            "total_score": self.total_score,
+            "total_moves": self.total_moves,
+            "scores": self.scores.to_dict(),
+            "max_tiles": self.max_tiles.to_dict(),
+            "lengths": self.lengths.to_dict()
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        """
+        Rebuilds statistics from the state returned by to_dict().
+        """
+        stats = cls()
+        stats.games = state["games"]
+        stats.wins = state["wins"]
+        stats.total_score = state["total_score"]
+        stats.total_moves = state["total_moves"]
+        stats.scores = QuantileSketch.from_dict(state["scores"])
+        stats.max_tiles = Histogram.from_dict(state["max_tiles"])
+        stats.lengths = Histogram.from_dict(state["lengths"])
+        return stats
+
+class GameAggregator:
+    """
+    Online statistics of finished games, by win condition: score
+    quantiles, max tile frequencies, a histogram of game lengths, and the
+    win rate. Memory does not grow with the number of games, and
+    aggregators merge, so each worker process can keep its own and send
+    its state (see to_dict) to be merged.
+
+    Games can be fed straight from their end state with add_game(), or as
+    results of sim.runner.play_game() with add_result().
+    """
+
+    def __init__(self, relative_accuracy=0.01, length_bin=LENGTH_BIN,
+                 callback=None, interval=10.0):
+        """
+        Initializes a new GameAggregator.
+
+        Args:
+            relative_accuracy (float): Largest relative error of the score
+                quantiles.
+            length_bin (int): Width of the bins of game lengths, in moves.
+            callback (callable, optional): Called with summary() after a
+                game is added, at most once every interval seconds.
+            interval (float): Least number of seconds between two calls of
+                the callback.
+        """
+        self.relative_accuracy = relative_accuracy
+        self.length_bin = length_bin
+        self.callback = callback
+        self.interval = interval
+        self.by_win_condition = {}
+        self.last_report = time.perf_counter()
+
+    def stats(self, win_condition):
+        """
+        Returns the statistics of a win condition, creating them if needed.
+        """
+        stats = self.by_win_condition.get(win_condition)
+        if stats is None:
+            stats = self.by_win_condition[win_condition] = OutcomeStats(
+                self.relative_accuracy, self.length_bin)
+        return stats
+
+    def add(self, win_condition, score, max_tile, moves, won):
+        """
+        Adds the outcome of a game.
+
+        Args:
+            win_condition (int): Win condition of the game.
+            score (int): Final score.
+            max_tile (int): Value of the largest tile on the final board.
+            moves (int): Number of moves made.
+            won (bool): Whether the game was won.
+        """
+        self.stats(win_condition).add(score, max_tile, moves, won)
+        if self.callback is not None:
+            now = time.perf_counter()
+            if now - self.last_report >= self.interval:
+                self.last_report = now
+                self.callback(self.summary())
+
+    def add_game(self, game, moves=None):
+        """
+        Adds a game that is over, from its end state.
+
+        Args:
+            game (Game): The game.
+            moves (int, optional): Number of moves made, if known; else it
+                is counted from the moves of the game.
+        """
+        if moves is None:
+            moves = len(game.moves())
+        max_tile = max([value for row in game.peek_board()
+                        for value in row if value is not None], default=0)
+        self.add(game.win_condition, game.score, max_tile, moves,
+                 game.is_won())
+
+    def add_result(self, result):
+        """
+        Adds a game from its result, as returned by sim.runner.play_game().
+        """
+        self.add(result["win_condition"], result["score"],
+                 result["max_tile"], result["moves"],
+                 result["outcome"] == "WON")
+
+    def merge(self, other):
+        """
+        Adds every game counted by another GameAggregator.
+        """
+        for win_condition, stats in other.by_win_condition.items():
+            self.stats(win_condition).merge(stats)
+
+    def summary(self):
+        """
+        Returns a summary of the games of each win condition, as a
+        dictionary of plain values keyed by win condition.
+        """
+        return {str(win_condition): stats.summary()
+                for win_condition, stats
+                in sorted(self.by_win_condition.items())}
+
+    def to_dict(self):
+        """
+        Returns the state of the aggregator as a dictionary of plain
+        values, which can be sent across processes or written as JSON.
+        """
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "length_bin": self.length_bin,
+            "by_win_condition": {str(win_condition): stats.to_dict()
+                                 for win_condition, stats
+                                 in self.by_win_condition.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        """
+        Rebuilds an aggregator from the state returned by to_dict().
+        """
+        aggregator = cls(state["relative_accuracy"], state["length_bin"])
+        aggregator.by_win_condition = {
+            int(win_condition): OutcomeStats.from_dict(stats)
+            for win_condition, stats in state["by_win_condition"].items()}
+        return aggregator
@@ -0,0 +1,298 @@
+"""
+Columnar datasets of self-play trajectories, read through memory maps.
+"""
+
+import glob
+import json
+import os
+
+import numpy as np
+
+from engine import BoardMovements
+from engine.packed import exponent_of
+
+DATASET_VERSION = 1
+
+# Columns of a dataset: one record per move, as (name, dtype, width),
+# where a width of None is one byte per cell of the board.
+#   cells: Exponents of the board before the move (log base the initial
+#       value, 0 for empty cells), as in PackedBoard.cells.
+#   move: Value of the BoardMovements of the move.
+#   score: Score gained by the move.
+#   spawn_cell: Cell i * size + j of the tile that spawned after the
+#       move, or NO_SPAWN.
+#   spawn_exponent: Exponent of the tile that spawned, or 0.
+COLUMNS = (
+    ("cells", "u1", None),
+    ("move", "u1", 1),
+    ("score", "<i8", 1),
+    ("spawn_cell", "<u2", 1),
+    ("spawn_exponent", "u1", 1)
+)
+NO_SPAWN = 0xFFFF
+
+# Index of the games of a shard, in the order they were written.
+GAME_INDEX = np.dtype([("game", "<u8"), ("start", "<u8"), ("moves", "<u4")])
+
+META_FILE = "meta.json"
+
+def board_exponents(game):
+    """
+    Returns the board of a game as packed exponents, as in PackedBoard.cells.
+    """
+    cells = getattr(game.board, "cells", None)
+    if cells is not None:
+        return cells
+    return bytes(0 if value is None
+                 else exponent_of(value, game.initial_value)
+                 for row in game.peek_board() for value in row)
+
+def column_path(directory, shard, name):
+    """
+    Returns the path of a column of a shard of a dataset.
+    """
+    return os.path.join(directory, "{0}.{1}".format(shard, name))
+
+def read_meta(directory):
+    """
+    Returns the metadata of a dataset, or None if there is none yet.
+    """
+    path = os.path.join(directory, META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as infile:
+        meta = json.load(infile)
+    if meta.get("version") != DATASET_VERSION:
+        raise ValueError("{0} is not a dataset of version {1}"
+                         .format(directory, DATASET_VERSION))
+    return meta
+
+class TrajectoryWriter:
+    """
+    Appends trajectories of games to a dataset: a directory of fixed-width
+    column files, split into shards. Each writer appends to a shard of its
+    own, so processes can write to one dataset at once without locking.
+
+    Records of a game are buffered until end_game(), which appends them to
+    each column, then adds the game to the index of the shard. A game is
+    only part of the dataset once it is in the index, so readers never see
+    half a game, and records torn by a crash are dropped the next time the
+    shard is opened.
+    """
+
+    def __init__(self, directory, size, initial_value=3, shard=None):
+        """
+        Initializes a new TrajectoryWriter, creating the dataset if needed.
+
+        Args:
+            directory (str): Directory of the dataset.
+            size (int): The size of the board's side of every game.
+            initial_value (int): The value of the base tile of every game.
+            shard (str, optional): Name of the shard to append to. Defaults
+                to one named after this process.
+        """
+        os.makedirs(directory, exist_ok=True)
+        meta = {"version": DATASET_VERSION, "size": size,
+                "initial_value": initial_value}
+        existing = read_meta(directory)
+        if existing is None:
+            # Written whole and renamed, as other processes may be
+            # creating the same dataset.
+            temp_path = os.path.join(
+                directory, "{0}.{1}.tmp".format(META_FILE, os.getpid()))
+            with open(temp_path, "w") as outfile:
+                json.dump(meta, outfile)
+            os.replace(temp_path, os.path.join(directory, META_FILE))
+        elif existing != meta:
+            raise ValueError("{0} holds games of another size or initial "
+                             "value".format(directory))
+
+        self.directory = directory
+        self.size = size
+        self.initial_value = initial_value
+        self.shard = shard or "shard-{0}".format(os.getpid())
+        self.widths = {name: np.dtype(dtype).itemsize *
+                       (size * size if width is None else width)
+                       for name, dtype, width in COLUMNS}
+
+        # Drop whatever follows the last indexed game.
+        index_path = column_path(directory, self.shard, "games")
+        games = 0
+        self.rows = 0
+        if os.path.exists(index_path):
+            games = os.path.getsize(index_path) // GAME_INDEX.itemsize
+            if games:
+                last = np.fromfile(index_path, GAME_INDEX, 1,
+                                   offset=(games - 1) * GAME_INDEX.itemsize)[0]
+                self.rows = int(last["start"] + last["moves"])
+        self.files = {}
+        for name, _, _ in COLUMNS + (("games", None, None),):
+            path = column_path(directory, self.shard, name)
+            outfile = open(path, "ab", buffering=0)
+            outfile.truncate(games * GAME_INDEX.itemsize if name == "games"
+                             else self.rows * self.widths[name])
+            self.files[name] = outfile
+        self.buffers = {name: bytearray() for name, _, _ in COLUMNS}
+        self.moves = 0
+
+    def record(self, cells, direction, score, spawn):
+        """
+        Adds a move to the current game.
+
+        Args:
+            cells (bytes): Exponents of the board before the move; see
+                board_exponents().
+            direction (str): Direction of the move, one of "up", "down",
+                "left", or "right".
+            score (int): Score gained by the move.
+            spawn (tuple): The (i, j, value) of the tile that spawned
+                after the move, or None; see Game.last_spawn.
+        """
+        buffers = self.buffers
+        buffers["cells"] += cells
+        buffers["move"].append(BoardMovements[direction.upper()].value)
+        buffers["score"] += score.to_bytes(8, "little", signed=True)
+        if spawn is None:
+            buffers["spawn_cell"] += NO_SPAWN.to_bytes(2, "little")
+            buffers["spawn_exponent"].append(0)
+        else:
+            i, j, value = spawn
+            buffers["spawn_cell"] += (i * self.size + j).to_bytes(2, "little")
+            buffers["spawn_exponent"].append(
+                exponent_of(value, self.initial_value))
+        self.moves += 1
+
+    def end_game(self, game_id):
+        """
+        Writes out the moves of the current game, and adds it to the index
+        under a game ID.
+        """
+        for name, buffer in self.buffers.items():
+            self.files[name].write(buffer)
+            buffer.clear()
+        entry = np.array([(game_id, self.rows, self.moves)], dtype=GAME_INDEX)
+        self.files["games"].write(entry.tobytes())
+        self.rows += self.moves
+        self.moves = 0
+
+    def close(self):
+        """
+        Closes the shard. Moves of an unfinished game are dropped.
+        """
+        for outfile in self.files.values():
+            outfile.close()
+        self.files = {}
+
+class TrajectoryDataset:
+    """
+    A dataset written by TrajectoryWriter, read without parsing: every
+    column of every shard is mapped into memory, and records are handed
+    out as NumPy views of the maps.
+
+    Games can be looked up by ID; if a game was written more than once,
+    e.g. by two runs with the same seeds, the first copy found is used.
+    Games written after the dataset is opened are not seen.
+    """
+
+    def __init__(self, directory):
+        """
+        Opens a dataset.
+
+        Args:
+            directory (str): Directory of the dataset.
+        """
+        meta = read_meta(directory)
+        if meta is None:
+            raise FileNotFoundError("no dataset at {0}".format(directory))
+        self.directory = directory
+        self.size = meta["size"]
+        self.initial_value = meta["initial_value"]
+        self.shards = []
+        indices = []
+        for path in sorted(glob.glob(column_path(directory, "*", "games"))):
+            shard = os.path.basename(path)[:-len(".games")]
+            index = self.map(path, GAME_INDEX, None)
+            rows = int(index["start"][-1] + index["moves"][-1]) \
+                if len(index) else 0
+            self.shards.append({
+                name: self.map(column_path(directory, shard, name),
+                               np.dtype(dtype), rows,
+                               self.size * self.size if width is None
+                               else None)
+                for name, dtype, width in COLUMNS
+            })
+            indices.append(index)
+
+        # Games sorted by ID, with their shard and place in it.
+        index = np.concatenate(indices) if indices \
+            else np.zeros(0, GAME_INDEX)
+        shard_of = np.repeat(np.arange(len(indices)),
+                             [len(k) for k in indices])
+        order = np.argsort(index["game"], kind="stable")
+        self.game_ids = index["game"][order]
+        self.game_shards = shard_of[order]
+        self.game_starts = index["start"][order]
+        self.game_moves = index["moves"][order]
+        self.indices = indices
+
+    @staticmethod
+    def map(path, dtype, rows, width=None):
+        """
+        Maps the first rows records of a column file read-only, as an array
+        of shape (rows,) or (rows, width). With rows None, the whole file
+        is mapped.
+        """
+        itemsize = dtype.itemsize * (width or 1)
+        if rows is None:
+            rows = os.path.getsize(path) // itemsize
+        shape = (rows,) if width is None else (rows, width)
+        if rows == 0:
+            return np.zeros(shape, dtype)
+        return np.memmap(path, dtype, "r", shape=shape)
+
+    def __len__(self):
+        """
+        Returns the number of moves in the dataset.
+        """
+        return int(self.game_moves.sum())
+
+    def __contains__(self, game_id):
+        """
+        Checks if a game is in the dataset.
+        """
+        k = np.searchsorted(self.game_ids, game_id)
+        return k < len(self.game_ids) and self.game_ids[k] == game_id
+
+    def game(self, game_id):
+        """
+        Returns the moves of a game, as a dictionary mapping each column
+        name to a view of its records.
+
+        Args:
+            game_id (int): ID of the game, as given to
+                TrajectoryWriter.end_game().
+        """
+        if game_id not in self:
+            raise KeyError(game_id)
+        k = np.searchsorted(self.game_ids, game_id)
+        shard = self.shards[self.game_shards[k]]
+        start = int(self.game_starts[k])
+        stop = start + int(self.game_moves[k])
+        return {name: column[start:stop] for name, column in shard.items()}
+
+    def games(self):
+        """
+        Yields the ID and moves of every game, shard by shard, in the
+        order they were written; see game().
+        """
+        for shard, index in zip(self.shards, self.indices):
+            for game_id, start, moves in index.tolist():
+                yield game_id, {name: column[start:start + moves]
+                                for name, column in shard.items()}
+
+    def column(self, name):
+        """
+        Returns the records of a column across all shards, as a list of
+        views, one per shard.
+        """
+        return [shard[name] for shard in self.shards]
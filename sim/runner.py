@@ -0,0 +1,229 @@
+"""
+Headless self-play simulator for the three-four-three game.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from engine import Game
+from engine.lookup import preload
+from sim.aggregate import GameAggregator
+from ai import POLICIES, load_policy
+
+# Game settings used by the desktop interface. The terminal interfaces
+# play the same game, but start it with a single tile.
+DEFAULT_CONFIG = {
+    "size": 6,
+    "initial_value": 3,
+    "initial_tiles": 8,
+    "win_condition": 10
+}
+
+USAGE = """python main.py --simulate [options]"""
+
+def max_tile(game):
+    """
+    Returns the value of the largest tile on the board of a game.
+    """
+    return max([value for row in game.peek_board()
+                for value in row if value is not None], default=0)
+
+def play_game(policy, seed=None, backend="packed", writer=None, **config):
+    """
+    Plays a single game with a policy until it is won or lost.
+
+    Args:
+        policy (callable): Policy choosing each move; see ai.policies.
+        seed (int, optional): Seed of the game's random stream, which is
+            also used to seed the random module for the policy before the
+            game starts.
+        backend (str): Board backend of the game; see Game.
+        writer (TrajectoryWriter, optional): Where to record every move of
+            the game, under the seed of the game as its ID.
+        **config: Arguments of the Game, defaulting to DEFAULT_CONFIG.
+
+    Returns:
+        A dictionary with the seed, final score, largest tile, number of
+        moves, win condition, and outcome ("WON" or "LOST") of the game.
+    """
+    config = dict(DEFAULT_CONFIG, **config)
+    random.seed(seed)
+    game = Game(backend=backend, seed=seed, **config)
+    if writer is not None:
+        # Imported here, as datasets need NumPy, which is slow to load.
+        from sim.dataset import board_exponents
+    moves = 0
+    while not game.is_over():
+        direction = policy(game)
+        if writer is None:
+            game.move_board(direction)
+        else:
+            cells = board_exponents(game)
+            score = game.score
+            game.move_board(direction)
+            writer.record(cells, direction, game.score - score,
+                          game.last_spawn)
+        moves += 1
+    if writer is not None:
+        writer.end_game(game.seed)
+    return {
+        "seed": game.seed,
+        "score": game.score,
+        "max_tile": max_tile(game),
+        "moves": moves,
+        "win_condition": game.win_condition,
+        "outcome": game.game_status.name
+    }
+
+_writers = {}
+
+def dataset_writer(directory, config):
+    """
+    Returns the writer of this process for a dataset, opening it the
+    first time it is asked for. Each process appends to a shard of its
+    own.
+    """
+    key = (directory, os.getpid())
+    if key not in _writers:
+        from sim.dataset import TrajectoryWriter
+        _writers[key] = TrajectoryWriter(directory, config["size"],
+                                         config["initial_value"])
+    return _writers[key]
+
+def _play_job(job):
+    """
+    Plays one game of a simulation in a worker process.
+    """
+    index, policy, seed, backend, dataset, config = job
+    writer = None if dataset is None else dataset_writer(dataset, config)
+    result = play_game(policy, seed, backend, writer, **config)
+    result["game"] = index
+    return result
+
+def simulate(games, policy, workers=None, seed=None, backend="packed",
+             dataset=None, **config):
+    """
+    Plays a number of games with a policy across a pool of processes,
+    yielding the result of each game as soon as it is done. Results come
+    in no particular order, but are tagged with the index of their game.
+
+    Game k is played with the seed seed + k, so a simulation can be
+    replayed exactly from its seed.
+
+    Args:
+        games (int): Number of games to play.
+        policy (callable): Policy choosing each move. Must be picklable,
+            i.e. defined at the top level of a module, if workers > 1.
+        workers (int, optional): Number of processes to play games in.
+            Defaults to the number of CPUs; with 1, games are played in
+            this process.
+        seed (int, optional): Seed of the first game. If None, a random
+            seed is picked.
+        backend (str): Board backend of every game; see Game.
+        dataset (str, optional): Directory of a dataset to record every
+            move to, with one shard per process; see sim.dataset. Games
+            are recorded under their seeds.
+        **config: Arguments of each Game, defaulting to DEFAULT_CONFIG.
+    """
+    config = dict(DEFAULT_CONFIG, **config)
+    if seed is None:
+        seed = random.randrange(1 << 32)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if backend == "lookup":
+        preload(config["size"])
+
+    jobs = ((k, policy, seed + k, backend, dataset, config)
+            for k in range(games))
+    if workers == 1:
+        for job in jobs:
+            yield _play_job(job)
+        return
+    # Imported here, as it is slow to load and only needed with more than
+    # one worker.
+    import multiprocessing
+    chunksize = max(1, games // (workers * 16))
+    with multiprocessing.Pool(workers) as pool:
+        for result in pool.imap_unordered(_play_job, jobs, chunksize):
+            yield result
+
+def main(argv=None):
+    """
+    Runs the simulator from the command line. Prints a JSON object for
+    each game as it ends, then the total throughput to stderr. With
+    --summary, prints summaries of the games so far instead, every so
+    often to stderr and once at the end to stdout.
+
+    Args:
+        argv (list of str, optional): Command line arguments, without the
+            program name. Defaults to sys.argv[1:].
+    """
+    parser = argparse.ArgumentParser(
+        usage=USAGE, description="Play three-four-three games headlessly.")
+    parser.add_argument("-n", "--games", type=int, default=100,
+                        help="number of games to play (default: 100)")
+    parser.add_argument("-p", "--policy", default="random",
+                        help="policy to play with: one of {0}, or a "
+                        "module:function path (default: random)".format(
+                            ", ".join(sorted(POLICIES))))
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="number of worker processes (default: CPUs)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed of the first game")
+    parser.add_argument("--backend", default="packed",
+                        help="board backend (default: packed)")
+    parser.add_argument("--dataset", default=None,
+                        help="directory of a dataset to record every move "
+                        "to (default: none)")
+    parser.add_argument("--summary", action="store_true",
+                        help="print summaries rather than every game")
+    parser.add_argument("--summary-interval", type=float, default=10.0,
+                        help="seconds between summaries (default: 10)")
+    parser.add_argument("--aggregate", default=None,
+                        help="file of aggregated statistics to merge the "
+                        "games into, e.g. across runs (default: none)")
+    parser.add_argument("--size", type=int, default=DEFAULT_CONFIG["size"])
+    parser.add_argument("--initial-value", type=int,
+                        default=DEFAULT_CONFIG["initial_value"])
+    parser.add_argument("--initial-tiles", type=int,
+                        default=DEFAULT_CONFIG["initial_tiles"])
+    parser.add_argument("--win-condition", type=int,
+                        default=DEFAULT_CONFIG["win_condition"])
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    def report(summary):
+        print(json.dumps(summary), file=sys.stderr, flush=True)
+    aggregator = GameAggregator(callback=report if args.summary else None,
+                                interval=args.summary_interval)
+    if args.aggregate is not None and os.path.exists(args.aggregate):
+        with open(args.aggregate) as infile:
+            aggregator.merge(GameAggregator.from_dict(json.load(infile)))
+
+    start = time.perf_counter()
+    moves = 0
+    games = 0
+    for result in simulate(args.games, load_policy(args.policy),
+                           workers=args.workers, seed=args.seed,
+                           backend=args.backend, dataset=args.dataset,
+                           size=args.size,
+                           initial_value=args.initial_value,
+                           initial_tiles=args.initial_tiles,
+                           win_condition=args.win_condition):
+        if not args.summary:
+            print(json.dumps(result), flush=True)
+        aggregator.add_result(result)
+        moves += result["moves"]
+        games += 1
+    elapsed = time.perf_counter() - start
+    if args.summary:
+        print(json.dumps(aggregator.summary(), indent=2))
+    if args.aggregate is not None:
+        with open(args.aggregate, "w") as outfile:
+            json.dump(aggregator.to_dict(), outfile)
+    print("{0} games, {1} moves in {2:.2f}s ({3:.0f} moves/s)".format(
+        games, moves, elapsed, moves / elapsed if elapsed else 0),
+        file=sys.stderr)
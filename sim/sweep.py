@@ -0,0 +1,247 @@
+"""
+Parameter sweeps: simulations over a grid of game configurations, with
+finished results cached on disk.
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+
+from engine.lookup import (CACHE_DIR, DEFAULT_MAX_EXPONENT, MAX_TABLE_ROWS,
+                           preload)
+from engine.packed import PACKED_BASE
+from ai import POLICIES, load_policy
+from sim.aggregate import GameAggregator
+from sim.runner import DEFAULT_CONFIG, play_game
+
+# Directory where finished chunks of sweeps are cached.
+SWEEP_CACHE_DIR = os.path.join(CACHE_DIR, "sweeps")
+
+# Version of the cached results; bumped whenever the games played for the
+# same configuration, policy and seeds would change.
+SWEEP_VERSION = 1
+
+# Parameters of a configuration, in the order they key and sort cells.
+PARAMETERS = ("size", "initial_value", "initial_tiles", "win_condition")
+
+USAGE = """python main.py --sweep [options]"""
+
+def grid(**axes):
+    """
+    Returns every configuration of a grid of parameters, leaving out
+    those that can't be played, i.e. with more initial tiles than cells.
+
+    Args:
+        **axes: Values of each parameter of PARAMETERS; parameters left
+            out take their value in DEFAULT_CONFIG.
+
+    Returns:
+        A list of dictionaries of the arguments of a Game.
+    """
+    values = [axes.get(name) or [DEFAULT_CONFIG[name]] for name in PARAMETERS]
+    return [dict(zip(PARAMETERS, cell)) for cell in itertools.product(*values)
+            if cell[2] <= cell[0] * cell[0]]
+
+def backend_for(config):
+    """
+    Returns the fastest board backend that can play a configuration. All
+    backends play the same games from the same seeds.
+
+    Unlike sim.runner and MCTSPlayer, which default to the packed backend
+    so that short runs don't wait for a row table to be built, sweeps use
+    the lookup backend wherever it can play: a sweep plays the games of a
+    whole grid, and the table is built once and then loaded from the disk
+    cache, so it pays for itself.
+    """
+    if config["initial_value"] != PACKED_BASE:
+        return "tiles"
+    if (DEFAULT_MAX_EXPONENT + 1) ** config["size"] <= MAX_TABLE_ROWS:
+        return "lookup"
+    return "packed"
+
+def chunk_path(cache_dir, config, policy, start, stop):
+    """
+    Returns the path of the cached result of playing seeds start to stop
+    of a configuration with a policy.
+    """
+    key = json.dumps({"version": SWEEP_VERSION, "config": config,
+                      "policy": policy, "seeds": [start, stop]},
+                     sort_keys=True)
+    return os.path.join(cache_dir, hashlib.sha1(key.encode()).hexdigest()
+                        + ".json")
+
+def _run_chunk(job):
+    """
+    Plays a chunk of games of a sweep, in a worker process, and returns
+    the state of their aggregated statistics.
+    """
+    k, config, policy, start, stop = job
+    aggregator = GameAggregator()
+    policy_function = load_policy(policy)
+    backend = backend_for(config)
+    for seed in range(start, stop):
+        aggregator.add_result(play_game(policy_function, seed, backend,
+                                        **config))
+    return job, aggregator.to_dict()
+
+def run_sweep(configs, policy, games, seed=0, chunk=100, workers=None,
+              cache_dir=SWEEP_CACHE_DIR, progress=None):
+    """
+    Plays games with a policy for every configuration of a sweep, and
+    aggregates their outcomes; see sim.aggregate.
+
+    The games of each configuration are split into chunks of seeds, which
+    are played across a pool of processes, chunks of all configurations
+    alike. Each finished chunk is cached on disk, keyed by its
+    configuration, policy and seeds, so running a sweep again, or going on
+    with one that was interrupted, only plays the chunks not done yet.
+    Every configuration is played with the same seeds.
+
+    Args:
+        configs (list of dict): Arguments of the games of each
+            configuration, as returned by grid().
+        policy (str): Name of the policy; see ai.policies.load_policy.
+            Names, not functions, key the cache.
+        games (int): Number of games per configuration.
+        seed (int): Seed of the first game of each configuration.
+        chunk (int): Number of games per chunk.
+        workers (int, optional): Number of processes to play games in.
+            Defaults to the number of CPUs; with 1, games are played in
+            this process.
+        cache_dir (str): Directory of cached chunks.
+        progress (callable, optional): Called with the number of chunks
+            done and the total after each chunk is played.
+
+    Returns:
+        A list of (config, GameAggregator) pairs, one per configuration.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    aggregators = [GameAggregator() for _ in configs]
+    jobs = []
+    chunks = 0
+    for k, config in enumerate(configs):
+        for start in range(seed, seed + games, chunk):
+            stop = min(start + chunk, seed + games)
+            chunks += 1
+            path = chunk_path(cache_dir, config, policy, start, stop)
+            if os.path.exists(path):
+                with open(path) as infile:
+                    aggregators[k].merge(
+                        GameAggregator.from_dict(json.load(infile)["state"]))
+            else:
+                jobs.append((k, config, policy, start, stop))
+                if backend_for(config) == "lookup":
+                    preload(config["size"])
+
+    done = chunks - len(jobs)
+    if workers == 1 or len(jobs) <= 1:
+        results = map(_run_chunk, jobs)
+        pool = None
+    else:
+        # Imported here, as it is slow to load and only needed with more
+        # than one worker.
+        import multiprocessing
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap_unordered(_run_chunk, jobs)
+    try:
+        for job, state in results:
+            k, config, policy, start, stop = job
+            path = chunk_path(cache_dir, config, policy, start, stop)
+            temp_path = "{0}.{1}.tmp".format(path, os.getpid())
+            with open(temp_path, "w") as outfile:
+                json.dump({"config": config, "policy": policy,
+                           "seeds": [start, stop], "state": state}, outfile)
+            os.replace(temp_path, path)
+            aggregators[k].merge(GameAggregator.from_dict(state))
+            done += 1
+            if progress is not None:
+                progress(done, chunks)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return list(zip(configs, aggregators))
+
+def comparison_table(results):
+    """
+    Returns a text table comparing the outcomes of every configuration of
+    a sweep, one row per configuration.
+
+    Args:
+        results (list): Results of a sweep, as returned by run_sweep().
+    """
+    header = ("size", "base", "tiles", "win", "games", "win rate",
+              "mean score", "median", "p90", "mean moves", "top tile")
+    rows = []
+    for config, aggregator in results:
+        stats = aggregator.stats(config["win_condition"])
+        summary = stats.summary()
+        top_tile = max(stats.max_tiles.counts, default=0)
+        rows.append((
+            str(config["size"]), str(config["initial_value"]),
+            str(config["initial_tiles"]), str(config["win_condition"]),
+            str(summary["games"]), "{0:.1%}".format(summary["win_rate"]),
+            "{0:.0f}".format(summary["mean_score"]),
+            "{0:.0f}".format(summary["score_quantiles"]["0.5"] or 0),
+            "{0:.0f}".format(summary["score_quantiles"]["0.9"] or 0),
+            "{0:.1f}".format(summary["mean_moves"]), str(top_tile)))
+    widths = [max(len(row[k]) for row in rows + [header])
+              for k in range(len(header))]
+    return "\n".join("  ".join(cell.rjust(width)
+                               for cell, width in zip(row, widths))
+                     for row in [header] + rows)
+
+def main(argv=None):
+    """
+    Runs a sweep from the command line, and prints its comparison table,
+    or its summaries as JSON with --json.
+
+    Args:
+        argv (list of str, optional): Command line arguments, without the
+            program name. Defaults to sys.argv[1:].
+    """
+    parser = argparse.ArgumentParser(
+        usage=USAGE, description="Simulate a grid of game configurations.")
+    parser.add_argument("--size", type=int, nargs="+")
+    parser.add_argument("--initial-value", type=int, nargs="+")
+    parser.add_argument("--initial-tiles", type=int, nargs="+")
+    parser.add_argument("--win-condition", type=int, nargs="+")
+    parser.add_argument("-n", "--games", type=int, default=100,
+                        help="games per configuration (default: 100)")
+    parser.add_argument("-p", "--policy", default="random",
+                        help="policy to play with: one of {0}, or a "
+                        "module:function path (default: random)".format(
+                            ", ".join(sorted(POLICIES))))
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="number of worker processes (default: CPUs)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the first game (default: 0)")
+    parser.add_argument("--chunk", type=int, default=100,
+                        help="games per cached chunk (default: 100)")
+    parser.add_argument("--cache", default=SWEEP_CACHE_DIR,
+                        help="directory of cached results (default: "
+                        "{0})".format(SWEEP_CACHE_DIR))
+    parser.add_argument("--json", action="store_true",
+                        help="print summaries as JSON rather than a table")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    configs = grid(size=args.size, initial_value=args.initial_value,
+                   initial_tiles=args.initial_tiles,
+                   win_condition=args.win_condition)
+    start = time.perf_counter()
+    def report(done, total):
+        print("{0}/{1} chunks, {2:.1f}s".format(
+            done, total, time.perf_counter() - start), file=sys.stderr)
+    results = run_sweep(configs, args.policy, args.games, args.seed,
+                        args.chunk, args.workers, args.cache, report)
+    if args.json:
+        print(json.dumps([dict(config, summary=aggregator.summary())
+                          for config, aggregator in results], indent=2))
+    else:
+        print(comparison_table(results))
@@ -1,3 +1,4 @@
+# Only the terminal interface is imported here: the desktop interface
+# pulls in pyglet, and the curses one needs the curses module, so they
+# are imported from views.gui and views.screen when they are used.
 from views.terminal import TerminalInterface
-from views.pygletgui import PygletGUI
-from views.gui import GUIInterface
@@ -0,0 +1,119 @@
+"""
+Images of the desktop interface, loaded on first use.
+"""
+
+import colorsys
+import math
+import os
+
+import pyglet
+
+# Directory of the image files.
+ASSET_DIR = 'assets'
+
+# Side of a tile image, in pixels, and the anchor of tiles, so that they
+# scale about the middle of their cell.
+TILE_SIZE = 80
+TILE_ANCHOR = 44
+
+# Side of the textures tiles are packed into.
+ATLAS_SIZE = 1024
+
+# Files of the images other than tiles, by name.
+IMAGES = {
+	'board': 'board.jpg',
+	'win': 'youwin.png',
+	'lose': 'youlose.png',
+	'retry': 'retry.png',
+	'load': 'load.png',
+	'save': 'save.png'
+}
+
+# Bitmaps of the digits, three pixels wide and five tall, row by row from
+# the top; used to draw tiles that have no image file.
+DIGITS = {
+	'0': ('111', '101', '101', '101', '111'),
+	'1': ('010', '110', '010', '010', '111'),
+	'2': ('111', '001', '111', '100', '111'),
+	'3': ('111', '001', '111', '001', '111'),
+	'4': ('101', '101', '111', '001', '001'),
+	'5': ('111', '100', '111', '001', '111'),
+	'6': ('111', '100', '111', '101', '111'),
+	'7': ('111', '001', '001', '001', '001'),
+	'8': ('111', '101', '111', '101', '111'),
+	'9': ('111', '101', '111', '001', '111')
+}
+
+class Assets:
+	"""
+	Images of the desktop interface, indexed by name (see IMAGES) or by
+	tile value. Every image is loaded the first time it is asked for.
+
+	Tile images are packed into shared texture atlases rather than a
+	texture each, so the sprites of all tiles on the board are drawn from
+	one texture. Tiles with no image file, i.e. past 59049, are drawn on
+	the fly.
+	"""
+
+	def __init__(self):
+		self.images = {}
+		self.atlas = pyglet.image.atlas.TextureBin(ATLAS_SIZE, ATLAS_SIZE)
+
+	def __getitem__(self, key):
+		image = self.images.get(key)
+		if image is None:
+			if isinstance(key, int):
+				image = self.load_tile(key)
+			else:
+				image = pyglet.image.load(os.path.join(ASSET_DIR, IMAGES[key]))
+			self.images[key] = image
+		return image
+
+	def load_tile(self, value):
+		"""
+		Loads the image of a tile into the atlas.
+		"""
+		path = os.path.join(ASSET_DIR, '{}.png'.format(value))
+		if os.path.exists(path):
+			image = pyglet.image.load(path)
+		else:
+			image = draw_tile(value)
+		region = self.atlas.add(image)
+		region.anchor_x = TILE_ANCHOR
+		region.anchor_y = TILE_ANCHOR
+		return region
+
+	def preload(self, values):
+		"""
+		Loads the images of a number of tiles ahead of their first use.
+		"""
+		for value in values:
+			self[value]
+
+def draw_tile(value):
+	"""
+	Draws the image of a tile: its value in white on a square whose hue
+	depends on the value.
+	"""
+	hue = (math.log(value, 3) * 0.13) % 1
+	background = bytes(int(255 * c) for c in colorsys.hsv_to_rgb(hue, 0.55, 0.8)) + b'\xff'
+	white = b'\xff\xff\xff\xff'
+	rows = [[background] * TILE_SIZE for _ in range(TILE_SIZE)]
+
+	# Digits are scaled up as much as fits, with a pixel between them.
+	text = str(value)
+	scale = max(1, min(6, (TILE_SIZE - 16) // (4 * len(text))))
+	width = (4 * len(text) - 1) * scale
+	left = (TILE_SIZE - width) // 2
+	top = (TILE_SIZE - 5 * scale) // 2
+	for k, digit in enumerate(text):
+		for y, bits in enumerate(DIGITS[digit]):
+			for x, bit in enumerate(bits):
+				if bit == '1':
+					for dy in range(scale):
+						for dx in range(scale):
+							rows[top + y * scale + dy][left + (4 * k + x) * scale + dx] = white
+
+	# Image rows go from the bottom up.
+	data = b''.join(b''.join(row) for row in reversed(rows))
+	return pyglet.image.ImageData(TILE_SIZE, TILE_SIZE, 'RGBA', data)
@@ -7,6 +7,45 @@ Abstract base class for all Interfaces.
 
 from engine import ViewEvents
 
+# Number of moves that can be undone in a game played on an interface.
+UNDO_LIMIT = 100
+
+def changed_cells(old, new):
+    """
+    Returns the cells whose values differ between two boards of values.
+    Rows are compared whole first, so only changed rows are walked.
+    """
+    return [(i, j) for i, (old_row, new_row) in enumerate(zip(old, new))
+            if old_row != new_row
+            for j, (a, b) in enumerate(zip(old_row, new_row)) if a != b]
+
+def moved_cells(old, new, report, direction, spawn):
+    """
+    Returns the cells whose values differ between two boards of values,
+    the one before a move and the one after it, using the report of the
+    move: only the lines it lists as changed are compared, and the cell
+    of the tile that spawned after it is added.
+
+    Args:
+        old (list): Board before the move, as in Game.peek_board().
+        new (list): Board after the move.
+        report (dict): Report of the move; see Board.move_all.
+        direction (str): Direction of the move.
+        spawn (tuple): The (i, j, value) of the tile that spawned after
+            the move, or None; see Game.last_spawn.
+    """
+    by_column = direction in ("up", "down")
+    lines = report["changed_lines"]
+    cells = []
+    for k in lines:
+        for m in range(len(new)):
+            i, j = (m, k) if by_column else (k, m)
+            if old[i][j] != new[i][j]:
+                cells.append((i, j))
+    if spawn is not None and spawn[1 if by_column else 0] not in lines:
+        cells.append((spawn[0], spawn[1]))
+    return cells
+
 class Interface:
     """A view for the three-four-three game engine.
     """
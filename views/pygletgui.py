@@ -1,33 +1,71 @@
-import os
-
-import json
-
 import pyglet
 from pyglet.window import key, mouse
 
+from .assets import Assets
+from .interface import UNDO_LIMIT, changed_cells, moved_cells
+
+# Seconds between changed tiles shrinking away and new tiles growing in.
+ANIMATION_DELAY = 0.04
+
+# Change in the scale of an animated tile per second.
+ANIMATION_SPEED = 10
+
+class SpritePool:
+	"""
+	Sprites of a batch that are reused rather than made anew: released
+	sprites are hidden, then handed out again by acquire().
+	"""
+
+	def __init__(self, batch):
+		self.batch = batch
+		self.free = []
+
+	def acquire(self, image, x, y):
+		"""
+		Returns a visible sprite of an image at (x, y).
+		"""
+		if not self.free:
+			return pyglet.sprite.Sprite(image, x = x, y = y, batch = self.batch)
+		sprite = self.free.pop()
+		sprite.image = image
+		sprite.update(x = x, y = y, scale = 1)
+		sprite.visible = True
+		return sprite
+
+	def release(self, sprite):
+		"""
+		Hides a sprite until it is acquired again.
+		"""
+		sprite.visible = False
+		self.free.append(sprite)
+
 class PygletGUI(pyglet.window.Window):
 
 	def __init__(self, init_class):
 		super().__init__(width = 1024, height = 768, resizable = False)
 		self.init_class = init_class
 		self.init_class.view_events.create(size=6, initial_value=3,
-                                    initial_tiles=8, win_condition=10)
+                                    initial_tiles=8, win_condition=10,
+                                    undo_limit=UNDO_LIMIT)
 
 		# Variables
 		self.wait_input = True
 		self.game_state = self.init_class.controller.game_state()
-		self.board_status = self.init_class.current_game.peek_board()
-		self.board_status_old = [[None for _ in range(6)] for _ in range(6)]
+		size = self.init_class.current_game.size
+		# Values of the tiles shown, which lag behind the game until they
+		# are animated in.
+		self.board_status = [[None for _ in range(size)] for _ in range(size)]
 		self.sfx = pyglet.resource.media('merged.wav', streaming = False)
 
 		# Graphics
-		self.assets = self.load_assets()
-		self.sprites = [[None for _ in range(6)] for _ in range(6)]
+		self.assets = Assets()
+		self.sprites = [[None for _ in range(size)] for _ in range(size)]
 		self.board = pyglet.sprite.Sprite(self.assets['board'])
 		self.game_over_screen = None
 		self.score = self.init_class.current_game.score
 		self.batch = pyglet.graphics.Batch()
 		self.game_over_batch = pyglet.graphics.Batch()
+		self.pool = SpritePool(self.batch)
 
 		# UI
 		self.score_text = pyglet.text.Label('{}'.format(self.score),
@@ -43,148 +81,143 @@ class PygletGUI(pyglet.window.Window):
 											color = (0, 0, 0, 255), batch = self.batch)
 
 		# Animation Purposes
-		self.anim_done = [False for _ in range(5)]
-		self.animate_tiles_destroy = []
-		self.animate_tiles_create = []
-		self.animation_start = True
+		self.animation = None
 
-		# Init run
+	def press_action(self):
+		"""
+		Runs when a key is pressed.
+		"""
+		self.init_class.view_events.move(self.direction)
+		self.start_animation(self.init_class.current_game.last_report, self.direction)
 
-	def load_img(self, file, format = 'png', anchor_x = 0, anchor_y = 0):
+	def history_action(self, event):
 		"""
-		Loads a single image.
+		Runs when the undo or redo key is pressed.
 		"""
-		img = pyglet.image.load('assets/{}.{}'.format(file, format))
-		img.anchor_x = anchor_x
-		img.anchor_y = anchor_y
-		return img
+		event()
+		self.game_over_screen = None
+		self.start_animation()
 
-	def load_assets(self):
+	def start_animation(self, report = None, direction = None):
 		"""
-		Loads all images required by the game.
+		Starts animating the cells that changed since the board was last
+		shown. Given the report of a move and its direction, only the
+		lines the move changed and the spawned tile are looked at, and
+		nothing at all if the move changed nothing. Undo and redo come
+		with no report, so the whole board is compared with the one
+		shown. The animation is only scheduled on the clock while it
+		runs, so the window idles in between.
 		"""
-		assets = {
-			'board': self.load_img('board', format = 'jpg'),
-			3: self.load_img('3', anchor_x = 44, anchor_y = 44),
-			9: self.load_img('9', anchor_x = 44, anchor_y = 44),
-			27: self.load_img('27', anchor_x = 44, anchor_y = 44),
-			81: self.load_img('81', anchor_x = 44, anchor_y = 44),
-			243: self.load_img('243', anchor_x = 44, anchor_y = 44),
-			729: self.load_img('729', anchor_x = 44, anchor_y = 44),
-			2187: self.load_img('2187', anchor_x = 44, anchor_y = 44),
-			6561: self.load_img('6561', anchor_x = 44, anchor_y = 44),
-			19683: self.load_img('19683', anchor_x = 44, anchor_y = 44),
-			59049: self.load_img('59049', anchor_x = 44, anchor_y = 44),
-			'win': self.load_img('youwin'),
-			'lose': self.load_img('youlose'),
-			'retry': self.load_img('retry'),
-			'load': self.load_img('load'),
-			'save': self.load_img('save'),
-		}
-		return assets
+		game = self.init_class.current_game
+		self.score = game.score
+		self.score_text.text = '{}'.format(self.score)
+		if self.animation is not None:
+			self.finish_animation()
+		if report is not None and not report['moves_made'] and not report['merged_tiles']:
+			self.wait_input = False
+			return
 
-	def press_action(self):
+		board_status = game.peek_board()
+		if report is None:
+			cells = changed_cells(self.board_status, board_status)
+		else:
+			cells = moved_cells(self.board_status, board_status, report,
+								direction, game.last_spawn)
+		self.board_status = board_status
+		if not cells:
+			self.wait_input = False
+			return
+		self.animation = {'phase': 'destroy', 'time': 0, 'cells': cells}
+		pyglet.clock.schedule_interval(self.animate, 1 / 60)
+
+	def finish_animation(self):
 		"""
-		Runs when a key is pressed.
+		Stops the animation, showing every animated cell as it ends up.
 		"""
-		self.board_status_old = self.init_class.current_game.peek_board()
-		self.init_class.view_events.move(self.direction)
-		self.animation_start = True
+		pyglet.clock.unschedule(self.animate)
+		for i, j in self.animation['cells']:
+			if self.sprites[i][j] is not None:
+				self.pool.release(self.sprites[i][j])
+				self.sprites[i][j] = None
+			if self.board_status[i][j] is not None:
+				self.sprites[i][j] = self.cell_sprite(i, j)
+		self.animation = None
+		self.wait_input = False
+
+	def cell_sprite(self, i, j):
+		"""
+		Returns a sprite from the pool for the tile shown at (i, j).
+		"""
+		return self.pool.acquire(self.assets[self.board_status[i][j]],
+								 x = 253 + (88 * j) + 44,
+								 y = 768 - (287 + (88 * i)) + 44)
 
 	def animate(self, dt):
 		"""
-		Animates all changes to the board.
+		Advances the animation: tiles of changed cells shrink away, then
+		after a short delay, the new tiles grow in.
 		"""
-		if self.animation_start:
-			## Part 0: Setup
-			if not any(self.anim_done):
-				self.board_status = self.init_class.current_game.peek_board()
-				self.score = self.init_class.current_game.score
-				self.score_text.text = '{}'.format(self.score)
-
-				for i in range(6):
-					for j in range(6):
-						if self.board_status[i][j] != self.board_status_old[i][j] and self.board_status_old[i][j] is not None:
-							self.animate_tiles_destroy.append((i, j))
-						if self.board_status[i][j] != self.board_status_old[i][j] and self.board_status[i][j] is not None:
-							self.animate_tiles_create.append((i, j))
-
-				self.anim_done[0] = True
-
-			## Part 1: Destroying Tile Sprites
-			elif all(self.anim_done[0:1]) and not any(self.anim_done[1:]):
-				for vector in self.animate_tiles_destroy:
-					if self.sprites[vector[0]][vector[1]].scale > 0:
-						self.sprites[vector[0]][vector[1]].scale -= dt * 10
-					else:
-						self.sprites[vector[0]][vector[1]] = None
-						self.anim_done[1] = True
-
-				if len(self.animate_tiles_destroy) == 0:
-					self.anim_done[1] = True
-
-			## Part 2: 0.04 Seconds Delay
-			elif all(self.anim_done[0:2]) and not any(self.anim_done[2:]):
-				def trig(dt):
-					self.anim_done[2] = True
-				pyglet.clock.schedule_once(trig, 0.04)
-
-			## Part 3: Creating Tile Sprites
-			elif all(self.anim_done[0:3]) and not any(self.anim_done[3:]):
+		animation = self.animation
+		animation['time'] += dt
+		cells = animation['cells']
+
+		## Part 1: Shrinking Tile Sprites
+		if animation['phase'] == 'destroy':
+			done = True
+			for i, j in cells:
+				sprite = self.sprites[i][j]
+				if sprite is not None:
+					sprite.scale = max(0, sprite.scale - dt * ANIMATION_SPEED)
+					done = done and sprite.scale == 0
+			if done:
+				for i, j in cells:
+					if self.sprites[i][j] is not None:
+						self.pool.release(self.sprites[i][j])
+						self.sprites[i][j] = None
+				animation['phase'] = 'delay'
+				animation['time'] = 0
+
+		## Part 2: Delay, then Creating Tile Sprites
+		elif animation['phase'] == 'delay':
+			if animation['time'] >= ANIMATION_DELAY:
 				tiles_created = False
-				for vector in self.animate_tiles_create:
-					if self.sprites[vector[0]][vector[1]] == None and self.board_status[vector[0]][vector[1]] is not None:
-						self.sprites[vector[0]][vector[1]] = pyglet.sprite.Sprite(self.assets[self.board_status[vector[0]][vector[1]]],
-																				  x = 253 + (88 * vector[1]) + 44,
-																				  y = 768 - (287 + (88 * vector[0])) + 44,
-																				  batch = self.batch
-																				 )
-						self.sprites[vector[0]][vector[1]].scale = 0
+				for i, j in cells:
+					if self.board_status[i][j] is not None:
+						self.sprites[i][j] = self.cell_sprite(i, j)
+						self.sprites[i][j].scale = 0
 						tiles_created = True
 				if tiles_created:
 					self.sfx.play()
-				self.anim_done[3] = True
-
-			## Part 4: Animating Created Tile Sprites
-			elif all(self.anim_done[0:4]) and not any(self.anim_done[4:]):
-				for vector in self.animate_tiles_create:
-					if self.sprites[vector[0]][vector[1]].scale < 1:
-						self.sprites[vector[0]][vector[1]].scale += dt * 10
-					else:
-						self.sprites[vector[0]][vector[1]].scale = 1
-						self.anim_done[4] = True
-
-				if len(self.animate_tiles_create) == 0:
-					self.anim_done[4] = True
-
-			## Part 5: Final Modifications
-			elif all(self.anim_done):
-				self.animate_tiles_create = []
-				self.animate_tiles_destroy = []
-				self.anim_done = [False for _ in range(5)]
-				self.animation_start = False
-				self.wait_input = False
+				animation['phase'] = 'create'
+
+		## Part 3: Growing Created Tile Sprites
+		else:
+			done = True
+			for i, j in cells:
+				sprite = self.sprites[i][j]
+				if sprite is not None:
+					sprite.scale = min(1, sprite.scale + dt * ANIMATION_SPEED)
+					done = done and sprite.scale == 1
+			if done:
+				self.finish_animation()
 
 	def retry(self):
 		"""
 		Run when the retry button is clicked.
 		"""
-		self.board_status_old = self.init_class.current_game.peek_board()
 		self.init_class.view_events.create(size = 6, initial_value = 3,
-								initial_tiles = 8, win_condition = 10)
+								initial_tiles = 8, win_condition = 10,
+								undo_limit = UNDO_LIMIT)
 		self.game_over_screen = None
 		self.game_state = self.init_class.controller.game_state()
-		self.board_status = self.init_class.current_game.peek_board()
-		self.score = self.init_class.current_game.score
-		self.animation_start = True
+		self.start_animation()
 
 	def save(self):
 		"""
 		Run when the save button is clicked.
 		"""
 		self.message.text = 'Saving...'
-		with open('save.json', 'w') as outfile:
-			json.dump(self.init_class.controller.game_state(), outfile)
+		self.init_class.controller.save_game()
 		self.message.text = 'Saved.'
 		self.wait_input = False
 
@@ -192,18 +225,13 @@ class PygletGUI(pyglet.window.Window):
 		"""
 		Run when the load button is clicked.
 		"""
-		if os.path.exists('save.json'):
-			self.board_status_old = self.init_class.current_game.peek_board()
+		if self.init_class.controller.has_save():
 			self.message.text = "Loading..."
-			with open('save.json') as infile:
-				self.game_state = json.load(infile)
-			self.init_class.view_events.create(size = 6, initial_value = 3,
-                                    initial_tiles = 1, win_condition = 10,
-                                    game_state= self.game_state)
+			self.init_class.controller.load_game(undo_limit = UNDO_LIMIT)
+			self.game_state = self.init_class.controller.game_state()
 			self.message.text = "Loaded."
-			self.board_status = self.init_class.current_game.peek_board()
-			self.score = self.init_class.current_game.score
-			self.animation_start = True
+			self.game_over_screen = None
+			self.start_animation()
 		else:
 			self.wait_input = False
 			self.message.text = "No save file."
@@ -214,10 +242,9 @@ class PygletGUI(pyglet.window.Window):
 		Runs when the game has been won.
 		"""
 		self.wait_input = True
-		self.game_over_screen = pyglet.sprite.Sprite(self.assets['won'], x = 245, y = 768 - 735, batch = self.game_over_batch)
+		self.game_over_screen = pyglet.sprite.Sprite(self.assets['win'], x = 245, y = 768 - 735, batch = self.game_over_batch)
 		self.game_over_screen.opacity = 255 * (85 / 100)
-		if os.path.exists('save.json'):
-			os.remove('save.json')
+		self.init_class.controller.delete_save()
 
 	def on_lost(self):
 		"""
@@ -226,8 +253,7 @@ class PygletGUI(pyglet.window.Window):
 		self.wait_input = True
 		self.game_over_screen = pyglet.sprite.Sprite(self.assets['lose'],x = 245, y = 768 - 735, batch = self.game_over_batch)
 		self.game_over_screen.opacity = 255 * (85 / 100)
-		if os.path.exists('save.json'):
-			os.remove('save.json')
+		self.init_class.controller.delete_save()
 
 	def on_mouse_press(self, x, y, button, modifiers):
 		if button == mouse.LEFT:
@@ -259,10 +285,16 @@ class PygletGUI(pyglet.window.Window):
 		directions = {key.UP: 'up', key.DOWN: 'down',
 					  key.RIGHT: 'right', key.LEFT: 'left'
 		}
-		if symbol in directions and not self.wait_input:
+		history = {key.U: self.init_class.view_events.undo,
+				   key.R: self.init_class.view_events.redo
+		}
+		if symbol in directions and not self.wait_input and self.game_over_screen is None:
 			self.direction = directions[symbol]
 			self.wait_input = True
 			self.press_action()
+		elif symbol in history and not self.wait_input:
+			self.wait_input = True
+			self.history_action(history[symbol])
 
 	def on_draw(self):
 		self.clear()
@@ -271,6 +303,13 @@ class PygletGUI(pyglet.window.Window):
 		self.batch.draw()
 		self.game_over_batch.draw()
 
+	def preload_assets(self, dt):
+		"""
+		Loads the images of the most common tiles, once the window is up.
+		"""
+		self.assets.preload([3, 9, 27, 81, 243, 729])
+
 	def run(self):
-		pyglet.clock.schedule_interval(self.animate, 1 / 60)
+		pyglet.clock.schedule_once(self.preload_assets, 0.5)
+		self.start_animation()
 		pyglet.app.run()
@@ -0,0 +1,176 @@
+"""
+A full-screen terminal interface, drawn with curses.
+"""
+
+import curses
+
+from .interface import UNDO_LIMIT, Interface, changed_cells
+
+# Least width of a cell, in characters; cells grow to fit wider tiles.
+CELL_WIDTH = 4
+
+# Lines above and below the board: the score, and the message and help.
+HEADER_LINES = 2
+FOOTER_LINES = 3
+
+# Value of cells that have not been drawn yet, unlike any tile.
+UNDRAWN = object()
+
+KEYS = {
+    curses.KEY_UP: "up",
+    curses.KEY_DOWN: "down",
+    curses.KEY_LEFT: "left",
+    curses.KEY_RIGHT: "right",
+    ord("u"): "undo",
+    ord("r"): "redo",
+    ord("s"): "save",
+    ord("q"): "exit"
+}
+
+HELP = "Arrow keys: move   u: undo   r: redo   s: save and exit   q: exit"
+
+class ScreenInterface(Interface):
+    """
+    A terminal interface that keeps the board on screen and reads keys as
+    they are pressed.
+
+    After every move, only the cells that changed are drawn again, and
+    curses sends only the characters that changed to the terminal, so the
+    output of a move stays small however big the board is. Cells are as
+    wide as the widest tile shown; the board is drawn anew when a wider
+    tile appears, or when the terminal is resized. Tiles are drawn in
+    plain text, as switching attributes costs more output than the tiles
+    themselves.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.interface_end = True
+        self.screen = None
+        self.shown = None
+        self.cell_width = CELL_WIDTH
+        self.message = ""
+
+    def introduce(self):
+        if self.controller.has_save():
+            self.message = "Loaded a saved game."
+            self.controller.load_game(undo_limit=UNDO_LIMIT)
+        else:
+            self.message = "Welcome to three-four-three!"
+            self.view_events.create(size=6, initial_value=3,
+                                    initial_tiles=1, win_condition=10,
+                                    undo_limit=UNDO_LIMIT)
+
+    def ask_input(self):
+        while True:
+            key = self.screen.getch()
+            action = KEYS.get(key)
+            if action is not None:
+                break
+            if key == curses.KEY_RESIZE:
+                self.shown = None
+            self.draw_board()
+        self.message = ""
+        if action == "exit":
+            self.view_events.end()
+            self.interface_end = True
+        elif action == "save":
+            self.controller.save_game()
+            self.view_events.end()
+            self.interface_end = True
+        elif action == "undo":
+            self.view_events.undo()
+        elif action == "redo":
+            self.view_events.redo()
+        else:
+            self.view_events.move(action)
+
+    def draw_board(self):
+        """
+        Draws the cells of the board that changed since it was last drawn,
+        the score, and the message.
+        """
+        board = self.current_game.peek_board()
+        size = len(board)
+        if self.shown is None or len(self.shown) != size:
+            self.screen.erase()
+            self.shown = [[UNDRAWN] * size for _ in range(size)]
+        cells = changed_cells(self.shown, board)
+
+        width = max([self.cell_width] + [len(str(board[i][j]))
+                                         for i, j in cells
+                                         if board[i][j] is not None])
+        if width > self.cell_width:
+            self.cell_width = width
+            self.shown = None
+            return self.draw_board()
+
+        lines, columns = self.screen.getmaxyx()
+        if HEADER_LINES + size + FOOTER_LINES > lines or \
+                size * (self.cell_width + 1) > columns:
+            self.screen.erase()
+            self.screen.addstr(0, 0, "Make the terminal bigger."[:columns - 1])
+            self.screen.refresh()
+            self.shown = None
+            return
+
+        for i, j in cells:
+            value = board[i][j]
+            self.screen.addstr(
+                HEADER_LINES + i, j * (self.cell_width + 1),
+                ("." if value is None else str(value)).rjust(self.cell_width))
+        self.shown = board
+
+        self.screen.addstr(0, 0, "Score: {0}".format(self.current_game.score))
+        self.screen.clrtoeol()
+        self.screen.addstr(HEADER_LINES + size + 1, 0,
+                           self.message[:columns - 1])
+        self.screen.clrtoeol()
+        self.screen.addstr(HEADER_LINES + size + 2, 0, HELP[:columns - 1])
+        self.screen.refresh()
+
+    def ask_yes_no(self, question):
+        """
+        Shows a question, and returns True if it is answered with y.
+        """
+        self.message = question + " (y/n)"
+        while True:
+            self.draw_board()
+            answer = self.screen.getch()
+            if answer in (ord("y"), ord("Y"), ord("n"), ord("N")):
+                self.message = ""
+                return answer in (ord("y"), ord("Y"))
+
+    def on_lost(self):
+        self.message = "You lost :( Press any key to exit."
+        self.draw_board()
+        self.screen.getch()
+        self.controller.delete_save()
+        self.interface_end = True
+
+    def on_won(self):
+        if self.ask_yes_no("You won! Want to keep playing?"):
+            self.view_events.keep_playing()
+        else:
+            self.view_events.end()
+            self.interface_end = True
+            self.controller.delete_save()
+
+    def run(self):
+        curses.wrapper(self.run_screen)
+
+    def run_screen(self, screen):
+        """
+        Runs the interface on a curses screen; see curses.wrapper().
+        """
+        self.screen = screen
+        try:
+            curses.curs_set(0)
+        except curses.error:
+            pass
+        self.initialize_event_handlers()
+        self.introduce()
+        self.interface_end = False
+        while not self.interface_end:
+            self.draw_board()
+            self.ask_input()
@@ -5,10 +5,7 @@ A basic terminal interface.
 :Version:    v20181104
 """
 
-from .interface import Interface
-
-import os
-import json
+from .interface import UNDO_LIMIT, Interface
 
 class TerminalInterface(Interface):
 
@@ -19,43 +16,40 @@ class TerminalInterface(Interface):
     def introduce(self):
         print("Welcome to the three-four-three terminal interface!")
         print()
-        if os.path.exists("save.json"):
+        if self.controller.has_save():
             print("Loading from a saved game...")
-            with open("save.json") as infile:
-                game_state = json.load(infile)
-            self.view_events.create(size=6, initial_value=3,
-                                    initial_tiles=1, win_condition=10,
-                                    game_state=game_state)
+            self.controller.load_game(undo_limit=UNDO_LIMIT)
         else:
             self.view_events.create(size=6, initial_value=3,
-                                    initial_tiles=1, win_condition=10)
+                                    initial_tiles=1, win_condition=10,
+                                    undo_limit=UNDO_LIMIT)
 
     def ask_input(self):
         while True:
-            direction = input("Input a direction ('exit'/'save') > ")
-            if direction.lower() in ['save', 'exit', 'left', 'right', 'up', 'down']:
+            direction = input("Input a direction ('undo'/'redo'/'exit'/'save') > ")
+            if direction.lower() in ['save', 'exit', 'undo', 'redo', 'left', 'right', 'up', 'down']:
                 break
         if direction == 'exit':
             self.view_events.end()
             self.interface_end = True
         elif direction == 'save':
-            game_state = self.controller.game_state()
-            with open("save.json", "w") as outfile:
-                json.dump(game_state, outfile)
+            self.controller.save_game()
             self.view_events.end()
             self.interface_end = True
+        elif direction == 'undo':
+            self.view_events.undo()
+        elif direction == 'redo':
+            self.view_events.redo()
         else:
             self.view_events.move(direction.lower())
 
     def print_board(self):
         print("Score:", self.current_game.score)
         print(self.current_game.board)
-        print(self.controller.game_state())
 
     def on_lost(self):
         print("You lost :(")
-        if os.path.exists("save.json"):
-            os.remove("save.json")
+        self.controller.delete_save()
         self.interface_end = True
 
     def on_won(self):
@@ -66,8 +60,7 @@ class TerminalInterface(Interface):
         else:
             self.view_events.end()
             self.interface_end = True
-            if os.path.exists("save.json"):
-                os.remove("save.json")
+            self.controller.delete_save()
 
     def run(self):
         self.initialize_event_handlers()